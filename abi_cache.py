@@ -0,0 +1,136 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+On-disk cache of parsed ABI files keyed by the file content hash.
+
+skale.py re-reads and re-parses the ABI file when the client is created
+and again for every contract a command touches. install() makes it use
+load_abi, which parses each file at most once per process and reuses the
+validated result between runs while the file content stays the same.
+The cache is plain JSON, so a tampered cache file can't execute code.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+
+from config import ABI_CACHE_DIR
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_FORMAT_VERSION = 2
+SKALE_MODULES_WITH_GET_ABI = (
+    'skale.skale_base',
+    'skale.skale_manager',
+    'skale.skale_ima',
+    'skale.skale_allocator'
+)
+ADDRESS_RE = re.compile(r'^0x[0-9a-fA-F]{40}$')
+
+_loaded = {}
+
+
+class InvalidAbiFileError(Exception):
+    pass
+
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as abi_file:
+        for block in iter(lambda: abi_file.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def cache_path(content_hash, cache_dir=ABI_CACHE_DIR):
+    return os.path.join(cache_dir, f'abi-{CACHE_FORMAT_VERSION}-{content_hash}.json')
+
+
+def validate_abi(abi):
+    """ Checks that every *_address is an address and every *_abi is a list """
+    if not isinstance(abi, dict):
+        raise InvalidAbiFileError('ABI file should contain an object')
+    for key, value in abi.items():
+        if key.endswith('_address') and isinstance(value, str) and \
+                not ADDRESS_RE.match(value):
+            raise InvalidAbiFileError(f'{key} is not a valid address: {value}')
+        if key.endswith('_abi') and not isinstance(value, list):
+            raise InvalidAbiFileError(f'{key} should be a list')
+
+
+def parse_abi_file(path):
+    with open(path) as abi_file:
+        abi = json.load(abi_file)
+    validate_abi(abi)
+    return abi
+
+
+def _write_cache(path, abi):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as cache_file:
+        json.dump(abi, cache_file, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_abi(abi_filepath, cache_dir=ABI_CACHE_DIR):
+    """ Returns parsed and validated ABI, using in-process and on-disk caches """
+    stat = os.stat(abi_filepath)
+    memo_key = (os.path.realpath(abi_filepath), stat.st_mtime_ns, stat.st_size)
+    if memo_key in _loaded:
+        return _loaded[memo_key]
+
+    abi = None
+    path = None
+    if cache_dir:
+        path = cache_path(file_hash(abi_filepath), cache_dir)
+        if os.path.isfile(path):
+            try:
+                with open(path) as cache_file:
+                    abi = json.load(cache_file)
+            except (OSError, ValueError) as err:
+                logger.warning(f'Ignoring broken ABI cache {path}: {err}')
+    if abi is None:
+        abi = parse_abi_file(abi_filepath)
+        if path:
+            try:
+                _write_cache(path, abi)
+            except OSError as err:
+                logger.warning(f'Failed to save ABI cache {path}: {err}')
+    _loaded[memo_key] = abi
+    return abi
+
+
+def _cached_get_abi(abi_filepath=None):
+    return load_abi(abi_filepath)
+
+
+def install():
+    """ Makes skale.py read ABI files through load_abi """
+    import importlib
+    for module_name in SKALE_MODULES_WITH_GET_ABI:
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        if hasattr(module, 'get_abi'):
+            module.get_abi = _cached_get_abi
@@ -0,0 +1,207 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+""" Helpers for batched JSON-RPC requests and contract reads """
+
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import rpc_hedge
+import rpc_pool
+import rpc_profile
+import rpc_trace
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_WORKERS = 4
+BATCH_REQUEST_TIMEOUT = 60
+
+
+class BatchRPCError(Exception):
+    pass
+
+
+def block_tag(block_number=None):
+    if block_number is None:
+        return 'latest'
+    return hex(block_number)
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def make_request(method, params, request_id):
+    return {'jsonrpc': '2.0', 'method': method, 'params': params, 'id': request_id}
+
+
+def post_batch(endpoint, payload, session=None):
+    """ Sends a list of JSON-RPC requests and returns the raw responses """
+    import requests
+    post = session.post if session else requests.post
+
+    def send(payload, url=endpoint):
+        start = time.perf_counter()
+        response = post(url, json=payload, timeout=BATCH_REQUEST_TIMEOUT)
+        profiler = rpc_profile.get_profiler()
+        if profiler:
+            elapsed = time.perf_counter() - start
+            profiler.record_request('batch', elapsed, len(json.dumps(payload)),
+                                    len(response.content))
+            # every call in a batch gets an equal share of its latency
+            for request in payload:
+                profiler.record_call(request['method'], elapsed / len(payload),
+                                     request['params'],
+                                     error=not response.ok)
+        response.raise_for_status()
+        return response.json()
+
+    def send_pooled(payload):
+        pool = rpc_pool.get_pool()
+        primary = rpc_pool.is_primary_request(payload)
+        if pool is None or not pool.serves(endpoint):
+            if primary:
+                return send(payload)
+            return rpc_hedge.call(lambda _: send(payload), key=rpc_hedge.request_key(payload))
+        if primary:
+            return pool.call(lambda url: send(payload, url), primary_only=True)
+        return rpc_hedge.pool_call(pool, lambda url: send(payload, url),
+                                   retryable=rpc_pool.has_lagging_error,
+                                   key=rpc_hedge.request_key(payload))
+
+    return rpc_trace.post(send_pooled, payload)
+
+
+def _send_chunk(endpoint, calls, session=None):
+    payload = [
+        make_request(method, params, request_id)
+        for request_id, (method, params) in enumerate(calls)
+    ]
+    responses = post_batch(endpoint, payload, session=session)
+    if not isinstance(responses, list):
+        raise BatchRPCError(f'Batch request failed: {responses}')
+    by_id = {res['id']: res for res in responses}
+    results = []
+    for request_id in range(len(calls)):
+        res = by_id.get(request_id)
+        if res is None:
+            raise BatchRPCError(f'No response for request {calls[request_id]}')
+        if 'error' in res:
+            raise BatchRPCError(f'{calls[request_id][0]} failed: {res["error"]}')
+        results.append(res['result'])
+    return results
+
+
+def batch_request(endpoint, calls, batch_size=DEFAULT_BATCH_SIZE,
+                  workers=DEFAULT_WORKERS):
+    """
+    Executes (method, params) calls using JSON-RPC batches.
+    Results are returned in the same order as calls.
+    """
+    import requests
+
+    calls = list(calls)
+    if not calls:
+        return []
+    batches = list(chunks(calls, batch_size))
+    logger.debug(f'Sending {len(calls)} calls in {len(batches)} batches')
+    with requests.Session() as session:
+        if len(batches) == 1 or workers <= 1:
+            parts = [_send_chunk(endpoint, batch, session) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                parts = list(executor.map(
+                    lambda batch: _send_chunk(endpoint, batch, session),
+                    batches
+                ))
+    return [result for part in parts for result in part]
+
+
+def get_block_number(endpoint):
+    result, = batch_request(endpoint, [('eth_blockNumber', [])])
+    return int(result, 16)
+
+
+def find_function_abi(contract, fn_name, args):
+    for item in contract.abi:
+        if item.get('type') == 'function' and item['name'] == fn_name and \
+                len(item['inputs']) == len(args):
+            return item
+    raise ValueError(f'Function {fn_name} with {len(args)} args not found in ABI')
+
+
+def encode_call(contract, fn_name, args, block_number=None):
+    data = contract.encodeABI(fn_name=fn_name, args=list(args))
+    return 'eth_call', [{'to': contract.address, 'data': data}, block_tag(block_number)]
+
+
+def decode_result(web3, fn_abi, raw):
+    from hexbytes import HexBytes
+    from web3._utils.abi import get_abi_output_types, map_abi_data
+    from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+
+    output_types = get_abi_output_types(fn_abi)
+    values = map_abi_data(
+        BASE_RETURN_NORMALIZERS,
+        output_types,
+        web3.codec.decode_abi(output_types, HexBytes(raw))
+    )
+    if len(values) == 1:
+        return values[0]
+    return list(values)
+
+
+def batch_contract_calls(endpoint, web3, calls, block_number=None,
+                         batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS):
+    """
+    Executes read-only contract calls using JSON-RPC batches.
+    calls is a list of (contract, function_name, args) tuples,
+    all calls are pinned to block_number (latest by default).
+    """
+    calls = list(calls)
+    fn_abis = [find_function_abi(contract, fn_name, args)
+               for contract, fn_name, args in calls]
+    raw_results = batch_request(
+        endpoint,
+        [encode_call(contract, fn_name, args, block_number)
+         for contract, fn_name, args in calls],
+        batch_size=batch_size,
+        workers=workers
+    )
+    return [
+        decode_result(web3, fn_abi, raw)
+        for fn_abi, raw in zip(fn_abis, raw_results)
+    ]
+
+
+def batch_balances(endpoint, addresses, block_number=None,
+                   batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS):
+    """ Returns ETH balances in wei for given addresses """
+    results = batch_request(
+        endpoint,
+        [('eth_getBalance', [address, block_tag(block_number)])
+         for address in addresses],
+        batch_size=batch_size,
+        workers=workers
+    )
+    return [int(result, 16) for result in results]
@@ -0,0 +1,119 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+""" Compares current, cold-cache and warm-cache ABI loading and Skale construction """
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import click
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+os.environ.setdefault('ENDPOINT', 'http://localhost:8545')
+
+import abi_cache  # noqa
+from config import ABI_FILEPATH, ENDPOINT  # noqa
+
+# Contracts that skale.py creates without RPC calls (not upgradeable)
+DEFAULT_CONTRACTS = 'token,delegation_controller,validator_service,token_state,distributor'
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def current_loads(abi_filepath, loads):
+    """ skale.py parses the file once per get_abi call """
+    for _ in range(loads):
+        with open(abi_filepath) as abi_file:
+            json.load(abi_file)
+
+
+def cold_load(abi_filepath):
+    cache_dir = tempfile.mkdtemp()
+    try:
+        abi_cache._loaded.clear()
+        abi_cache.load_abi(abi_filepath, cache_dir=cache_dir)
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def warm_load(abi_filepath, cache_dir):
+    abi_cache._loaded.clear()
+    abi_cache.load_abi(abi_filepath, cache_dir=cache_dir)
+
+
+def construct_skale(endpoint, abi_filepath, contracts):
+    from skale import Skale
+    skale = Skale(endpoint, abi_filepath)
+    for name in contracts:
+        getattr(skale, name)
+
+
+@click.command()
+@click.option('--abi-filepath', default=ABI_FILEPATH, type=click.Path(exists=True))
+@click.option('--endpoint', default=ENDPOINT,
+              help='Endpoint for Skale construction (no requests are sent)')
+@click.option('--contracts', default=DEFAULT_CONTRACTS,
+              help='Comma separated contracts to touch after construction')
+@click.option('--repeat', default=5, help='Runs per case, best time is reported')
+@click.option('--skip-skale', is_flag=True, default=False,
+              help='Benchmark only ABI loading without skale.py')
+def main(abi_filepath, endpoint, contracts, repeat, skip_skale):
+    """ Benchmarks ABI loading with and without abi_cache """
+    contracts = [name for name in contracts.split(',') if name]
+    # init_contract_manager + set_contracts_info + one load per touched contract
+    loads = 2 + len(contracts)
+    size_mb = os.path.getsize(abi_filepath) / 2 ** 20
+    print(f'ABI file: {abi_filepath} ({size_mb:.2f} MB), contracts: {len(contracts)}')
+
+    warm_dir = tempfile.mkdtemp()
+    try:
+        abi_cache.load_abi(abi_filepath, cache_dir=warm_dir)
+        results = [
+            ('json.load x1', best_of(lambda: current_loads(abi_filepath, 1), repeat)),
+            (f'current (json.load x{loads})',
+             best_of(lambda: current_loads(abi_filepath, loads), repeat)),
+            ('abi_cache cold', best_of(lambda: cold_load(abi_filepath), repeat)),
+            ('abi_cache warm', best_of(lambda: warm_load(abi_filepath, warm_dir), repeat))
+        ]
+        if not skip_skale:
+            results.append(('Skale() current', best_of(
+                lambda: construct_skale(endpoint, abi_filepath, contracts), repeat)))
+            abi_cache.install()
+            results.append(('Skale() with abi_cache', best_of(
+                lambda: construct_skale(endpoint, abi_filepath, contracts), repeat)))
+    finally:
+        shutil.rmtree(warm_dir)
+
+    for name, timing in results:
+        print(f'{name:30} {timing * 1000:9.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,483 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Local JSON-RPC server with synthetic SKALE Manager state.
+
+The server generates its own ABI file with the contract functions used by
+the scripts in this repo, answers eth_call for them from synthetic nodes
+and sChains, accepts signed transactions and returns mined receipts.
+Unknown contract functions return zero values of their output types.
+Every HTTP request can be delayed by latency +- jitter milliseconds.
+"""
+
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import click
+
+
+CHAIN_ID = 31337
+START_BLOCK = 1000
+ZERO_ADDRESS = '0x' + '0' * 40
+DEFAULT_BALANCE = 10 ** 24
+DEFAULT_GAS_PRICE = 10 ** 9
+SCHAIN_LIFETIME = 365 * 24 * 3600
+NODE_BASE_PORT = 10000
+
+# contract key in ABI file -> function signatures 'name(inputs)(outputs)'
+CONTRACT_FUNCTIONS = {
+    'contract_manager': [
+        'contracts(bytes32)(address)'
+    ],
+    'skale_token': [
+        'balanceOf(address)(uint256)',
+        'send(address,uint256,bytes)(bool)'
+    ],
+    'skale_manager': [
+        'nodeExit(uint256)()',
+        'createNode(uint16,uint16,bytes4,bytes4,bytes32[2],string,string)()'
+    ],
+    'nodes': [
+        'nodes(uint256)(string,bytes4,bytes4,uint16,uint64,uint64,uint64,uint8,uint256)',
+        'getNodePublicKey(uint256)(bytes32[2])',
+        'getNodeDomainName(uint256)(string)',
+        'getNumberOfNodes()(uint256)',
+        'getNodeStatus(uint256)(uint8)',
+        'getNodeIP(uint256)(bytes4)',
+        'getNodeFinishTime(uint256)(uint256)',
+        'getValidatorNodeIndexes(uint256)(uint256[])',
+        'nodesNameToIndex(bytes32)(uint256)'
+    ],
+    'schains_internal': [
+        'schains(bytes32)(string,address,uint256,uint8,uint256,uint256,uint256,uint256,uint64)',
+        'getSchains()(bytes32[])',
+        'numberOfSchains()(uint64)',
+        'getNodesInGroup(bytes32)(uint256[])',
+        'getSchainIdsForNode(uint256)(bytes32[])',
+        'getSchainHashsForNode(uint256)(bytes32[])',
+        'getActiveSchains(uint256)(bytes32[])',
+        'isSchainExist(bytes32)(bool)'
+    ],
+    'schains': [
+        'getSchainPrice(uint256,uint256)(uint256)',
+        'deleteSchain(address,string)()'
+    ],
+    'skale_d_k_g': [
+        'isLastDKGSuccessful(bytes32)(bool)'
+    ],
+    'validator_service': [
+        'numberOfValidators()(uint256)',
+        'getTrustedValidators()(uint256[])',
+        'isAuthorizedValidator(uint256)(bool)',
+        'getNodeAddresses(uint256)(address[])',
+        'validators(uint256)(string,address,address,string,uint256,uint256,uint256,uint256)'
+    ],
+    'delegation_controller': [
+        'getDelegation(uint256)(address,uint256,uint256,uint256,uint256,uint256,uint256,string)',
+        'getState(uint256)(uint8)',
+        'delegationsByValidator(uint256,uint256)(uint256)',
+        'getDelegationsByValidatorLength(uint256)(uint256)',
+        'acceptPendingDelegation(uint256)()'
+    ]
+}
+
+
+def split_types(types):
+    return [t for t in types.split(',') if t]
+
+
+def parse_signature(signature):
+    """ 'name(uint256,bytes)(bool)' -> function ABI item """
+    name, rest = signature.split('(', 1)
+    inputs, outputs = rest.split(')(')
+    outputs = outputs.rstrip(')')
+    return {
+        'type': 'function',
+        'name': name,
+        'inputs': [{'name': f'arg{i}', 'type': t} for i, t in enumerate(split_types(inputs))],
+        'outputs': [{'name': '', 'type': t} for t in split_types(outputs)],
+        'stateMutability': 'view' if outputs else 'nonpayable'
+    }
+
+
+def contract_address(index):
+    return '0x' + f'{0xC0DE0000 + index:040x}'
+
+
+def camel_name(key):
+    """ schains_internal -> SchainsInternal, skale_d_k_g -> SkaleDKG """
+    return ''.join(part.capitalize() for part in key.split('_'))
+
+
+def build_abi():
+    from web3 import Web3
+
+    abi = {}
+    for index, (key, signatures) in enumerate(sorted(CONTRACT_FUNCTIONS.items())):
+        abi[f'{key}_address'] = Web3.toChecksumAddress(contract_address(index))
+        abi[f'{key}_abi'] = [parse_signature(signature) for signature in signatures]
+    return abi
+
+
+def default_value(abi_type):
+    if abi_type.endswith(']'):
+        base, size = abi_type[:-1].rsplit('[', 1)
+        return [default_value(base) for _ in range(int(size))] if size else []
+    if abi_type.startswith(('uint', 'int')):
+        return 0
+    if abi_type == 'address':
+        return ZERO_ADDRESS
+    if abi_type == 'bool':
+        return False
+    if abi_type == 'string':
+        return ''
+    if abi_type == 'bytes':
+        return b''
+    if abi_type.startswith('bytes'):
+        return b'\0' * int(abi_type[len('bytes'):])
+    raise ValueError(f'Unsupported type {abi_type}')
+
+
+def keccak(data):
+    from eth_utils import keccak as eth_keccak
+    return eth_keccak(data)
+
+
+class FakeManager:
+    """ Synthetic SKALE Manager state and JSON-RPC method implementations """
+
+    def __init__(self, nodes=64, schains=32, schains_per_node=8, validators=None,
+                 latency=0, jitter=0, seed=0):
+        from eth_utils import function_abi_to_4byte_selector
+
+        self.abi = build_abi()
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.block_number = START_BLOCK
+        self.nonces = Counter()
+        self.receipts = {}
+        self.stats = Counter()
+        self.methods = Counter()
+
+        self.functions = {}
+        self.contract_keys = {}
+        for key in CONTRACT_FUNCTIONS:
+            address = self.abi[f'{key}_address'].lower()
+            self.contract_keys[keccak(camel_name(key).encode())] = address
+            for item in self.abi[f'{key}_abi']:
+                selector = function_abi_to_4byte_selector(item)
+                self.functions[(address, selector)] = (key, item)
+
+        self.validators_number = validators or max(1, nodes // 4)
+        self.nodes = [self._make_node(i) for i in range(nodes)]
+        self.node_names = {keccak(node[0].encode()): i for i, node in enumerate(self.nodes)}
+        self.schains = {}
+        self.schain_ids = []
+        self.groups = {}
+        self.node_schains = [[] for _ in range(nodes)]
+        group_size = max(1, min(nodes, round(nodes * schains_per_node / max(schains, 1))))
+        for j in range(schains):
+            schain_id = keccak(f'schain-{j}'.encode())
+            self.schain_ids.append(schain_id)
+            self.schains[schain_id] = self._make_schain(j)
+            group = [(j * group_size + t) % nodes for t in range(group_size)]
+            self.groups[schain_id] = group
+            for node_id in group:
+                self.node_schains[node_id].append(schain_id)
+
+    def _make_node(self, i):
+        ip = bytes([127, (i >> 16) & 0xff, (i >> 8) & 0xff, (i & 0xff) or 1])
+        now = int(time.time())
+        return [f'node-{i}', ip, ip, NODE_BASE_PORT, START_BLOCK, now, 0, 0,
+                i % self.validators_number + 1]
+
+    def _make_schain(self, j):
+        from web3 import Web3
+
+        owner = '0x' + f'{j + 1:040x}'
+        return [f'schain-{j}', Web3.toChecksumAddress(owner), 0, 0, SCHAIN_LIFETIME,
+                int(time.time()), START_BLOCK, 10 ** 18, j]
+
+    # Contract functions
+
+    def call_function(self, key, name, args):
+        handler = getattr(self, f'fn_{key}_{name}', None)
+        return handler(*args) if handler else None
+
+    def fn_contract_manager_contracts(self, name_hash):
+        from web3 import Web3
+        address = self.contract_keys.get(bytes(name_hash), ZERO_ADDRESS)
+        return [Web3.toChecksumAddress(address)]
+
+    def fn_skale_token_balanceOf(self, address):
+        return [DEFAULT_BALANCE]
+
+    def fn_nodes_nodes(self, node_id):
+        return self.nodes[node_id]
+
+    def fn_nodes_getNodePublicKey(self, node_id):
+        return [[keccak(b'pk0' + bytes([node_id & 0xff])),
+                 keccak(b'pk1' + bytes([node_id & 0xff]))]]
+
+    def fn_nodes_getNodeDomainName(self, node_id):
+        return [f'node-{node_id}.skale.test']
+
+    def fn_nodes_getNumberOfNodes(self):
+        return [len(self.nodes)]
+
+    def fn_nodes_getNodeStatus(self, node_id):
+        return [self.nodes[node_id][7]]
+
+    def fn_nodes_getNodeIP(self, node_id):
+        return [self.nodes[node_id][1]]
+
+    def fn_nodes_getValidatorNodeIndexes(self, validator_id):
+        return [[i for i, node in enumerate(self.nodes) if node[8] == validator_id]]
+
+    def fn_nodes_nodesNameToIndex(self, name_hash):
+        return [self.node_names.get(bytes(name_hash), 0)]
+
+    def fn_schains_internal_schains(self, schain_id):
+        return self.schains.get(bytes(schain_id)) or \
+            ['', ZERO_ADDRESS, 0, 0, 0, 0, 0, 0, 0]
+
+    def fn_schains_internal_getSchains(self):
+        return [self.schain_ids]
+
+    def fn_schains_internal_numberOfSchains(self):
+        return [len(self.schain_ids)]
+
+    def fn_schains_internal_getNodesInGroup(self, schain_id):
+        return [self.groups.get(bytes(schain_id), [])]
+
+    def fn_schains_internal_getSchainIdsForNode(self, node_id):
+        return [self.node_schains[node_id]]
+
+    fn_schains_internal_getSchainHashsForNode = fn_schains_internal_getSchainIdsForNode
+    fn_schains_internal_getActiveSchains = fn_schains_internal_getSchainIdsForNode
+
+    def fn_schains_internal_isSchainExist(self, schain_id):
+        return [bytes(schain_id) in self.schains]
+
+    def fn_skale_d_k_g_isLastDKGSuccessful(self, schain_id):
+        return [True]
+
+    def fn_validator_service_numberOfValidators(self):
+        return [self.validators_number]
+
+    def fn_validator_service_isAuthorizedValidator(self, validator_id):
+        return [True]
+
+    def fn_validator_service_getNodeAddresses(self, validator_id):
+        return [['0x' + f'{validator_id:040x}']]
+
+    def fn_validator_service_validators(self, validator_id):
+        address = '0x' + f'{validator_id:040x}'
+        return [f'validator-{validator_id}', address, address, '', 100,
+                int(time.time()), 10 ** 18, 1]
+
+    # JSON-RPC methods
+
+    def eth_call(self, tx, block='latest'):
+        from eth_abi import decode_abi, encode_abi
+        from hexbytes import HexBytes
+
+        data = HexBytes(tx.get('data') or tx.get('input') or '0x')
+        key, fn_abi = self.functions[(tx['to'].lower(), bytes(data[:4]))]
+        input_types = [item['type'] for item in fn_abi['inputs']]
+        output_types = [item['type'] for item in fn_abi['outputs']]
+        args = decode_abi(input_types, bytes(data[4:]))
+        values = self.call_function(key, fn_abi['name'], args)
+        if values is None:
+            values = [default_value(t) for t in output_types]
+        return HexBytes(encode_abi(output_types, values)).hex()
+
+    def eth_blockNumber(self):
+        return hex(self.block_number)
+
+    def eth_chainId(self):
+        return hex(CHAIN_ID)
+
+    def net_version(self):
+        return str(CHAIN_ID)
+
+    def eth_gasPrice(self):
+        return hex(DEFAULT_GAS_PRICE)
+
+    def eth_getBalance(self, address, block='latest'):
+        return hex(DEFAULT_BALANCE)
+
+    def eth_getCode(self, address, block='latest'):
+        return '0x01'
+
+    def eth_estimateGas(self, tx, block=None):
+        return hex(21000 if not tx.get('data') else 100000)
+
+    def eth_getTransactionCount(self, address, block='latest'):
+        return hex(self.nonces[address.lower()])
+
+    def eth_getLogs(self, log_filter):
+        return []
+
+    def eth_getBlockByNumber(self, block, full=False):
+        number = self.block_number if block in ('latest', 'pending') else int(block, 16)
+        return {
+            'number': hex(number),
+            'hash': '0x' + keccak(str(number).encode()).hex(),
+            'parentHash': '0x' + keccak(str(number - 1).encode()).hex(),
+            'timestamp': hex(int(time.time())),
+            'gasLimit': hex(10 ** 7),
+            'gasUsed': '0x0',
+            'miner': ZERO_ADDRESS,
+            'difficulty': '0x0',
+            'totalDifficulty': '0x0',
+            'nonce': '0x0000000000000000',
+            'extraData': '0x',
+            'logsBloom': '0x' + '0' * 512,
+            'size': '0x0',
+            'transactions': [],
+            'uncles': []
+        }
+
+    def eth_sendRawTransaction(self, raw_tx):
+        from eth_account import Account
+
+        sender = Account.recover_transaction(raw_tx).lower()
+        tx_hash = '0x' + keccak(bytes.fromhex(raw_tx[2:])).hex()
+        with self.lock:
+            self.nonces[sender] += 1
+            self.block_number += 1
+            self.receipts[tx_hash] = {
+                'transactionHash': tx_hash,
+                'transactionIndex': '0x0',
+                'blockHash': '0x' + keccak(str(self.block_number).encode()).hex(),
+                'blockNumber': hex(self.block_number),
+                'from': sender,
+                'to': None,
+                'cumulativeGasUsed': hex(21000),
+                'gasUsed': hex(21000),
+                'contractAddress': None,
+                'logs': [],
+                'logsBloom': '0x' + '0' * 512,
+                'status': '0x1'
+            }
+        return tx_hash
+
+    def eth_getTransactionReceipt(self, tx_hash):
+        return self.receipts.get(tx_hash)
+
+    def fake_stats(self):
+        return {'requests': self.stats['requests'], 'calls': self.stats['calls'],
+                'methods': dict(self.methods)}
+
+    def fake_reset(self):
+        with self.lock:
+            self.stats.clear()
+            self.methods.clear()
+        return True
+
+    def handle(self, request):
+        method, params = request.get('method'), request.get('params') or []
+        if not method.startswith('fake_'):
+            with self.lock:
+                self.stats['calls'] += 1
+                self.methods[method] += 1
+        response = {'jsonrpc': '2.0', 'id': request.get('id')}
+        handler = getattr(self, method, None) if not method.startswith('_') else None
+        if handler is None or method.startswith(('fn_', 'call_')):
+            response['error'] = {'code': -32601, 'message': f'Method {method} not found'}
+            return response
+        try:
+            response['result'] = handler(*params)
+        except Exception as err:  # noqa
+            response['error'] = {'code': -32000, 'message': f'{type(err).__name__}: {err}'}
+        return response
+
+    def delay(self):
+        if self.latency or self.jitter:
+            delay_ms = self.latency + self.random.uniform(-self.jitter, self.jitter)
+            time.sleep(max(0, delay_ms) / 1000)
+
+
+def make_handler(manager):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            with manager.lock:
+                manager.stats['requests'] += 1
+            manager.delay()
+            if isinstance(body, list):
+                result = [manager.handle(request) for request in body]
+            else:
+                result = manager.handle(body)
+            data = json.dumps(result).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+
+def start_server(manager, host='127.0.0.1', port=0):
+    """ Starts server in a daemon thread, returns (server, endpoint) """
+    server = ThreadingHTTPServer((host, port), make_handler(manager))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+def save_abi(manager, path):
+    with open(path, 'w') as abi_file:
+        json.dump(manager.abi, abi_file, indent=4)
+
+
+@click.command()
+@click.option('--port', default=8545)
+@click.option('--nodes', default=64, help='Number of nodes')
+@click.option('--schains', default=32, help='Number of sChains')
+@click.option('--schains-per-node', default=8, help='Average number of sChains on a node')
+@click.option('--latency', default=0.0, help='Delay of every HTTP request, ms')
+@click.option('--jitter', default=0.0, help='Random +- deviation of the delay, ms')
+@click.option('--abi-out', default='./fake-manager.json', type=click.Path(),
+              help='Where to save generated ABI file')
+def main(port, nodes, schains, schains_per_node, latency, jitter, abi_out):
+    """ Runs simulated SKALE Manager JSON-RPC server """
+    manager = FakeManager(nodes, schains, schains_per_node, latency=latency, jitter=jitter)
+    save_abi(manager, abi_out)
+    server, endpoint = start_server(manager, port=port)
+    print(f'Serving {nodes} nodes and {schains} sChains on {endpoint}, ABI: {abi_out}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
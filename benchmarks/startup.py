@@ -0,0 +1,109 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+""" Startup time benchmark for every CLI subcommand (python -X importtime based) """
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+import click
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+os.environ.setdefault('ENDPOINT', 'http://localhost:8545')
+
+from cli import COMMAND_GROUPS  # noqa
+
+
+def parse_importtime(stderr):
+    """ Returns total import time and top-level imports sorted by cumulative time """
+    total_us, top_level = 0, []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        total_us += int(self_us)
+        if not name.startswith('  '):
+            top_level.append((name.strip(), int(cumulative_us)))
+    top_level.sort(key=lambda item: item[1], reverse=True)
+    return total_us, top_level
+
+
+def run_startup(args, repeat):
+    timings, imports = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = subprocess.run(
+            [sys.executable, '-X', 'importtime'] + args,
+            cwd=ROOT_DIR, capture_output=True, text=True
+        )
+        timings.append(time.perf_counter() - start)
+        imports = parse_importtime(res.stderr)
+    total_us, top_level = imports
+    return {
+        'wall_time': min(timings),
+        'import_time': total_us / 10 ** 6,
+        'top_imports': [name for name, _ in top_level[:3]],
+        'returncode': res.returncode
+    }
+
+
+def list_subcommands(group):
+    import importlib
+    module = importlib.import_module(COMMAND_GROUPS[group][0])
+    return sorted(module.main.commands)
+
+
+@click.command()
+@click.option('--group', 'groups', multiple=True, type=click.Choice(sorted(COMMAND_GROUPS)),
+              help='Command groups to benchmark (all by default)')
+@click.option('--repeat', default=3, help='Runs per command, best time is reported')
+@click.option('--direct', is_flag=True, default=False,
+              help='Also run the standalone scripts (python <group>.py) for comparison')
+@click.option('--json-output', is_flag=True, default=False, help='Print results as JSON')
+def main(groups, repeat, direct, json_output):
+    """ Measures `--help` startup time of every subcommand """
+    results = []
+    for group in groups or sorted(COMMAND_GROUPS):
+        script = f'{COMMAND_GROUPS[group][0]}.py'
+        for command in list_subcommands(group):
+            result = {'command': f'{group} {command}'}
+            result.update(run_startup(['cli.py', group, command, '--help'], repeat))
+            if direct:
+                result['direct_wall_time'] = run_startup(
+                    [script, command, '--help'], repeat)['wall_time']
+            results.append(result)
+            if not json_output:
+                line = (f'{result["command"]:45} {result["wall_time"]:7.3f}s '
+                        f'imports {result["import_time"]:6.3f}s')
+                if direct:
+                    line += f' direct {result["direct_wall_time"]:7.3f}s'
+                print(f'{line}  {", ".join(result["top_imports"])}')
+    cli_help = run_startup(['cli.py', '--help'], repeat)
+    if json_output:
+        print(json.dumps({'cli_help': cli_help, 'commands': results}, indent=4))
+    else:
+        print(f'{"cli.py --help":45} {cli_help["wall_time"]:7.3f}s '
+              f'imports {cli_help["import_time"]:6.3f}s')
+
+
+if __name__ == '__main__':
+    main()
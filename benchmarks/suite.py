@@ -0,0 +1,186 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Offline benchmark suite: runs commands against the simulated SKALE Manager
+(benchmarks/fake_manager.py) and reports wall time, RPC count and peak memory.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+BENCHMARKS_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from fake_manager import FakeManager, save_abi, start_server  # noqa
+
+# Well known test key, never use it outside of local benchmarks
+TEST_PRIVATE_KEY = '0x' + '4c0883a69102937d6231471b5dbb6204fe5129617082792ae468d01a3f362318'
+CLEARED_ENV = ('TM_URL', 'LEDGER', 'LAST_BLOCK_FILE', 'RPC_CACHE_PATH', 'PROFILE', 'PROFILE_RPC')
+
+
+def write_addresses(workdir, amount):
+    path = os.path.join(workdir, 'addresses.txt')
+    with open(path, 'w') as addresses_file:
+        for i in range(amount):
+            addresses_file.write('0x' + f'{0xADD0000 + i:040x}' + '\n')
+    return path
+
+
+def write_payouts(workdir, amount):
+    path = os.path.join(workdir, 'payouts.csv')
+    with open(path, 'w') as payouts_file:
+        payouts_file.write('address,asset,amount\n')
+        for i in range(amount):
+            asset = 'eth' if i % 2 else 'skl'
+            payouts_file.write(f'0x{0xBEEF0000 + i:040x},{asset},0.001\n')
+    return path
+
+
+# name -> function(workdir, options) returning (args, extra env)
+SCENARIOS = {
+    'endpoints': lambda workdir, opts: (
+        ['endpoints.py'], {'RESULTS_PATH': os.path.join(workdir, 'endpoints.json')}),
+    'schain-info': lambda workdir, opts: (
+        ['schain.py', 'info', 'schain-0'], {}),
+    'schains-by-node': lambda workdir, opts: (
+        ['node.py', 'schains-by-node', '--save-to', os.path.join(workdir, 'by-node')], {}),
+    'node-show': lambda workdir, opts: (
+        ['node.py', 'show'], {}),
+    'check-validator-nodes': lambda workdir, opts: (
+        ['check_watchdogs.py'], {}),
+    'balances': lambda workdir, opts: (
+        ['wallet.py', 'balances', write_addresses(workdir, opts['addresses'])], {}),
+    'payout': lambda workdir, opts: (
+        ['wallet.py', 'payout', write_payouts(workdir, opts['txs']), '--yes',
+         '--ledger', os.path.join(workdir, f'payout-{time.time()}.jsonl')], {})
+}
+
+
+def run_scenario(manager, args, env):
+    """ Runs command in a subprocess, returns wall time, RPC stats and peak RSS """
+    manager.fake_reset()
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable] + args, cwd=ROOT_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = proc.stderr.read()
+    _, status, rusage = os.wait4(proc.pid, 0)
+    wall_time = time.perf_counter() - start
+    proc.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    stats = manager.fake_stats()
+    return {
+        'wall_time': round(wall_time, 3),
+        'rpc_requests': stats['requests'],
+        'rpc_calls': stats['calls'],
+        'methods': stats['methods'],
+        # ru_maxrss is in kilobytes on Linux
+        'peak_memory_mb': round(rusage.ru_maxrss / 1024, 1),
+        'returncode': proc.returncode,
+        'error': stderr.decode(errors='replace').strip().splitlines()[-1:]
+        if proc.returncode else []
+    }
+
+
+def compare(results, baseline_path, threshold):
+    """ Returns list of regressions against saved results """
+    with open(baseline_path) as baseline_file:
+        baseline = {item['scenario']: item for item in json.load(baseline_file)['results']}
+    regressions = []
+    for result in results:
+        base = baseline.get(result['scenario'])
+        if not base:
+            continue
+        for metric in ('wall_time', 'rpc_requests', 'peak_memory_mb'):
+            if base[metric] and result[metric] > base[metric] * (1 + threshold):
+                regressions.append(f'{result["scenario"]}: {metric} '
+                                   f'{base[metric]} -> {result[metric]}')
+    return regressions
+
+
+@click.command()
+@click.option('--scenario', 'scenarios', multiple=True, type=click.Choice(sorted(SCENARIOS)),
+              help='Scenarios to run (all by default)')
+@click.option('--nodes', default=64, help='Number of nodes')
+@click.option('--schains', default=32, help='Number of sChains')
+@click.option('--schains-per-node', default=8, help='Average number of sChains on a node')
+@click.option('--latency', default=20.0, help='Delay of every HTTP request, ms')
+@click.option('--jitter', default=5.0, help='Random +- deviation of the delay, ms')
+@click.option('--addresses', default=500, help='Addresses for balances scenario')
+@click.option('--txs', default=100, help='Transactions for payout scenario')
+@click.option('--repeat', default=1, help='Runs per scenario, best time is reported')
+@click.option('--save', default=None, type=click.Path(), help='Save results as JSON')
+@click.option('--baseline', default=None, type=click.Path(exists=True),
+              help='Compare with saved results and exit 1 on regressions')
+@click.option('--threshold', default=0.2, help='Allowed relative regression')
+def main(scenarios, nodes, schains, schains_per_node, latency, jitter, addresses, txs,
+         repeat, save, baseline, threshold):
+    """ Runs offline benchmarks against the simulated SKALE Manager """
+    manager = FakeManager(nodes, schains, schains_per_node, latency=latency, jitter=jitter)
+    server, endpoint = start_server(manager)
+    opts = {'addresses': addresses, 'txs': txs}
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        abi_filepath = os.path.join(workdir, 'manager.json')
+        save_abi(manager, abi_filepath)
+        base_env = {key: value for key, value in os.environ.items() if key not in CLEARED_ENV}
+        base_env.update({
+            'ENDPOINT': endpoint,
+            'ABI_FILEPATH': abi_filepath,
+            'ETH_PRIVATE_KEY': TEST_PRIVATE_KEY,
+            'ABI_CACHE_DIR': os.path.join(workdir, 'abi-cache'),
+            'DELEGATION_INDEX_PATH': os.path.join(workdir, 'delegations-index.json')
+        })
+        for name in scenarios or list(SCENARIOS):
+            runs = []
+            for _ in range(repeat):
+                args, extra_env = SCENARIOS[name](workdir, opts)
+                if args[0] not in ('endpoints.py', 'check_watchdogs.py'):
+                    args[1:1] = ['--abi-filepath', abi_filepath]
+                runs.append(run_scenario(manager, args, {**base_env, **extra_env}))
+            result = {'scenario': name, **min(runs, key=lambda run: run['wall_time'])}
+            results.append(result)
+            status = 'ok' if result['returncode'] == 0 else f'FAILED {result["error"]}'
+            print(f'{name:24} {result["wall_time"]:8.3f}s {result["rpc_requests"]:6} reqs '
+                  f'{result["rpc_calls"]:6} calls {result["peak_memory_mb"]:8.1f} MB  {status}')
+    server.shutdown()
+
+    report = {
+        'params': {'nodes': nodes, 'schains': schains, 'schains_per_node': schains_per_node,
+                   'latency': latency, 'jitter': jitter, 'addresses': addresses, 'txs': txs},
+        'results': results
+    }
+    if save:
+        with open(save, 'w') as save_file:
+            json.dump(report, save_file, indent=4)
+    if baseline:
+        regressions = compare(results, baseline, threshold)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
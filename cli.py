@@ -0,0 +1,63 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+""" Single entry point for all command groups, modules are imported on demand """
+
+import importlib
+
+import click
+
+
+COMMAND_GROUPS = {
+    'constants': ('constants', 'Commands to manage SKALE constants'),
+    'delegator': ('delegator', 'Commands for token holders'),
+    'ima': ('ima', 'Commands to manage SKALE IMA'),
+    'node': ('node', 'Commands to manage SKALE nodes'),
+    'schain': ('schain', 'Commands to manage SKALE schains'),
+    'serve': ('serve', 'HTTP service with cached nodes, sChains and endpoints'),
+    'snapshot': ('snapshot', 'Commands to save, compare and analyse topology snapshots'),
+    'validator': ('validator', 'Commands to manage SKALE validators'),
+    'wallet': ('wallet', 'Commands to manage accounts and funds')
+}
+
+
+class LazyGroup(click.MultiCommand):
+    """ Imports module with command group only when it is invoked """
+
+    def list_commands(self, ctx):
+        return sorted(COMMAND_GROUPS)
+
+    def get_command(self, ctx, name):
+        if name not in COMMAND_GROUPS:
+            return None
+        module_name, _ = COMMAND_GROUPS[name]
+        return importlib.import_module(module_name).main
+
+    def format_commands(self, ctx, formatter):
+        rows = [(name, COMMAND_GROUPS[name][1]) for name in self.list_commands(ctx)]
+        with formatter.section('Commands'):
+            formatter.write_dl(rows)
+
+
+@click.command(cls=LazyGroup)
+def main():
+    """ SKALE Manager command line tools """
+
+
+if __name__ == '__main__':
+    main()
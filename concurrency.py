@@ -0,0 +1,185 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Adaptive (AIMD) concurrency limiter for fan-out of RPC requests and probes.
+
+The limit grows by one after every `limit` healthy completions and is
+multiplied by `decrease` on overload: timeouts, connection errors, HTTP 429/5xx,
+rate limit errors or latency above `latency_tolerance` times the best seen one
+(3 by default, None disables the latency signal).
+At most one decrease happens per request round trip, so a burst of failures
+of requests started together shrinks the limit once.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INITIAL_LIMIT = 4
+DEFAULT_MAX_LIMIT = 64
+DEFAULT_LATENCY_TOLERANCE = 3
+OVERLOAD_STATUS_CODES = (429, 502, 503, 504)
+OVERLOAD_MESSAGES = ('rate limit', 'too many requests', 'limit exceeded', '-32005')
+# best latency slowly drifts up to follow environment changes
+BASELINE_DRIFT = 1.01
+
+
+def is_overload_error(err):
+    """ Timeouts, connection errors, HTTP 429/5xx and provider rate limit errors """
+    status = getattr(getattr(err, 'response', None), 'status_code', None)
+    if status in OVERLOAD_STATUS_CODES or isinstance(err, OSError):
+        return True
+    message = str(err).lower()
+    return any(pattern in message for pattern in OVERLOAD_MESSAGES)
+
+
+class AimdLimiter:
+    def __init__(self, initial=DEFAULT_INITIAL_LIMIT, min_limit=1, max_limit=DEFAULT_MAX_LIMIT,
+                 decrease=0.5, latency_tolerance=DEFAULT_LATENCY_TOLERANCE,
+                 name='limiter'):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.baseline = None
+        self.in_flight = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.max_seen_limit = self.limit
+        self.completed = 0
+        self.overloads = 0
+        self.decreases = 0
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """ Blocks until a slot is free, returns the time the request started """
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, started, overloaded=False):
+        now = time.monotonic()
+        elapsed = now - started
+        with self._cond:
+            self.in_flight -= 1
+            self.completed += 1
+            if not overloaded:
+                slow = self.latency_tolerance and self.baseline and \
+                    elapsed > self.baseline * self.latency_tolerance
+                self.baseline = elapsed if self.baseline is None else \
+                    min(elapsed, self.baseline * BASELINE_DRIFT)
+                overloaded = bool(slow)
+            else:
+                self.overloads += 1
+            if overloaded:
+                # requests started before the last decrease saw the old limit
+                if started >= self._last_decrease:
+                    self._decrease(now)
+            else:
+                self._successes += 1
+                if self._successes >= int(self.limit) and self.limit < self.max_limit:
+                    self._successes = 0
+                    self.limit = min(self.limit + 1, self.max_limit)
+                    self.max_seen_limit = max(self.max_seen_limit, self.limit)
+            self._cond.notify_all()
+
+    def _decrease(self, now):
+        old = int(self.limit)
+        self.limit = max(self.limit * self.decrease, self.min_limit)
+        self._successes = 0
+        self._last_decrease = now
+        self.decreases += 1
+        logger.info(f'{self.name}: overload, concurrency {old} -> {int(self.limit)}')
+
+    def run(self, fn, *args, is_overload=None):
+        """ Runs fn(*args) in a slot, overload is detected from errors or is_overload(result) """
+        with self._cond:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        try:
+            started = self.acquire()
+        finally:
+            with self._cond:
+                self.queued -= 1
+        return self._call(started, fn, args, is_overload)
+
+    def _call(self, started, fn, args, is_overload):
+        try:
+            result = fn(*args)
+        except Exception as err:
+            self.release(started, overloaded=is_overload_error(err))
+            raise
+        self.release(started, overloaded=bool(is_overload and is_overload(result)))
+        return result
+
+    def map(self, fn, items, is_overload=None):
+        """
+        Applies fn to items with adaptive concurrency, results are returned in
+        items order. Items wait in the queue until the limiter gives them a slot.
+        """
+        items = list(items)
+        if not items:
+            return []
+        with self._cond:
+            self.queued += len(items)
+            self.max_queued = max(self.max_queued, self.queued)
+        futures = []
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.max_limit, len(items))) as executor:
+                for item in items:
+                    started = self.acquire()
+                    with self._cond:
+                        self.queued -= 1
+                    futures.append(executor.submit(self._call, started, fn, (item,), is_overload))
+        finally:
+            with self._cond:
+                self.queued -= len(items) - len(futures)
+        return [future.result() for future in futures]
+
+    def stats(self):
+        with self._cond:
+            return {
+                'name': self.name,
+                'limit': int(self.limit),
+                'max_seen_limit': int(self.max_seen_limit),
+                'in_flight': self.in_flight,
+                'queue_depth': self.queued,
+                'max_queue_depth': self.max_queued,
+                'completed': self.completed,
+                'overloads': self.overloads,
+                'decreases': self.decreases,
+                'baseline_ms': round(self.baseline * 1000, 2) if self.baseline else None
+            }
+
+    def format_stats(self):
+        stats = self.stats()
+        return (f'{stats["name"]}: limit {stats["limit"]} (max {stats["max_seen_limit"]}), '
+                f'in flight {stats["in_flight"]}, queue {stats["queue_depth"]} '
+                f'(max {stats["max_queue_depth"]}), completed {stats["completed"]}, '
+                f'overloads {stats["overloads"]}, decreases {stats["decreases"]}')
@@ -25,8 +25,34 @@ load_dotenv()
 
 ENDPOINT = os.environ['ENDPOINT']
 DIR_PATH = os.path.dirname(os.path.realpath(__file__))
-ABI_FILEPATH = os.path.join(DIR_PATH, 'manager.json')
+ABI_FILEPATH = os.environ.get('ABI_FILEPATH', os.path.join(DIR_PATH, 'manager.json'))
 IMA_ABI_FILEPATH = os.path.join(DIR_PATH, 'ima.json')
+ABI_CACHE_DIR = os.environ.get('ABI_CACHE_DIR', os.path.join(DIR_PATH, '.abi-cache'))
 TM_URL = os.environ.get('TM_URL')
 ETH_PRIVATE_KEY = os.environ.get('ETH_PRIVATE_KEY')
 LEDGER = os.environ.get('LEDGER')
+DELEGATION_INDEX_PATH = os.environ.get(
+    'DELEGATION_INDEX_PATH',
+    os.path.join(DIR_PATH, 'delegations-index.json')
+)
+DELEGATIONS_START_BLOCK = int(os.environ.get('DELEGATIONS_START_BLOCK', 0))
+# Block-pinned cache of contract reads is off unless a size is given
+RPC_CACHE_SIZE = int(os.environ.get('RPC_CACHE_SIZE', 0))
+# Seconds reads of 'latest' stay pinned to one block
+RPC_CACHE_PIN_TTL = float(os.environ.get('RPC_CACHE_PIN_TTL', 10))
+RPC_CACHE_PATH = os.environ.get('RPC_CACHE_PATH')
+# Comma separated endpoints used for reads in addition to ENDPOINT
+READ_ENDPOINTS = [url.strip() for url in os.environ.get('READ_ENDPOINTS', '').split(',')
+                  if url.strip()]
+RPC_LB_STRATEGY = os.environ.get('RPC_LB_STRATEGY', 'least-outstanding')
+# Duplicate reads slower than this latency percentile, 0 disables hedging
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', 0))
+HEDGE_BUDGET = float(os.environ.get('HEDGE_BUDGET', 0.05))
+# Seconds to reuse eth_gasPrice within a block, 0 disables the cache
+GAS_PRICE_TTL = float(os.environ.get('GAS_PRICE_TTL', 15))
+# Reuse gas estimates of repeated calls instead of estimating every transaction
+GAS_ESTIMATE_MEMO = os.environ.get('GAS_ESTIMATE_MEMO', '').lower() in ('1', 'true', 'yes')
+# Seconds before unmined bulk transactions are resent with a higher gas price, 0 disables
+TX_REPLACE_AFTER = float(os.environ.get('TX_REPLACE_AFTER', 0))
+# Highest gas price in wei for replacements, twice the initial gas price by default
+TX_MAX_GAS_PRICE = int(os.environ.get('TX_MAX_GAS_PRICE', 0)) or None
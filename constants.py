@@ -21,12 +21,11 @@
 
 import click
 
-from skale import Skale
-from skale.utils.helper import init_default_logger
-from skale.utils.contracts_provision.main import _skip_evm_time
-
 from config import ENDPOINT, ABI_FILEPATH
-from utils import init_wallet
+from py_profile import profile_option
+from rpc_profile import profile_rpc_option
+from rpc_trace import rpc_trace_options
+from utils import LazyClients, init_default_logger
 
 MONTH_IN_SECONDS = (60 * 60 * 24 * 31) + 100
 
@@ -34,14 +33,15 @@ init_default_logger()
 
 
 @click.group()
+@profile_option
+@profile_rpc_option
+@rpc_trace_options
 @click.option('--endpoint', default=ENDPOINT, help='Skale manager endpoint')
 @click.option('--abi-filepath', default=ABI_FILEPATH, type=click.Path(),
               help='abi file')
 @click.pass_context
 def main(ctx, endpoint, abi_filepath):
-    ctx.ensure_object(dict)
-    wallet = init_wallet(endpoint)
-    ctx.obj['skale'] = Skale(endpoint, abi_filepath, wallet)
+    ctx.obj = LazyClients(endpoint, abi_filepath)
 
 
 @main.command()
@@ -49,6 +49,8 @@ def main(ctx, endpoint, abi_filepath):
 @click.pass_context
 def skip_evm_time_ganache(ctx, time_to_skip):
     """ Skip EVM time to activate delegation """
+    from skale.utils.contracts_provision.main import _skip_evm_time
+
     """(works only for ganache)"""
     skale = ctx.obj['skale']
     _skip_evm_time(skale.web3, time_to_skip)
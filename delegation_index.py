@@ -0,0 +1,175 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+""" Local delegation index built from DelegationController events """
+
+import json
+import logging
+import os
+import time
+
+from batch_rpc import batch_contract_calls, get_block_number
+from event_logs import iter_contract_event_chunks
+
+
+logger = logging.getLogger(__name__)
+
+DELEGATION_EVENTS = {
+    'DelegationProposed': 'proposed_block',
+    'DelegationAccepted': 'accepted_block',
+    'DelegationRequestCanceledByUser': 'canceled_block',
+    'UndelegationRequested': 'undelegation_requested_block'
+}
+DELEGATION_FIELDS = [
+    'address', 'validator_id', 'amount', 'delegation_period', 'created',
+    'started', 'finished', 'info'
+]
+DELEGATION_STATES = [
+    'PROPOSED', 'ACCEPTED', 'CANCELED', 'REJECTED', 'DELEGATED',
+    'UNDELEGATION_REQUESTED', 'COMPLETED'
+]
+# states that change with time without an event (proposal expiry, start of the
+# delegation month, end of the delegation period), DELEGATED changes only with
+# UndelegationRequested
+TIME_DRIVEN_STATES = ('PROPOSED', 'ACCEPTED', 'UNDELEGATION_REQUESTED')
+# Seconds between saves of a partially updated index
+SAVE_INTERVAL = 30
+
+
+def empty_index(contract_address, start_block):
+    return {
+        'contract_address': contract_address,
+        'last_block': start_block - 1,
+        'delegations': {}
+    }
+
+
+def load_index(path, contract_address, start_block=0):
+    if path and os.path.isfile(path):
+        with open(path) as index_file:
+            index = json.load(index_file)
+        if index['contract_address'] == contract_address:
+            return index
+        logger.warning(f'Index {path} was built for another DelegationController, '
+                       f'rebuilding it')
+    return empty_index(contract_address, start_block)
+
+
+def save_index(path, index):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as index_file:
+        json.dump(index, index_file)
+    os.replace(tmp_path, path)
+
+
+def _refresh_delegations(skale, endpoint, index, delegation_ids, block_number):
+    contract = skale.delegation_controller.contract
+    calls = []
+    for delegation_id in delegation_ids:
+        calls.extend([
+            (contract, 'getDelegation', [delegation_id]),
+            (contract, 'getState', [delegation_id])
+        ])
+    results = batch_contract_calls(endpoint, skale.web3, calls,
+                                   block_number=block_number)
+    delegations = index['delegations']
+    for i, delegation_id in enumerate(delegation_ids):
+        raw, state = results[2 * i:2 * i + 2]
+        delegation = delegations.setdefault(str(delegation_id), {'id': delegation_id})
+        delegation.update(zip(DELEGATION_FIELDS, raw))
+        delegation['status'] = DELEGATION_STATES[state]
+
+
+def _apply_events(index, events):
+    touched = set()
+    for event in events:
+        delegation_id = event['args']['delegationId']
+        delegation = index['delegations'].setdefault(
+            str(delegation_id), {'id': delegation_id})
+        delegation[DELEGATION_EVENTS[event['event']]] = event['blockNumber']
+        # status is refreshed at the end of the update, until then
+        # the delegation has no status and will be refreshed on the next run too
+        delegation.pop('status', None)
+        touched.add(delegation_id)
+    return touched
+
+
+def update_index(skale, endpoint, index, to_block=None, chunk_size=None, save=None,
+                 save_interval=SAVE_INTERVAL):
+    """
+    Applies DelegationController events from blocks after index['last_block']
+    and refreshes states of delegations that changed or can change with time.
+    Only these delegations are fetched from the contract.
+    If save is passed it's called with the index at most every save_interval
+    seconds while chunks are scanned, so an interrupted update resumes from
+    the last saved block. The caller saves the final index.
+    """
+    to_block = to_block if to_block is not None else get_block_number(endpoint)
+    from_block = index['last_block'] + 1
+    touched = set()
+    if from_block <= to_block:
+        kwargs = {'chunk_size': chunk_size} if chunk_size else {}
+        chunks = iter_contract_event_chunks(
+            endpoint, skale.web3, skale.delegation_controller.contract,
+            from_block, to_block,
+            event_names=list(DELEGATION_EVENTS),
+            **kwargs
+        )
+        saved_at = time.monotonic()
+        for _, end, events in chunks:
+            touched |= _apply_events(index, events)
+            index['last_block'] = end
+            if save and time.monotonic() - saved_at >= save_interval:
+                save(index)
+                saved_at = time.monotonic()
+
+    time_driven = {
+        delegation['id']
+        for delegation in index['delegations'].values()
+        if delegation.get('status') is None or delegation['status'] in TIME_DRIVEN_STATES
+    }
+    to_refresh = sorted(touched | time_driven)
+    if to_refresh:
+        _refresh_delegations(skale, endpoint, index, to_refresh, to_block)
+    index['last_block'] = to_block
+    logger.info(f'Delegation index updated to block {to_block}: '
+                f'{len(touched)} delegations changed, {len(to_refresh)} refreshed')
+    return index
+
+
+def get_updated_index(skale, endpoint, path, start_block=0):
+    contract_address = skale.delegation_controller.address
+    index = load_index(path, contract_address, start_block)
+    save = (lambda idx: save_index(path, idx)) if path else None
+    update_index(skale, endpoint, index, save=save)
+    if path:
+        save_index(path, index)
+    return index
+
+
+def query(index, validator_id=None, holder=None, status=None, period=None):
+    holder = holder.lower() if holder else None
+    return [
+        delegation
+        for _, delegation in sorted(index['delegations'].items(),
+                                    key=lambda item: int(item[0]))
+        if (validator_id is None or delegation['validator_id'] == validator_id) and
+        (holder is None or delegation['address'].lower() == holder) and
+        (status is None or delegation['status'] == status) and
+        (period is None or delegation['delegation_period'] == period)
+    ]
@@ -18,26 +18,39 @@
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """ Commands to manage SKALE validators """
 
-import click
+import csv
+import json
+import sys
+import time
 
-from skale import Skale
-from skale.utils.helper import init_default_logger
+import click
 
-from config import ENDPOINT, ABI_FILEPATH
-from utils import init_wallet
+from config import (ENDPOINT, ABI_FILEPATH, DELEGATION_INDEX_PATH, DELEGATIONS_START_BLOCK,
+                    TX_MAX_GAS_PRICE, TX_REPLACE_AFTER)
+from delegation_index import DELEGATION_STATES, get_updated_index, query
+from py_profile import profile_option
+from rpc_profile import profile_rpc_option
+from rpc_trace import rpc_trace_options
+from tx_pipeline import DEFAULT_MAX_IN_FLIGHT, SUCCESS, RowKeys, TxPipeline
+from utils import LazyClients, init_default_logger
+from validator_snapshot import fetch_validator_snapshot
 
 init_default_logger()
 
+DELEGATE_GAS_LIMIT = 700000
+DELEGATION_INFO = 'Test delegate'
+
 
 @click.group()
+@profile_option
+@profile_rpc_option
+@rpc_trace_options
 @click.option('--endpoint', default=ENDPOINT, help='Skale manager endpoint')
 @click.option('--abi-filepath', default=ABI_FILEPATH, type=click.Path(),
               help='abi file')
 @click.pass_context
 def main(ctx, endpoint, abi_filepath):
-    ctx.ensure_object(dict)
-    wallet = init_wallet(endpoint)
-    ctx.obj['skale'] = Skale(endpoint, abi_filepath, wallet)
+    ctx.obj = LazyClients(endpoint, abi_filepath)
 
 
 @main.command()
@@ -60,13 +73,18 @@ def delegate(ctx, validator_id, tokens_amount, period):
 
 
 @main.command()
+@click.option('--status', type=click.Choice(DELEGATION_STATES), default=None,
+              help='Show only delegations with provided status')
+@click.option('--period', type=int, default=None,
+              help='Show only delegations with provided delegation period')
 @click.pass_context
-def delegations_by_holder(ctx):
+def delegations_by_holder(ctx, status, period):
     """ Show delegations by holder """
     skale = ctx.obj['skale']
-    res = skale.delegation_controller.get_all_delegations_by_holder(
-        skale.wallet.address)
-    print(res)
+    index = get_updated_index(skale, ctx.obj['endpoint'],
+                              DELEGATION_INDEX_PATH, DELEGATIONS_START_BLOCK)
+    res = query(index, holder=skale.wallet.address, status=status, period=period)
+    print(json.dumps(res, indent=4))
 
 
 @main.command()
@@ -102,5 +120,141 @@ def delegation_by_id(ctx, delegation_id):
     )
 
 
+def read_delegation_rows(delegations_file):
+    """ Parses (validator_id, amount, period) rows, empty amount means MSR """
+    rows, errors = [], []
+    keys = RowKeys()
+    for line_number, row in enumerate(csv.reader(delegations_file), 1):
+        if not row or row[0].strip().startswith('#'):
+            continue
+        if line_number == 1 and row[0].strip().lower() == 'validator_id':
+            continue
+        if len(row) != 3:
+            errors.append(f'line {line_number}: expected 3 columns, got {len(row)}')
+            continue
+        try:
+            validator_id = int(row[0])
+            amount = int(row[1]) if row[1].strip() else None
+            period = int(row[2])
+        except ValueError:
+            errors.append(f'line {line_number}: invalid row {row}')
+            continue
+        rows.append({
+            # MSR-defaulted amounts are keyed as 'msr', MSR may change before resume
+            'key': keys.key(validator_id, 'msr' if amount is None else amount, period),
+            'line': line_number,
+            'validator_id': validator_id,
+            'amount': amount,
+            'period': period
+        })
+    return rows, errors
+
+
+def validate_delegation_rows(skale, endpoint, rows):
+    """
+    Checks all rows locally against MSR, allowed delegation periods
+    and validators settings which are read only once
+    """
+    msr = skale.constants_holder.msr()
+    validators = {
+        validator['id']: validator
+        for validator in fetch_validator_snapshot(skale, endpoint)['validators']
+    }
+    use_whitelist = skale.validator_service.get_use_whitelist()
+    periods = {
+        period: skale.delegation_period_manager.is_delegation_period_allowed(period)
+        for period in {row['period'] for row in rows}
+    }
+
+    errors = []
+    for row in rows:
+        row['amount'] = row['amount'] if row['amount'] is not None else msr
+        validator = validators.get(row['validator_id'])
+        prefix = f'line {row["line"]}'
+        if validator is None:
+            errors.append(f'{prefix}: validator {row["validator_id"]} does not exist')
+            continue
+        if not validator['accept_new_requests']:
+            errors.append(f'{prefix}: validator {row["validator_id"]} '
+                          f'does not accept new requests')
+        if use_whitelist and not validator['trusted']:
+            errors.append(f'{prefix}: validator {row["validator_id"]} is not trusted')
+        if row['amount'] < max(msr, validator['minimum_delegation_amount']):
+            errors.append(f'{prefix}: amount {row["amount"]} is less than MSR {msr} '
+                          f'or validator minimum {validator["minimum_delegation_amount"]}')
+        if not periods[row['period']]:
+            errors.append(f'{prefix}: delegation period {row["period"]} is not allowed')
+    return errors
+
+
+def build_delegate_tx(skale, row):
+    def build_tx(tx_fields):
+        return skale.delegation_controller.contract.functions.delegate(
+            row['validator_id'], row['amount'], row['period'], DELEGATION_INFO
+        ).buildTransaction({'gas': DELEGATE_GAS_LIMIT, **tx_fields})
+    return build_tx
+
+
+@main.command()
+@click.argument('delegations_file', type=click.File('r'))
+@click.option('--checkpoint', default='./delegate-batch-ledger.jsonl',
+              help='File to save tx hashes and statuses, used to resume')
+@click.option('--max-in-flight', default=DEFAULT_MAX_IN_FLIGHT,
+              help='Max amount of unconfirmed transactions')
+@click.option('--gas-price', type=int, default=None,
+              help='Gas price in wei (current network gas price by default)')
+@click.option('--replace-after', default=TX_REPLACE_AFTER, type=float,
+              help='Resend transactions that are not mined in this many seconds '
+                   'with a higher gas price, 0 disables')
+@click.option('--max-gas-price', default=TX_MAX_GAS_PRICE, type=int,
+              help='Highest gas price in wei for resent transactions '
+                   '(twice the initial gas price by default)')
+@click.option('--yes', is_flag=True, default=False,
+              help='Do not ask for confirmation')
+@click.pass_context
+def delegate_batch(ctx, delegations_file, checkpoint, max_in_flight, gas_price,
+                   replace_after, max_gas_price, yes):
+    """ Delegate tokens using (validator_id, amount, period) rows from CSV """
+    skale = ctx.obj['skale']
+    endpoint = ctx.obj['endpoint']
+    rows, errors = read_delegation_rows(delegations_file)
+    if not errors:
+        errors = validate_delegation_rows(skale, endpoint, rows)
+    if errors:
+        print('\n'.join(errors))
+        print(f'Delegations file is invalid: {len(errors)} errors')
+        sys.exit(1)
+
+    pipeline = TxPipeline(skale, endpoint, ledger_path=checkpoint,
+                          max_in_flight=max_in_flight, gas_price=gas_price,
+                          replace_after=replace_after or None,
+                          max_gas_price=max_gas_price)
+    pipeline.resume()
+    pending = [row for row in rows if not pipeline.is_done(row['key'])]
+    total = sum(row['amount'] for row in pending)
+    balance = skale.token.get_balance(skale.wallet.address)
+    # delegated and vesting tokens are part of the balance but can't be delegated
+    locked = skale.token_state.contract.functions.getAndUpdateLockedAmount(
+        skale.wallet.address).call()
+    delegatable = balance - locked
+    print(f'Delegations: {len(rows)}, left to send: {len(pending)}, '
+          f'total amount: {total}, balance: {balance}, delegatable: {delegatable}')
+    if total > delegatable:
+        print('Insufficient delegatable SKL balance')
+        sys.exit(1)
+    if pending and not yes:
+        click.confirm('Send delegations?', abort=True)
+
+    start = time.time()
+    for row in pending:
+        pipeline.send(row['key'], build_delegate_tx(skale, row))
+    pipeline.wait_all()
+
+    summary = pipeline.summary([row['key'] for row in rows])
+    print(f'Delegations finished in {time.time() - start:.1f}s: {summary}')
+    if set(summary) - {SUCCESS}:
+        sys.exit(1)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,117 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+DKG status of many sChains at one block.
+
+sChain names are hashed locally, statuses are read with batched calls
+pinned to one block, chunks of sChains are read concurrently and yielded
+as soon as they are ready.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from batch_rpc import batch_contract_calls, get_block_number
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 100
+DEFAULT_WORKERS = 8
+
+
+def schain_name_to_id(name):
+    from web3 import Web3
+    return Web3.keccak(text=name)
+
+
+def has_function(contract, fn_name):
+    return any(item.get('type') == 'function' and item['name'] == fn_name
+               for item in contract.abi)
+
+
+def status_calls(skale):
+    """ (field, contract, function) read for every sChain, optional ones if in ABI """
+    calls = [('dkg_successful', skale.dkg.contract, 'isLastDKGSuccessful')]
+    if has_function(skale.dkg.contract, 'isChannelOpened'):
+        calls.append(('dkg_in_progress', skale.dkg.contract, 'isChannelOpened'))
+    node_rotation = getattr(skale, 'node_rotation', None)
+    if node_rotation is not None and has_function(node_rotation.contract,
+                                                  'isRotationInProgress'):
+        calls.append(('rotation_in_progress', node_rotation.contract, 'isRotationInProgress'))
+    return calls
+
+
+def fetch_chunk(skale, endpoint, schains, calls, block_number):
+    """ schains is a list of (name or None, id), names are read if unknown """
+    schains_internal = skale.schains_internal.contract
+    requests = []
+    for name, schain_id in schains:
+        if name is None:
+            requests.append((schains_internal, 'schains', [schain_id]))
+        requests.extend((contract, fn_name, [schain_id]) for _, contract, fn_name in calls)
+    results = iter(batch_contract_calls(endpoint, skale.web3, requests,
+                                        block_number=block_number, workers=1))
+    records = []
+    for name, schain_id in schains:
+        record = {
+            'name': next(results)[0] if name is None else name,
+            'id': '0x' + bytes(schain_id).hex()
+        }
+        record.update((field, next(results)) for field, _, _ in calls)
+        records.append(record)
+    return records
+
+
+def iter_dkg_status(skale, endpoint, names=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                    workers=DEFAULT_WORKERS):
+    """ Yields DKG status records of given (by default all) sChains in completion order """
+    block_number = get_block_number(endpoint)
+    if names:
+        schains = [(name, schain_name_to_id(name)) for name in names]
+    else:
+        schain_ids, = batch_contract_calls(
+            endpoint, skale.web3,
+            [(skale.schains_internal.contract, 'getSchains', [])],
+            block_number=block_number
+        )
+        schains = [(None, schain_id) for schain_id in schain_ids]
+    calls = status_calls(skale)
+    logger.info(f'Reading DKG status of {len(schains)} sChains at block {block_number}')
+    chunks = [schains[i:i + chunk_size] for i in range(0, len(schains), chunk_size)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(fetch_chunk, skale, endpoint, chunk, calls, block_number)
+            for chunk in chunks
+        ]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def is_failed(record):
+    return not record['dkg_successful']
+
+
+def format_status(record):
+    line = f'{record["name"]}: {"ok" if record["dkg_successful"] else "FAILED"}'
+    if record.get('dkg_in_progress'):
+        line += ', DKG in progress'
+    if record.get('rotation_in_progress'):
+        line += ', rotation in progress'
+    return line
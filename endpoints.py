@@ -1,33 +1,43 @@
 # pip install web3==5.13.1
 # Usage: ENDPOINT= ABI_FILEPATH= RESULTS_PATH= python endpoints.py
+# Set PROFILE_RPC=table or PROFILE_RPC=json to print RPC stats at exit
+# Set PROFILE=cpu, PROFILE=memory or PROFILE=all to save profiles next to RESULTS_PATH
+# Set RECORD_RPC=trace.jsonl.gz to record RPC traffic or REPLAY_RPC=trace.jsonl.gz to replay it
+# Set READ_ENDPOINTS=url1,url2 to spread reads across more nodes
+# (RPC_LB_STRATEGY=latency to pick by latency)
+# Set HEDGE_PERCENTILE=95 to duplicate reads slower than p95 (HEDGE_BUDGET=0.05 caps extra requests)
+# Port audit is saved to RESULTS_PATH with -ports.json suffix
+# (PORTS_AUDIT_PATH to change, empty to skip)
 
 import os
 import json
-import socket
-from enum import Enum
 
 from web3 import Web3, HTTPProvider
 from Crypto.Hash import keccak
 
+import port_engine
+import py_profile
+import rpc_hedge
+import rpc_pool
+import rpc_profile
+import rpc_trace
+from abi_cache import load_abi
+from topology import add_schain_ports, ip_from_bytes
+
 
 ENDPOINT = os.environ['ENDPOINT']
 ABI_FILEPATH = os.environ['ABI_FILEPATH']
 RESULTS_PATH = os.environ['RESULTS_PATH']
-
-PORTS_PER_SCHAIN = 64
-
-
-class SkaledPorts(Enum):
-    PROPOSAL = 0
-    CATCHUP = 1
-    WS_JSON = 2
-    HTTP_JSON = 3
-    BINARY_CONSENSUS = 4
-    ZMQ_BROADCAST = 5
-    IMA_MONITORING = 6
-    WSS_JSON = 7
-    HTTPS_JSON = 8
-    INFO_HTTP_JSON = 9
+PROFILE_RPC = os.environ.get('PROFILE_RPC')
+PROFILE = os.environ.get('PROFILE')
+RECORD_RPC = os.environ.get('RECORD_RPC')
+REPLAY_RPC = os.environ.get('REPLAY_RPC')
+READ_ENDPOINTS = [url for url in os.environ.get('READ_ENDPOINTS', '').split(',') if url]
+RPC_LB_STRATEGY = os.environ.get('RPC_LB_STRATEGY', 'least-outstanding')
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', 0))
+HEDGE_BUDGET = float(os.environ.get('HEDGE_BUDGET', 0.05))
+PORTS_AUDIT_PATH = os.environ.get('PORTS_AUDIT_PATH',
+                                  os.path.splitext(RESULTS_PATH)[0] + '-ports.json')
 
 
 def read_json(path, mode='r'):
@@ -45,47 +55,10 @@ def schain_name_to_id(name):
     return '0x' + keccak_hash.hexdigest()
 
 
-def ip_from_bytes(bytes):
-    return socket.inet_ntoa(bytes)
-
-
-def get_schain_index_in_node(schain_id, schains_ids_on_node):
-    for index, schain_id_on_node in enumerate(schains_ids_on_node):
-        if schain_id == schain_id_on_node:
-            return index
-    raise Exception(f'sChain {schain_id} is not found in the list: {schains_ids_on_node}')
-
-
-def get_schain_base_port_on_node(schain_id, schains_ids_on_node, node_base_port):
-    schain_index = get_schain_index_in_node(schain_id, schains_ids_on_node)
-    return calc_schain_base_port(node_base_port, schain_index)
-
-
-def calc_schain_base_port(node_base_port, schain_index):
-    return node_base_port + schain_index * PORTS_PER_SCHAIN
-
-
-def calc_ports(schain_base_port):
-    return {
-        'httpRpcPort': schain_base_port + SkaledPorts.HTTP_JSON.value,
-        'httpsRpcPort': schain_base_port + SkaledPorts.HTTPS_JSON.value,
-        'wsRpcPort': schain_base_port + SkaledPorts.WS_JSON.value,
-        'wssRpcPort': schain_base_port + SkaledPorts.WSS_JSON.value,
-        'infoHttpRpcPort': schain_base_port + SkaledPorts.INFO_HTTP_JSON.value
-    }
-
-
-def compose_endpoints(node_dict, endpoint_type):
-    node_dict[f'http_endpoint_{endpoint_type}'] = f'http://{node_dict[endpoint_type]}:{node_dict["httpRpcPort"]}'
-    node_dict[f'https_endpoint_{endpoint_type}'] = f'https://{node_dict[endpoint_type]}:{node_dict["httpsRpcPort"]}'
-    node_dict[f'ws_endpoint_{endpoint_type}'] = f'ws://{node_dict[endpoint_type]}:{node_dict["wsRpcPort"]}'
-    node_dict[f'wss_endpoint_{endpoint_type}'] = f'wss://{node_dict[endpoint_type]}:{node_dict["wssRpcPort"]}'
-    node_dict[f'info_http_endpoint_{endpoint_type}'] = f'http://{node_dict[endpoint_type]}:{node_dict["infoHttpRpcPort"]}'
-
-
-def endpoints_for_schain(schains_internal_contract, nodes_contract, schain_id):
+def endpoints_for_schain(schains_internal_contract, nodes_contract, schain_id, audit_nodes=None):
     node_ids = schains_internal_contract.functions.getNodesInGroup(schain_id).call()
     nodes = []
+    schains_ids_on_nodes = []
     for node_id in node_ids:
         node = nodes_contract.functions.nodes(node_id).call()
         node_dict = {
@@ -96,13 +69,12 @@ def endpoints_for_schain(schains_internal_contract, nodes_contract, schain_id):
             'domain': nodes_contract.functions.getNodeDomainName(node_id).call()
         }
         schain_ids = schains_internal_contract.functions.getSchainIdsForNode(node_id).call()
-        node_dict['schain_base_port'] = get_schain_base_port_on_node(schain_id, schain_ids, node_dict['base_port'])
-        node_dict.update(calc_ports(node_dict['schain_base_port']))
-
-        compose_endpoints(node_dict, endpoint_type='ip')
-        compose_endpoints(node_dict, endpoint_type='domain')
-
+        schains_ids_on_nodes.append(schain_ids)
         nodes.append(node_dict)
+        if audit_nodes is not None:
+            audit_nodes[node_id] = {'id': node_id, 'ip': node_dict['ip'],
+                                    'port': node_dict['base_port'], 'schain_ids': schain_ids}
+    add_schain_ports(nodes, schain_id, schains_ids_on_nodes)
     return {
         'schain': schains_internal_contract.functions.schains(schain_id).call(),
         'nodes': nodes
@@ -112,15 +84,43 @@ def endpoints_for_schain(schains_internal_contract, nodes_contract, schain_id):
 def endpoints_for_all_schains():
     provider = HTTPProvider(ENDPOINT)
     web3 = Web3(provider)
-    sm_abi = read_json(ABI_FILEPATH)
+    sm_abi = load_abi(ABI_FILEPATH)
+    rpc_pool.install(web3)
+    rpc_hedge.install(web3)
+    rpc_trace.install(web3)
+    profiler = rpc_profile.get_profiler()
+    if profiler:
+        profiler.install(web3)
+        profiler.add_abi(sm_abi)
 
     schains_internal_contract = web3.eth.contract(address=sm_abi['schains_internal_address'], abi=sm_abi['schains_internal_abi'])
     nodes_contract = web3.eth.contract(address=sm_abi['nodes_address'], abi=sm_abi['nodes_abi'])
     schain_ids = schains_internal_contract.functions.getSchains().call()
 
-    all_endpoints = [endpoints_for_schain(schains_internal_contract, nodes_contract, schain_id) for schain_id in schain_ids]
+    audit_nodes = {}
+    all_endpoints = [
+        endpoints_for_schain(schains_internal_contract, nodes_contract, schain_id, audit_nodes)
+        for schain_id in schain_ids
+    ]
     write_json(RESULTS_PATH, all_endpoints)
+    if PORTS_AUDIT_PATH:
+        result = port_engine.audit(audit_nodes.values())
+        write_json(PORTS_AUDIT_PATH, result)
+        print(port_engine.format_audit(result))
 
 
 if __name__ == '__main__':
+    if PROFILE:
+        py_profile.start(cpu=PROFILE in ('cpu', 'all'), memory=PROFILE in ('memory', 'all'),
+                         output_dir=os.path.dirname(os.path.abspath(RESULTS_PATH)))
+    if PROFILE_RPC:
+        rpc_profile.enable(PROFILE_RPC)
+    if RECORD_RPC:
+        rpc_trace.enable(rpc_trace.RECORD, RECORD_RPC)
+    elif REPLAY_RPC:
+        rpc_trace.enable(rpc_trace.REPLAY, REPLAY_RPC)
+    if READ_ENDPOINTS:
+        rpc_pool.enable(ENDPOINT, READ_ENDPOINTS, RPC_LB_STRATEGY)
+    if HEDGE_PERCENTILE:
+        rpc_hedge.enable(HEDGE_PERCENTILE, HEDGE_BUDGET)
     endpoints_for_all_schains()
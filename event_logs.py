@@ -0,0 +1,230 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Chunked and parallel eth_getLogs helpers.
+
+LogScanner fetches block ranges in parallel and adapts the range size:
+a range that fails because it's too wide (too many results, response too
+large, read timeout) is split in half and the chunk size is halved, ranges
+with few logs double it. Other errors (connection refused, auth, unknown
+method) are raised at once.
+Chunks are yielded in block order, so consumers can checkpoint after each one.
+"""
+
+import json
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from batch_rpc import DEFAULT_WORKERS, BatchRPCError, batch_request, block_tag
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOGS_CHUNK_SIZE = 10000
+MIN_LOGS_CHUNK_SIZE = 1
+MAX_LOGS_CHUNK_SIZE = 500000
+TARGET_LOGS_PER_CHUNK = 2000
+# JSON-RPC error messages of nodes and providers for too wide ranges
+RANGE_ERROR_MESSAGES = (
+    'more than', 'too many', 'too wide', 'too large', 'block range', 'response size',
+    'size exceeded', 'timeout', 'timed out'
+)
+# payload too large, gateway timeout
+RANGE_ERROR_STATUS_CODES = (413, 504)
+
+
+def is_range_error(err):
+    """ True if the range should be split: too many results, too large response or timeout """
+    from requests.exceptions import ReadTimeout
+
+    if isinstance(err, ReadTimeout):
+        return True
+    status = getattr(getattr(err, 'response', None), 'status_code', None)
+    if status in RANGE_ERROR_STATUS_CODES:
+        return True
+    if not isinstance(err, BatchRPCError):
+        return False
+    message = str(err).lower()
+    return any(pattern in message for pattern in RANGE_ERROR_MESSAGES)
+
+
+def event_abis(contract, event_names=None):
+    from eth_utils import event_abi_to_log_topic
+    from hexbytes import HexBytes
+
+    return {
+        HexBytes(event_abi_to_log_topic(item)): item
+        for item in contract.abi
+        if item.get('type') == 'event' and
+        (event_names is None or item['name'] in event_names)
+    }
+
+
+class LogScanner:
+    def __init__(self, endpoint, address, topics, chunk_size=DEFAULT_LOGS_CHUNK_SIZE,
+                 workers=DEFAULT_WORKERS, min_chunk_size=MIN_LOGS_CHUNK_SIZE,
+                 max_chunk_size=MAX_LOGS_CHUNK_SIZE, target_logs=TARGET_LOGS_PER_CHUNK):
+        self.endpoint = endpoint
+        self.address = address
+        self.topics = topics
+        self.chunk_size = chunk_size
+        self.workers = max(1, workers)
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.target_logs = target_logs
+
+    def fetch(self, start, end):
+        result, = batch_request(self.endpoint, [('eth_getLogs', [{
+            'address': self.address,
+            'topics': self.topics,
+            'fromBlock': block_tag(start),
+            'toBlock': block_tag(end)
+        }])], workers=1)
+        return result
+
+    def _adapt(self, logs_number):
+        if logs_number < self.target_logs // 2:
+            self.chunk_size = min(self.chunk_size * 2, self.max_chunk_size)
+        elif logs_number > self.target_logs:
+            self.chunk_size = max(self.chunk_size // 2, self.min_chunk_size)
+
+    def scan(self, from_block, to_block):
+        """ Yields (start, end, logs) for consecutive ranges covering [from_block, to_block] """
+        next_block, expected = from_block, from_block
+        pending, done = {}, {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while expected <= to_block:
+                while len(pending) < self.workers and next_block <= to_block:
+                    end = min(next_block + self.chunk_size - 1, to_block)
+                    pending[executor.submit(self.fetch, next_block, end)] = (next_block, end)
+                    next_block = end + 1
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    start, end = pending.pop(future)
+                    try:
+                        logs = future.result()
+                    except Exception as err:
+                        if start == end or not is_range_error(err):
+                            raise
+                        self.chunk_size = max(min(self.chunk_size, end - start + 1) // 2,
+                                              self.min_chunk_size)
+                        middle = (start + end) // 2
+                        logger.info(f'eth_getLogs for {start}-{end} failed ({err}), '
+                                    f'splitting, chunk size {self.chunk_size}')
+                        for part in ((start, middle), (middle + 1, end)):
+                            pending[executor.submit(self.fetch, *part)] = part
+                        continue
+                    self._adapt(len(logs))
+                    done[start] = (end, logs)
+                while expected in done:
+                    end, logs = done.pop(expected)
+                    yield expected, end, sort_logs(logs)
+                    expected = end + 1
+
+
+def sort_logs(logs):
+    return sorted(logs, key=lambda log: (int(log['blockNumber'], 16),
+                                         int(log['logIndex'], 16)))
+
+
+def load_checkpoint(path):
+    if path and os.path.isfile(path):
+        with open(path) as checkpoint_file:
+            return json.load(checkpoint_file)['last_block']
+    return None
+
+
+def save_checkpoint(path, last_block):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as checkpoint_file:
+        json.dump({'last_block': last_block}, checkpoint_file)
+    os.replace(tmp_path, path)
+
+
+def get_logs(endpoint, address, topics, from_block, to_block,
+             chunk_size=DEFAULT_LOGS_CHUNK_SIZE, workers=DEFAULT_WORKERS):
+    """ Returns raw logs for [from_block, to_block] fetched in parallel chunks """
+    logger.info(f'Fetching logs for blocks {from_block}-{to_block}')
+    scanner = LogScanner(endpoint, address, topics, chunk_size=chunk_size, workers=workers)
+    return [
+        log
+        for _, _, logs in scanner.scan(from_block, to_block)
+        for log in logs
+    ]
+
+
+def decode_logs(web3, abis, logs):
+    """ Decodes raw logs using {topic: event_abi} mapping """
+    from hexbytes import HexBytes
+    from web3._utils.events import get_event_data
+
+    for log in logs:
+        topic = HexBytes(log['topics'][0])
+        event_abi = abis.get(topic)
+        if event_abi is None:
+            continue
+        log = {
+            **log,
+            'topics': [HexBytes(t) for t in log['topics']],
+            'blockNumber': int(log['blockNumber'], 16),
+            'logIndex': int(log['logIndex'], 16),
+            'transactionIndex': int(log['transactionIndex'], 16)
+        }
+        yield get_event_data(web3.codec, event_abi, log)
+
+
+def iter_contract_event_chunks(endpoint, web3, contract, from_block, to_block,
+                               event_names=None, chunk_size=DEFAULT_LOGS_CHUNK_SIZE,
+                               workers=DEFAULT_WORKERS):
+    """ Yields (start, end, decoded events) for consecutive block ranges """
+    from web3 import Web3
+
+    abis = event_abis(contract, event_names)
+    topics = [[Web3.toHex(topic) for topic in abis]]
+    scanner = LogScanner(endpoint, contract.address, topics,
+                         chunk_size=chunk_size, workers=workers)
+    for start, end, logs in scanner.scan(from_block, to_block):
+        yield start, end, list(decode_logs(web3, abis, logs))
+
+
+def iter_contract_events(endpoint, web3, contract, from_block, to_block,
+                         event_names=None, chunk_size=DEFAULT_LOGS_CHUNK_SIZE,
+                         workers=DEFAULT_WORKERS, checkpoint_path=None):
+    """
+    Yields decoded events in block order. With checkpoint_path the last
+    processed block is saved after each chunk and the scan resumes from it.
+    """
+    last_block = load_checkpoint(checkpoint_path)
+    if last_block is not None:
+        from_block = max(from_block, last_block + 1)
+    chunks = iter_contract_event_chunks(endpoint, web3, contract, from_block, to_block,
+                                        event_names, chunk_size, workers)
+    for _, end, events in chunks:
+        yield from events
+        if checkpoint_path:
+            save_checkpoint(checkpoint_path, end)
+
+
+def get_contract_events(endpoint, web3, contract, from_block, to_block,
+                        event_names=None, chunk_size=DEFAULT_LOGS_CHUNK_SIZE,
+                        workers=DEFAULT_WORKERS):
+    return iter_contract_events(endpoint, web3, contract, from_block, to_block,
+                                event_names=event_names, chunk_size=chunk_size,
+                                workers=workers)
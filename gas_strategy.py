@@ -0,0 +1,179 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Gas price and gas estimate caching for repetitive transactions.
+
+GasStrategy is installed as the innermost Web3 middleware, so it sees raw
+JSON-RPC responses of every request. eth_gasPrice is served from cache until
+a new block is seen (skale.py checks the latest block before requests) or the
+TTL expires. With estimate memoization eth_estimateGas results are reused for
+calls of the same function from the same sender with the same calldata size,
+increased by a safety margin. Sending failures and reverted receipts drop the
+memoized estimate, so the next call is estimated again.
+"""
+
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GAS_PRICE_TTL = 15
+DEFAULT_ESTIMATE_TTL = 300
+ESTIMATE_MARGIN = 1.1
+
+
+def estimate_key(tx):
+    """ Contract, sender, function selector and calldata size (argument shape) """
+    data = tx.get('data') or tx.get('input') or '0x'
+    return (
+        (tx.get('to') or '').lower(),
+        (tx.get('from') or '').lower(),
+        data[:10],
+        len(data),
+        int(tx.get('value') or '0x0', 16) > 0
+    )
+
+
+class GasStrategy:
+    def __init__(self, price_ttl=DEFAULT_GAS_PRICE_TTL, memoize_estimates=False,
+                 estimate_ttl=DEFAULT_ESTIMATE_TTL, margin=ESTIMATE_MARGIN):
+        self.price_ttl = price_ttl
+        self.memoize_estimates = memoize_estimates
+        self.estimate_ttl = estimate_ttl
+        self.margin = margin
+        self.block_number = None
+        self._price = None
+        self._estimates = {}
+        self._tx_keys = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.price_hits = self.price_misses = 0
+        self.estimate_hits = self.estimate_misses = 0
+        self.invalidations = 0
+
+    def observe_block(self, number):
+        number = int(number, 16)
+        with self._lock:
+            if self.block_number is None or number > self.block_number:
+                self.block_number = number
+
+    def _cached_price(self):
+        with self._lock:
+            if self._price is None:
+                return None
+            value, block_number, fetched_at = self._price
+            if block_number != self.block_number or \
+                    time.monotonic() - fetched_at > self.price_ttl:
+                return None
+            return value
+
+    def _gas_price(self, make_request, method, params):
+        price = self._cached_price()
+        if price is not None:
+            self.price_hits += 1
+            return {'jsonrpc': '2.0', 'id': 0, 'result': price}
+        self.price_misses += 1
+        response = make_request(method, params)
+        if 'error' not in response:
+            with self._lock:
+                self._price = (response['result'], self.block_number, time.monotonic())
+        return response
+
+    def _estimate(self, make_request, method, params):
+        key = estimate_key(params[0])
+        self._local.key = key
+        with self._lock:
+            cached = self._estimates.get(key)
+        if cached and time.monotonic() - cached[1] <= self.estimate_ttl:
+            self.estimate_hits += 1
+            return {'jsonrpc': '2.0', 'id': 0,
+                    'result': hex(int(cached[0] * self.margin))}
+        self.estimate_misses += 1
+        response = make_request(method, params)
+        if 'error' not in response:
+            gas = int(response['result'], 16)
+            with self._lock:
+                previous = self._estimates.get(key)
+                # keep the largest estimate seen for this shape
+                if previous and time.monotonic() - previous[1] <= self.estimate_ttl:
+                    gas = max(gas, previous[0])
+                self._estimates[key] = (gas, time.monotonic())
+        return response
+
+    def invalidate(self, key):
+        if key is None:
+            return
+        with self._lock:
+            if self._estimates.pop(key, None) is not None:
+                self.invalidations += 1
+                logger.info(f'Gas estimate for {key[2]} on {key[0]} dropped, '
+                            f'next call will be estimated')
+
+    def _after_send(self, response):
+        key = getattr(self._local, 'key', None)
+        self._local.key = None
+        if 'error' in response:
+            self.invalidate(key)
+        elif key is not None:
+            with self._lock:
+                self._tx_keys[response['result']] = key
+
+    def _after_receipt(self, params, response):
+        receipt = response.get('result')
+        if not receipt:
+            return
+        with self._lock:
+            key = self._tx_keys.pop(params[0], None)
+        if int(receipt.get('status') or '0x1', 16) == 0:
+            self.invalidate(key)
+
+    def middleware(self, make_request, web3):
+        def middleware(method, params):
+            if method == 'eth_gasPrice' and self.price_ttl:
+                return self._gas_price(make_request, method, params)
+            if method == 'eth_estimateGas' and self.memoize_estimates:
+                return self._estimate(make_request, method, params)
+
+            response = make_request(method, params)
+            result = response.get('result')
+            if method == 'eth_blockNumber' and result:
+                self.observe_block(result)
+            elif method == 'eth_getBlockByNumber' and params[0] == 'latest' and result:
+                self.observe_block(result['number'])
+            elif method == 'eth_sendRawTransaction' and self.memoize_estimates:
+                self._after_send(response)
+            elif method == 'eth_getTransactionReceipt' and self.memoize_estimates:
+                self._after_receipt(params, response)
+            return response
+        return middleware
+
+    def install(self, web3):
+        web3.middleware_onion.inject(self.middleware, name='gas_strategy', layer=0)
+
+    def stats(self):
+        return {
+            'price_hits': self.price_hits,
+            'price_misses': self.price_misses,
+            'estimate_hits': self.estimate_hits,
+            'estimate_misses': self.estimate_misses,
+            'invalidations': self.invalidations,
+            'memoized_estimates': len(self._estimates)
+        }
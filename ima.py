@@ -22,17 +22,19 @@ import json
 
 import click
 
-from ima_predeployed.generator import generate_abi
-from skale import Skale, SkaleIma
-from skale.utils.helper import init_default_logger
-
 from config import ENDPOINT, ABI_FILEPATH, IMA_ABI_FILEPATH
-from utils import init_wallet
+from py_profile import profile_option
+from rpc_profile import profile_rpc_option
+from rpc_trace import rpc_trace_options
+from utils import LazyClients, init_default_logger
 
 init_default_logger()
 
 
 @click.group()
+@profile_option
+@profile_rpc_option
+@rpc_trace_options
 @click.option('--endpoint', default=ENDPOINT, help='Skale manager endpoint')
 @click.option('--abi-filepath', default=ABI_FILEPATH, type=click.Path(),
               help='ABI file')
@@ -40,10 +42,7 @@ init_default_logger()
               help='IMA ABI file')
 @click.pass_context
 def main(ctx, endpoint, abi_filepath, ima_abi_filepath):
-    ctx.ensure_object(dict)
-    wallet = init_wallet(endpoint)
-    ctx.obj['skale'] = Skale(endpoint, abi_filepath, wallet)
-    ctx.obj['skale_ima'] = SkaleIma(endpoint, ima_abi_filepath, wallet)
+    ctx.obj = LazyClients(endpoint, abi_filepath, ima_abi_filepath)
 
 
 @main.command()
@@ -60,6 +59,8 @@ def register_schain(ctx, schain_name, skip_dry_run):
 @click.argument('out_file')
 @click.pass_context
 def schain_ima_abi(ctx, out_file):
+    from ima_predeployed.generator import generate_abi
+
     abi = generate_abi()
     with open(out_file, 'w') as out:
         json.dump(abi, out)
@@ -23,15 +23,12 @@ import os
 
 import click
 
-from skale import Skale
-from skale.utils.helper import ip_from_bytes, init_default_logger
-from skale.utils.constants import LONG_LINE
-from skale.contracts.manager.nodes import NodeStatus
-
-from skale.utils.contracts_provision.main import add_all_permissions
-
-from utils import init_wallet, generate_random_node_data
+from utils import (LONG_LINE, LazyClients, generate_random_node_data,
+                   init_default_logger, ip_from_bytes)
 from config import ENDPOINT, ABI_FILEPATH
+from py_profile import profile_option
+from rpc_profile import profile_rpc_option
+from rpc_trace import rpc_trace_options
 
 
 init_default_logger()
@@ -44,14 +41,15 @@ def create_node(skale):
 
 
 @click.group()
+@profile_option
+@profile_rpc_option
+@rpc_trace_options
 @click.option('--endpoint', default=ENDPOINT, help='Skale manager endpoint')
 @click.option('--abi-filepath', default=ABI_FILEPATH, type=click.Path(),
               help='abi file')
 @click.pass_context
 def main(ctx, endpoint, abi_filepath):
-    ctx.ensure_object(dict)
-    wallet = init_wallet(endpoint)
-    ctx.obj['skale'] = Skale(endpoint, abi_filepath, wallet)
+    ctx.obj = LazyClients(endpoint, abi_filepath)
 
 
 @main.command()
@@ -112,6 +110,8 @@ def schains_by_node(ctx, save_to):
 @click.pass_context
 def show(ctx, all_nodes):
     """ Command to show id name and ip of active nodes """
+    from skale.contracts.manager.nodes import NodeStatus
+
     skale = ctx.obj['skale']
 
     if all_nodes:  # todo: tmp fix, remove it later
@@ -134,13 +134,15 @@ def show(ctx, all_nodes):
 
 @main.command()
 @click.argument('node-name')
+@click.option('--gas-price', type=int, default=None,
+              help='Gas price in wei (current network gas price by default)')
 @click.pass_context
-def remove(ctx, node_name):
+def remove(ctx, node_name, gas_price):
     """ Command to remove node spcified by name """
     skale = ctx.obj['skale']
 
     node_id = skale.nodes.node_name_to_index(node_name)
-    skale.manager.node_exit(node_id, wait_for=True, gas_price=4500000000)
+    skale.manager.node_exit(node_id, wait_for=True, gas_price=gas_price)
     # skale.manager.delete_node_by_root(node_id, wait_for=True)
 
 
@@ -160,6 +162,8 @@ def remove_all(ctx):
 @click.argument('address')
 @click.pass_context
 def all_permissions(ctx, address):
+    from skale.utils.contracts_provision.main import add_all_permissions
+
     skale = ctx.obj['skale']
     add_all_permissions(skale, address)
 
@@ -0,0 +1,155 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Local nonce management for sending several transactions from one address.
+
+NonceManager hands out nonces atomically, reuses nonces of transactions that
+failed to send (so they don't leave gaps) and resyncs from
+eth_getTransactionCount(pending) on nonce errors. manage_nonces applies it
+to a skale.py wallet, so concurrent threads can share one wallet.
+RPCWallet sends through the transactions manager, which sequences nonces
+itself, so only its calls are passed through.
+"""
+
+import heapq
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+NONCE_ERRORS = ('nonce too low', 'already known', 'known transaction',
+                'replacement transaction underpriced', 'invalid nonce')
+MAX_NONCE_RETRIES = 3
+# geth and skaled require at least 10% higher gas price to replace a transaction
+REPLACEMENT_GAS_PRICE_BUMP = 1.125
+
+
+def is_nonce_error(err):
+    message = str(err).lower()
+    return any(pattern in message for pattern in NONCE_ERRORS)
+
+
+def is_tm_wallet(wallet):
+    """ Transactions manager assigns nonces on its side """
+    return wallet.__class__.__name__ == 'RPCWallet'
+
+
+def replacement_gas_price(gas_price):
+    return int(gas_price * REPLACEMENT_GAS_PRICE_BUMP) + 1
+
+
+class NonceManager:
+    def __init__(self, web3, address):
+        self.web3 = web3
+        self.address = address
+        self.next_nonce = None
+        self.sent = {}
+        self._gaps = []
+        self._lock = threading.Lock()
+
+    def _pending_count(self):
+        return self.web3.eth.getTransactionCount(self.address, 'pending')
+
+    def sync(self):
+        """ Restarts numbering from the pending count of the node """
+        pending = self._pending_count()
+        with self._lock:
+            self.sent = {nonce: tx for nonce, tx in self.sent.items() if nonce >= pending}
+            self.next_nonce = max([pending] + [nonce + 1 for nonce in self.sent])
+            self._gaps = [nonce for nonce in self._gaps if pending <= nonce < self.next_nonce]
+            heapq.heapify(self._gaps)
+        logger.info(f'Nonce for {self.address} synced: pending {pending}, '
+                    f'next {self.next_nonce}')
+
+    def reserve(self):
+        """ Returns the lowest nonce not taken by this process """
+        if self.next_nonce is None:
+            self.sync()
+        with self._lock:
+            if self._gaps:
+                return heapq.heappop(self._gaps)
+            nonce = self.next_nonce
+            self.next_nonce += 1
+            return nonce
+
+    def confirm(self, nonce, tx_hash):
+        with self._lock:
+            self.sent[nonce] = tx_hash
+
+    def release(self, nonce, err=None):
+        """ Returns nonce of a transaction that wasn't sent """
+        if err is not None and is_nonce_error(err):
+            # the nonce is used on chain (e.g. by another process), start over from the node
+            logger.warning(f'Nonce {nonce} for {self.address} rejected: {err}')
+            with self._lock:
+                self.next_nonce = None
+                self.sent.clear()
+                self._gaps = []
+            return
+        with self._lock:
+            if self.next_nonce is not None and nonce == self.next_nonce - 1:
+                self.next_nonce = nonce
+            else:
+                heapq.heappush(self._gaps, nonce)
+
+    def forget(self, nonce):
+        """ Removes mined transaction from the local state """
+        with self._lock:
+            self.sent.pop(nonce, None)
+
+
+def manage_nonces(wallet, web3=None):
+    """
+    Makes wallet safe to share between sending threads: transactions without
+    a nonce get one from wallet.nonce_manager, signing with a hardware wallet
+    is serialized. The wallet object is patched in place, so it stays
+    usable wherever skale.py expects a wallet.
+    """
+    if hasattr(wallet, 'nonce_manager'):
+        return wallet
+    nonces = None if is_tm_wallet(wallet) else \
+        NonceManager(web3 or wallet._web3, wallet.address)
+    sign_lock = threading.Lock() if wallet.__class__.__name__ == 'LedgerWallet' else None
+    sign_and_send = wallet.sign_and_send
+
+    def send(tx_dict, *args, **kwargs):
+        if sign_lock is None:
+            return sign_and_send(tx_dict, *args, **kwargs)
+        with sign_lock:
+            return sign_and_send(tx_dict, *args, **kwargs)
+
+    def managed_sign_and_send(tx_dict, *args, **kwargs):
+        if nonces is None or tx_dict.get('nonce') is not None:
+            return send(tx_dict, *args, **kwargs)
+        for attempt in range(MAX_NONCE_RETRIES):
+            nonce = nonces.reserve()
+            try:
+                tx_hash = send({**tx_dict, 'nonce': nonce}, *args, **kwargs)
+            except Exception as err:
+                nonces.release(nonce, err)
+                if is_nonce_error(err) and attempt < MAX_NONCE_RETRIES - 1:
+                    continue
+                raise
+            nonces.confirm(nonce, tx_hash)
+            return tx_hash
+
+    wallet.nonce_manager = nonces
+    wallet.sign_and_send = managed_sign_and_send
+    return wallet
@@ -0,0 +1,164 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Vectorised sChain port allocation.
+
+Every node <-> sChain membership is a row: node base port and the index of
+the sChain in the node's sChain list. Base ports and ports of all SkaledPorts
+are computed for all rows at once. Audit checks that port ranges of sChains
+on the same host (nodes sharing an IP included) don't overlap and that all
+ports fit into the valid range.
+"""
+
+from enum import Enum
+
+import numpy as np
+
+
+PORTS_PER_SCHAIN = 64
+MAX_PORT = 65535
+
+
+class SkaledPorts(Enum):
+    PROPOSAL = 0
+    CATCHUP = 1
+    WS_JSON = 2
+    HTTP_JSON = 3
+    BINARY_CONSENSUS = 4
+    ZMQ_BROADCAST = 5
+    IMA_MONITORING = 6
+    WSS_JSON = 7
+    HTTPS_JSON = 8
+    INFO_HTTP_JSON = 9
+
+
+PORT_NAMES = [port.name for port in SkaledPorts]
+PORT_OFFSETS = np.array([port.value for port in SkaledPorts], dtype=np.int64)
+# port columns of the endpoints.py format
+ENDPOINT_PORTS = {
+    'httpRpcPort': SkaledPorts.HTTP_JSON,
+    'httpsRpcPort': SkaledPorts.HTTPS_JSON,
+    'wsRpcPort': SkaledPorts.WS_JSON,
+    'wssRpcPort': SkaledPorts.WSS_JSON,
+    'infoHttpRpcPort': SkaledPorts.INFO_HTTP_JSON
+}
+
+
+def schain_base_ports(node_base_ports, schain_indexes):
+    return np.asarray(node_base_ports, dtype=np.int64) + \
+        np.asarray(schain_indexes, dtype=np.int64) * PORTS_PER_SCHAIN
+
+
+def port_matrix(base_ports):
+    """ rows x len(SkaledPorts) matrix, columns are ordered as PORT_NAMES """
+    return np.asarray(base_ports, dtype=np.int64)[:, None] + PORT_OFFSETS[None, :]
+
+
+def port_rows(base_ports):
+    """ {SkaledPorts name: port} for every base port """
+    return [dict(zip(PORT_NAMES, row)) for row in port_matrix(base_ports).tolist()]
+
+
+def endpoint_port_rows(base_ports):
+    """ endpoints.py port fields for every base port """
+    matrix = port_matrix(base_ports).tolist()
+    return [{key: row[port.value] for key, port in ENDPOINT_PORTS.items()} for row in matrix]
+
+
+def schain_id_hex(schain_id):
+    return schain_id if isinstance(schain_id, str) else '0x' + bytes(schain_id).hex()
+
+
+def membership(nodes):
+    """
+    Flattens nodes ({'id', 'ip', 'port', 'schain_ids'}) to membership rows:
+    returns (node ids, host codes, host names, node base ports, sChain indexes, sChain ids)
+    """
+    nodes = list(nodes)
+    counts = np.array([len(node['schain_ids']) for node in nodes], dtype=np.int64)
+    starts = np.cumsum(counts) - counts
+    schain_indexes = np.arange(counts.sum()) - np.repeat(starts, counts)
+    node_ids = np.repeat(np.array([node['id'] for node in nodes], dtype=np.int64), counts)
+    host_names, host_codes = np.unique([node['ip'] for node in nodes], return_inverse=True)
+    hosts = np.repeat(host_codes.reshape(-1), counts)
+    base_ports = np.repeat(np.array([node['port'] for node in nodes], dtype=np.int64), counts)
+    schain_ids = [schain_id for node in nodes for schain_id in node['schain_ids']]
+    return node_ids, hosts, host_names, base_ports, schain_indexes, schain_ids
+
+
+def find_conflicts(hosts, host_names, starts, node_ids, schain_ids):
+    """
+    Rows whose [start, start + PORTS_PER_SCHAIN) range overlaps the next range
+    on the same host or leaves the valid port range
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    order = np.lexsort((starts, hosts))
+    sorted_hosts = hosts[order]
+    sorted_starts = starts[order]
+    # all ranges have the same width, so it's enough to compare neighbours
+    overlaps = np.nonzero(
+        (sorted_hosts[1:] == sorted_hosts[:-1]) &
+        (sorted_starts[1:] < sorted_starts[:-1] + PORTS_PER_SCHAIN)
+    )[0]
+    conflicts = []
+    for i in overlaps.tolist():
+        rows = [int(order[i]), int(order[i + 1])]
+        conflicts.append({
+            'type': 'overlap',
+            'host': str(host_names[hosts[rows[0]]]),
+            'ports': [int(starts[row]) for row in rows],
+            'nodes': [int(node_ids[row]) for row in rows],
+            'schains': [schain_id_hex(schain_ids[row]) for row in rows]
+        })
+    last_ports = starts + int(PORT_OFFSETS.max())
+    for row in np.nonzero((starts < 1) | (last_ports > MAX_PORT))[0].tolist():
+        conflicts.append({
+            'type': 'out_of_range',
+            'host': str(host_names[hosts[row]]),
+            'ports': [int(starts[row]), int(last_ports[row])],
+            'nodes': [int(node_ids[row])],
+            'schains': [schain_id_hex(schain_ids[row])]
+        })
+    return conflicts
+
+
+def audit(nodes):
+    """ Port audit of all sChains on all nodes """
+    nodes = list(nodes)
+    node_ids, hosts, host_names, node_base_ports, schain_indexes, schain_ids = \
+        membership(nodes)
+    base_ports = schain_base_ports(node_base_ports, schain_indexes)
+    conflicts = find_conflicts(hosts, host_names, base_ports, node_ids, schain_ids)
+    return {
+        'nodes': len(nodes),
+        'allocations': len(base_ports),
+        'lowest_port': int(base_ports.min()) if len(base_ports) else None,
+        'highest_port': int(port_matrix(base_ports).max()) if len(base_ports) else None,
+        'conflicts': conflicts
+    }
+
+
+def format_audit(result):
+    line = (f'Port audit: {result["allocations"]} sChain allocations on '
+            f'{result["nodes"]} nodes, {len(result["conflicts"])} conflicts')
+    return '\n'.join([line] + [
+        f'  {conflict["type"]} on {conflict["host"]}: ports {conflict["ports"]}, '
+        f'nodes {conflict["nodes"]}'
+        for conflict in result['conflicts']
+    ])
@@ -0,0 +1,120 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+cProfile and tracemalloc hooks for commands.
+
+Results are saved at exit as <name>.pstats (raw stats for pstats/snakeviz)
+and <name>.txt (functions sorted by cumulative time and top allocations).
+"""
+
+import atexit
+import io
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+import click
+
+
+PSTATS_LIMIT = 50
+TRACEMALLOC_LIMIT = 25
+TRACEMALLOC_FRAMES = 10
+
+_state = {
+    'name': None,
+    'dir': '.',
+    'profile': None
+}
+
+
+def report_prefix():
+    name = _state['name'] or os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    return os.path.join(_state['dir'], f'profile-{name}-{time.strftime("%Y%m%d-%H%M%S")}')
+
+
+def save_report():
+    profile = _state['profile']
+    tracing = tracemalloc.is_tracing()
+    if profile is None and not tracing:
+        return
+    os.makedirs(_state['dir'], exist_ok=True)
+    prefix = report_prefix()
+    text = io.StringIO()
+    if profile is not None:
+        profile.disable()
+        profile.dump_stats(f'{prefix}.pstats')
+        stats = pstats.Stats(profile, stream=text)
+        stats.sort_stats('cumulative').print_stats(PSTATS_LIMIT)
+    if tracing:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        text.write(f'Memory: current {current / 2 ** 20:.2f} MB, '
+                   f'peak {peak / 2 ** 20:.2f} MB\n')
+        text.write(f'Top {TRACEMALLOC_LIMIT} allocations by line:\n')
+        for stat in snapshot.statistics('lineno')[:TRACEMALLOC_LIMIT]:
+            text.write(f'{stat}\n')
+    with open(f'{prefix}.txt', 'w') as report_file:
+        report_file.write(text.getvalue())
+    print(f'Profile saved to {prefix}.txt', file=sys.stderr)
+
+
+def start(cpu=True, memory=False, output_dir=None, name=None):
+    """ Starts profiling of the current process, results are saved at exit """
+    if output_dir:
+        _state['dir'] = output_dir
+    if name:
+        _state['name'] = name
+    if _state['profile'] is None and not tracemalloc.is_tracing():
+        atexit.register(save_report)
+    if cpu and _state['profile'] is None:
+        import cProfile
+        _state['profile'] = cProfile.Profile()
+        _state['profile'].enable()
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+
+
+def _set_dir(ctx, param, value):
+    _state['dir'] = value
+
+
+def _start_cpu(ctx, param, value):
+    if value:
+        start(cpu=True, name=ctx.info_name)
+
+
+def _start_memory(ctx, param, value):
+    if value:
+        start(cpu=False, memory=True, name=ctx.info_name)
+
+
+def profile_option(func):
+    """ Adds --profile, --profile-memory and --profile-dir options to a click group """
+    func = click.option('--profile-dir', default='.', type=click.Path(), is_eager=True,
+                        expose_value=False, callback=_set_dir,
+                        help='Directory for profiling results')(func)
+    func = click.option('--profile-memory', is_flag=True, default=False,
+                        expose_value=False, callback=_start_memory,
+                        help='Trace memory allocations with tracemalloc')(func)
+    return click.option('--profile', is_flag=True, default=False,
+                        expose_value=False, callback=_start_cpu,
+                        help='Profile command with cProfile')(func)
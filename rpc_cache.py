@@ -0,0 +1,224 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Block-pinned read-through cache for contract reads.
+
+RpcCache is installed as the outermost Web3 middleware, so it serves
+eth_call and friends made by skale.py contract wrappers before the retry
+and client checking middlewares run. Reads for the 'latest' block are
+pinned to one block number, which makes every cached value immutable:
+the key is (endpoint, chain id, method, contract address, call data, block
+number), so networks sharing one persistent cache file don't mix.
+The pin is released after a transaction is sent or mined, so commands
+that write and then read see the new state, and after pin_ttl seconds, so
+long-running commands don't keep reading an old block.
+"""
+
+import atexit
+import json
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 4096
+DEFAULT_PIN_TTL = 10
+PERSIST_COMMIT_EVERY = 100
+
+# method -> index of the block identifier in params
+CACHED_METHODS = {
+    'eth_call': 1,
+    'eth_getBalance': 1,
+    'eth_getCode': 1,
+    'eth_getStorageAt': 2
+}
+WRITE_METHODS = ('eth_sendRawTransaction', 'eth_sendTransaction')
+RECEIPT_METHOD = 'eth_getTransactionReceipt'
+
+
+def to_json_key(value):
+    if isinstance(value, (bytes, bytearray)):
+        return '0x' + bytes(value).hex()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+class PersistentTier:
+    """ sqlite3 storage for cached responses shared between runs """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS rpc_cache (key TEXT PRIMARY KEY, value BLOB)')
+        self._pending = 0
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value FROM rpc_cache WHERE key = ?', (key,)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO rpc_cache (key, value) VALUES (?, ?)',
+                (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+            )
+            self._pending += 1
+            if self._pending >= PERSIST_COMMIT_EVERY:
+                self._conn.commit()
+                self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+class RpcCache:
+    """
+    Bounded LRU of JSON-RPC responses with an optional persistent tier.
+    One instance can be installed into several Web3 objects (e.g. Skale
+    and wallet ones) to share cached values and the pinned block.
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, path=None, pin=True, endpoint=None,
+                 pin_ttl=DEFAULT_PIN_TTL):
+        self.maxsize = maxsize
+        self.pin = pin
+        self.pin_ttl = pin_ttl
+        self.endpoint = endpoint
+        self.persistent = PersistentTier(path) if path else None
+        self.pinned_block = None
+        self._pinned_at = 0.0
+        self.chain_id = None
+        self.hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        if self.persistent:
+            atexit.register(self.persistent.close)
+
+    def unpin(self):
+        with self._lock:
+            self.pinned_block = None
+
+    def _is_pinned(self):
+        return self.pinned_block is not None and \
+            time.monotonic() - self._pinned_at < self.pin_ttl
+
+    def _get_pinned_block(self, make_request):
+        with self._lock:
+            if self._is_pinned():
+                return self.pinned_block
+        block_number = make_request('eth_blockNumber', [])['result']
+        with self._lock:
+            if not self._is_pinned():
+                self.pinned_block = block_number
+                self._pinned_at = time.monotonic()
+                logger.debug(f'Reads are pinned to block {block_number}')
+            return self.pinned_block
+
+    def _get_chain_id(self, make_request):
+        if self.chain_id is None:
+            self.chain_id = make_request('eth_chainId', [])['result']
+        return self.chain_id
+
+    def pin_params(self, method, params, make_request):
+        """ Returns params with block identifier that can be cached or None """
+        block_index = CACHED_METHODS[method]
+        params = list(params)
+        if len(params) < block_index:
+            return None
+        block = params[block_index] if len(params) > block_index else 'latest'
+        if block == 'latest':
+            if not self.pin:
+                return None
+            block = hex(self._get_pinned_block(make_request))
+        if not isinstance(block, str) or block == 'pending':
+            return None
+        # params after the block identifier (e.g. state overrides) are kept
+        params[block_index:block_index + 1] = [block]
+        return params
+
+    def get(self, key):
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return self._lru[key]
+        value = self.persistent.get(key) if self.persistent else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._remember(key, value)
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+        if self.persistent:
+            self.persistent.set(key, value)
+
+    def _remember(self, key, value):
+        self._lru[key] = value
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)
+
+    def middleware(self, make_request, web3):
+        def middleware(method, params):
+            if method in CACHED_METHODS:
+                pinned_params = self.pin_params(method, params, make_request)
+                if pinned_params is None:
+                    return make_request(method, params)
+                key = json.dumps([self.endpoint, self._get_chain_id(make_request),
+                                  method, pinned_params], sort_keys=True, default=to_json_key)
+                response = self.get(key)
+                if response is None:
+                    response = make_request(method, pinned_params)
+                    if 'error' not in response:
+                        self.set(key, response)
+                return response
+
+            response = make_request(method, params)
+            if method in WRITE_METHODS or \
+                    (method == RECEIPT_METHOD and response.get('result')):
+                self.unpin()
+            return response
+        return middleware
+
+    def install(self, web3):
+        web3.middleware_onion.add(self.middleware, name='rpc_cache')
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._lru),
+            'pinned_block': self.pinned_block
+        }
@@ -0,0 +1,259 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Hedged requests for idempotent reads.
+
+If a read takes longer than the given percentile of recently observed
+latencies of the same kind of request (method, for batches methods and size),
+a duplicate is sent (to another endpoint when READ_ENDPOINTS are
+set) and the first successful answer is returned. The slower request is
+cancelled if it hasn't started yet, otherwise its answer is dropped.
+Duplicates are limited by a budget: at most `budget` extra requests per request.
+"""
+
+import atexit
+import functools
+import logging
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from itertools import chain
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import rpc_pool
+
+
+logger = logging.getLogger(__name__)
+
+HEDGED_METHODS = {
+    'eth_call', 'eth_getBalance', 'eth_getCode', 'eth_getStorageAt', 'eth_getLogs',
+    'eth_blockNumber', 'eth_getBlockByNumber', 'eth_getBlockByHash', 'eth_chainId',
+    'net_version'
+}
+DEFAULT_PERCENTILE = 95
+DEFAULT_BUDGET = 0.05
+MIN_SAMPLES = 20
+MIN_DELAY = 0.005
+WINDOW = 1000
+MAX_WORKERS = 64
+
+hedger = None
+
+
+def percentile(samples, value):
+    """ Nearest-rank percentile of sorted samples """
+    if not samples:
+        return None
+    rank = max(int(round(value / 100 * len(samples))) - 1, 0)
+    return samples[min(rank, len(samples) - 1)]
+
+
+class Hedger:
+    def __init__(self, percentile=DEFAULT_PERCENTILE, budget=DEFAULT_BUDGET,
+                 min_samples=MIN_SAMPLES, min_delay=MIN_DELAY, window=WINDOW,
+                 max_workers=MAX_WORKERS):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        # latencies of first attempts (what we'd see without hedging) by request key
+        # and of answers
+        self.raw = defaultdict(lambda: deque(maxlen=window))
+        self.effective = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='hedge')
+
+    def delay(self, key=None):
+        with self._lock:
+            samples = sorted(self.raw[key])
+        if len(samples) < self.min_samples:
+            return None
+        return max(percentile(samples, self.percentile), self.min_delay)
+
+    def _reserve_hedge(self):
+        with self._lock:
+            if self.hedges >= self.budget * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def _record(self, samples, elapsed):
+        with self._lock:
+            samples.append(elapsed)
+
+    def call(self, fn, key=None):
+        """
+        Calls fn(attempt), attempt is 0 for the original request and 1 for the hedge.
+        Requests with the same key share latency samples and hedge delay.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            self.requests += 1
+            raw = self.raw[key]
+        delay = self.delay(key)
+        if delay is None:
+            # not enough samples yet to know what slow is
+            result = fn(0)
+            self._record(raw, time.perf_counter() - start)
+            self._record(self.effective, time.perf_counter() - start)
+            return result
+
+        first = self._executor.submit(fn, 0)
+        first.add_done_callback(
+            lambda future: future.exception() is None and
+            self._record(raw, time.perf_counter() - start)
+        )
+        done, _ = wait([first], timeout=delay)
+        if done or not self._reserve_hedge():
+            result = first.result()
+            self._record(self.effective, time.perf_counter() - start)
+            return result
+
+        second = self._executor.submit(fn, 1)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                for other in pending:
+                    other.cancel()
+                if future is second:
+                    with self._lock:
+                        self.hedge_wins += 1
+                self._record(self.effective, time.perf_counter() - start)
+                return future.result()
+        raise error
+
+    def stats(self):
+        with self._lock:
+            raw = sorted(chain.from_iterable(self.raw.values()))
+            effective = sorted(self.effective)
+            stats = {
+                'requests': self.requests,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'budget': self.budget
+            }
+        for name, samples in (('raw', raw), ('hedged', effective)):
+            for value in (50, 99):
+                result = percentile(samples, value)
+                stats[f'{name}_p{value}_ms'] = round(result * 1000, 2) if result else None
+        return stats
+
+    def format_stats(self):
+        stats = self.stats()
+        line = (f'Hedged requests: {stats["requests"]} requests, {stats["hedges"]} hedges '
+                f'({stats["hedge_wins"]} won, budget {stats["budget"]:.0%})')
+        if stats['raw_p99_ms'] and stats['hedged_p99_ms']:
+            line += (f', p50 {stats["raw_p50_ms"]} -> {stats["hedged_p50_ms"]} ms'
+                     f', p99 {stats["raw_p99_ms"]} -> {stats["hedged_p99_ms"]} ms')
+        return line
+
+
+def request_key(payload):
+    """ Method of a request, methods and size rounded up to a power of two of a batch """
+    if not isinstance(payload, list):
+        return payload['method']
+    methods = '+'.join(sorted({request['method'] for request in payload}))
+    return f'{methods}[{1 << (len(payload) - 1).bit_length()}]'
+
+
+def call(fn, key=None):
+    """ Calls fn(attempt) hedged if hedging is enabled """
+    if hedger is None:
+        return fn(0)
+    return hedger.call(fn, key=key)
+
+
+def pool_call(pool, send, retryable=None, key=None):
+    """ Hedged pool.call(send), the duplicate goes to another endpoint if possible """
+    used = []
+
+    def attempt(number):
+        def send_to(url):
+            used.append(url)
+            return send(url)
+        return pool.call(send_to, retryable=retryable, exclude=used[:1] if number else ())
+
+    return call(attempt, key=key)
+
+
+@functools.lru_cache()
+def hedge_provider_class():
+    """ Created on demand to keep web3 import lazy """
+    from web3.providers.base import BaseProvider
+
+    class HedgeProvider(BaseProvider):
+        """ Hedges idempotent reads of the wrapped provider """
+
+        def __init__(self, hedger, provider):
+            self.hedger = hedger
+            self.provider = provider
+            self.middlewares = provider.middlewares
+
+        def make_request(self, method, params):
+            if method not in HEDGED_METHODS:
+                return self.provider.make_request(method, params)
+            pool = getattr(self.provider, 'pool', None)
+            if pool is None:
+                return self.hedger.call(lambda _: self.provider.make_request(method, params),
+                                        key=method)
+            return pool_call(
+                pool,
+                lambda url: self.provider.providers[url].make_request(method, params),
+                retryable=rpc_pool.has_lagging_error,
+                key=method
+            )
+
+        def isConnected(self):
+            return self.provider.isConnected()
+
+    return HedgeProvider
+
+
+def get_hedger():
+    return hedger
+
+
+def install(web3):
+    """ Hedges reads of web3 if hedging is enabled """
+    if hedger is None or web3 is None:
+        return
+    web3.provider = hedge_provider_class()(hedger, web3.provider)
+
+
+def _report():
+    if hedger and hedger.requests:
+        print(hedger.format_stats(), file=sys.stderr)
+
+
+def enable(percentile=DEFAULT_PERCENTILE, budget=DEFAULT_BUDGET):
+    global hedger
+    if hedger is None:
+        atexit.register(_report)
+    hedger = Hedger(percentile=percentile, budget=budget)
+    return hedger
@@ -0,0 +1,270 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Load-balanced pool of RPC endpoints.
+
+Reads are spread across the primary endpoint and READ_ENDPOINTS, either to
+the endpoint with the fewest outstanding requests or to the one with the
+lowest expected latency. An endpoint that fails (transport error, HTTP
+error, lagging node) is put on an exponential cooldown and the request is
+retried on the next one. Writes and reads that depend on our own
+transactions are always sent to the primary.
+"""
+
+import atexit
+import functools
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+LEAST_OUTSTANDING = 'least-outstanding'
+LATENCY = 'latency'
+STRATEGIES = (LEAST_OUTSTANDING, LATENCY)
+
+WRITE_METHODS = {
+    'eth_sendRawTransaction', 'eth_sendTransaction', 'eth_sign', 'eth_signTransaction'
+}
+# Nonces, receipts and gas estimates of just sent transactions are only
+# guaranteed to be consistent on the node that received them
+PRIMARY_METHODS = WRITE_METHODS | {
+    'eth_getTransactionCount', 'eth_getTransactionReceipt',
+    'eth_getTransactionByHash', 'eth_estimateGas'
+}
+# JSON-RPC errors returned by nodes that are behind the requested block
+LAGGING_ERRORS = ('header not found', 'unknown block', 'missing trie node')
+
+LATENCY_ALPHA = 0.3
+BASE_COOLDOWN = 1.0
+MAX_COOLDOWN = 60.0
+
+pool = None
+
+
+class EndpointState:
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.latency = None
+        self.failures = 0
+        self.down_until = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def health(self):
+        """ 1.0 for an endpoint without recent failures, decreases with each one """
+        return 1 / (1 + self.failures)
+
+    def to_dict(self):
+        return {
+            'url': self.url,
+            'requests': self.requests,
+            'errors': self.errors,
+            'latency_ms': round(self.latency * 1000, 2) if self.latency is not None else None,
+            'health': round(self.health, 2),
+            'available': self.down_until <= time.monotonic()
+        }
+
+
+class EndpointPool:
+    def __init__(self, primary, endpoints=(), strategy=LEAST_OUTSTANDING,
+                 base_cooldown=BASE_COOLDOWN, max_cooldown=MAX_COOLDOWN):
+        if strategy not in STRATEGIES:
+            raise ValueError(f'Unknown strategy {strategy}, use one of {STRATEGIES}')
+        self.strategy = strategy
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        self.primary = EndpointState(primary)
+        self.endpoints = [self.primary] + [
+            EndpointState(url) for url in dict.fromkeys(endpoints) if url != primary
+        ]
+
+    @property
+    def urls(self):
+        return [endpoint.url for endpoint in self.endpoints]
+
+    def serves(self, url):
+        return url == self.primary.url
+
+    def _score(self, endpoint):
+        # endpoints without measurements are tried first
+        latency = endpoint.latency or 0
+        if self.strategy == LATENCY:
+            return (endpoint.outstanding + 1) * latency / endpoint.health, endpoint.outstanding
+        return endpoint.outstanding, latency / endpoint.health
+
+    def choose(self, exclude=()):
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e.url not in exclude]
+        if not candidates:
+            return None
+        available = [e for e in candidates if e.down_until <= now]
+        if not available:
+            # everything is cooling down, the one that recovers first is the best bet
+            return min(candidates, key=lambda e: e.down_until)
+        return min(available, key=self._score)
+
+    def _succeeded(self, endpoint, elapsed):
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.failures = 0
+            endpoint.down_until = 0.0
+            if endpoint.latency is None:
+                endpoint.latency = elapsed
+            else:
+                endpoint.latency += LATENCY_ALPHA * (elapsed - endpoint.latency)
+
+    def _failed(self, endpoint, reason):
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.errors += 1
+            endpoint.failures += 1
+            cooldown = min(self.base_cooldown * 2 ** (endpoint.failures - 1),
+                           self.max_cooldown)
+            endpoint.down_until = time.monotonic() + cooldown
+        logger.warning(f'RPC endpoint {endpoint.url} failed ({reason}), '
+                       f'excluded for {cooldown:.1f}s')
+
+    def call(self, fn, primary_only=False, retryable=None, exclude=()):
+        """
+        Calls fn(url) on the best endpoint, fails over to the next ones on
+        transport errors or when retryable(result) is true.
+        The last error is raised (or the last result returned) if all fail.
+        Endpoints in exclude are skipped unless there is nothing else.
+        """
+        exclude = set(exclude)
+        tried = exclude if not primary_only and len(exclude) < len(self.endpoints) else set()
+        error, result = None, None
+        while True:
+            with self._lock:
+                endpoint = self.primary if primary_only else self.choose(tried)
+                if endpoint is None or endpoint.url in tried:
+                    break
+                endpoint.outstanding += 1
+                endpoint.requests += 1
+            tried.add(endpoint.url)
+            start = time.perf_counter()
+            try:
+                result = fn(endpoint.url)
+            except OSError as err:
+                self._failed(endpoint, err)
+                error = err
+                continue
+            except Exception:
+                self._succeeded(endpoint, time.perf_counter() - start)
+                raise
+            if retryable and retryable(result):
+                self._failed(endpoint, 'node is behind')
+                error = None
+                continue
+            self._succeeded(endpoint, time.perf_counter() - start)
+            return result
+        if error is not None:
+            raise error
+        return result
+
+    def stats(self):
+        return [endpoint.to_dict() for endpoint in self.endpoints]
+
+    def format_table(self):
+        lines = [f'{"endpoint":48} {"requests":>9} {"errors":>7} {"latency ms":>11} '
+                 f'{"health":>7}']
+        for item in self.stats():
+            latency = '-' if item['latency_ms'] is None else f'{item["latency_ms"]:.2f}'
+            lines.append(f'{item["url"][:48]:48} {item["requests"]:9} {item["errors"]:7} '
+                         f'{latency:>11} {item["health"]:7.2f}')
+        return '\n'.join(lines)
+
+
+def is_primary_request(payload):
+    requests = payload if isinstance(payload, list) else [payload]
+    return any(request['method'] in PRIMARY_METHODS for request in requests)
+
+
+def has_lagging_error(response):
+    responses = response if isinstance(response, list) else [response]
+    for item in responses:
+        error = item.get('error') if isinstance(item, dict) else None
+        message = str(error.get('message', '')).lower() if isinstance(error, dict) else ''
+        if any(pattern in message for pattern in LAGGING_ERRORS):
+            return True
+    return False
+
+
+@functools.lru_cache()
+def pool_provider_class():
+    """ Created on demand to keep web3 import lazy """
+    from web3 import HTTPProvider
+    from web3.providers.base import BaseProvider
+
+    class PoolProvider(BaseProvider):
+        """ Sends requests of a web3 object through the endpoint pool """
+
+        def __init__(self, pool, provider):
+            self.pool = pool
+            # keep provider level middlewares (e.g. retries) of the wrapped provider
+            self.middlewares = provider.middlewares
+            request_kwargs = getattr(provider, '_request_kwargs', None)
+            self.providers = {
+                url: provider if url == getattr(provider, 'endpoint_uri', None)
+                else HTTPProvider(url, request_kwargs=request_kwargs)
+                for url in pool.urls
+            }
+
+        def make_request(self, method, params):
+            return self.pool.call(
+                lambda url: self.providers[url].make_request(method, params),
+                primary_only=method in PRIMARY_METHODS,
+                retryable=has_lagging_error
+            )
+
+        def isConnected(self):
+            return any(provider.isConnected() for provider in self.providers.values())
+
+    return PoolProvider
+
+
+def get_pool():
+    return pool
+
+
+def install(web3):
+    """ Routes web3 requests through the pool if it's enabled for its endpoint """
+    if pool is None or web3 is None:
+        return
+    if not pool.serves(getattr(web3.provider, 'endpoint_uri', None)):
+        return
+    web3.provider = pool_provider_class()(pool, web3.provider)
+
+
+def _report():
+    if pool and len(pool.endpoints) > 1:
+        logger.info('RPC endpoints:\n' + pool.format_table())
+
+
+def enable(primary, endpoints, strategy=LEAST_OUTSTANDING):
+    global pool
+    if pool is None:
+        atexit.register(_report)
+    pool = EndpointPool(primary, endpoints, strategy)
+    return pool
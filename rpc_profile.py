@@ -0,0 +1,299 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+JSON-RPC instrumentation: call counts, latency histograms, bytes and retries.
+
+Calls are what the code asked for (including cache hits), requests are what
+was actually sent over the network. Web3 objects are instrumented with two
+middlewares: the outermost one counts calls and contract functions, the
+innermost one measures every request attempt. Raw requests (batch_rpc and
+standalone scripts) are reported with record_raw.
+"""
+
+import atexit
+import json
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import click
+
+
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float('inf'))
+
+profiler = None
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS_MS)
+        self.total = 0
+        self.max = 0
+
+    def add(self, elapsed_ms):
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.counts[i] += 1
+                break
+        self.total += elapsed_ms
+        self.max = max(self.max, elapsed_ms)
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def percentile(self, fraction):
+        """ Upper bound of the bucket containing the given fraction of samples """
+        threshold = fraction * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.counts):
+            seen += count
+            if count and seen >= threshold:
+                return min(bound, self.max)
+        return 0
+
+    def to_dict(self):
+        return {
+            'buckets_ms': {
+                ('inf' if bound == float('inf') else str(bound)): count
+                for bound, count in zip(LATENCY_BUCKETS_MS, self.counts) if count
+            },
+            'total_ms': round(self.total, 3),
+            'max_ms': round(self.max, 3)
+        }
+
+
+class MethodStats:
+    def __init__(self):
+        self.calls = Histogram()
+        self.requests = Histogram()
+        self.retries = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    @property
+    def latency(self):
+        """ Call latency, or request latency for raw batches without calls """
+        return self.calls if self.calls.count else self.requests
+
+    def to_dict(self):
+        return {
+            'calls': self.calls.count,
+            'requests': self.requests.count,
+            'retries': self.retries,
+            'errors': self.errors,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'call_latency': self.calls.to_dict(),
+            'request_latency': self.requests.to_dict()
+        }
+
+
+def json_size(data):
+    return len(json.dumps(data, default=str))
+
+
+class RpcProfiler:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.methods = defaultdict(MethodStats)
+        self.functions = defaultdict(Histogram)
+        self.contract_names = {}
+        self.function_names = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def add_abi(self, abi):
+        """ Registers contract and function names from a SKALE ABI file content """
+        from eth_utils import function_abi_to_4byte_selector
+
+        for key, value in abi.items():
+            if key.endswith('_address') and isinstance(value, str):
+                self.contract_names[value.lower()] = key[:-len('_address')]
+            elif key.endswith('_abi') and isinstance(value, list):
+                for item in value:
+                    if item.get('type') == 'function':
+                        selector = '0x' + function_abi_to_4byte_selector(item).hex()
+                        self.function_names.setdefault(selector, item['name'])
+
+    def function_key(self, method, params):
+        if method not in ('eth_call', 'eth_estimateGas', 'eth_sendTransaction') or \
+                not params or not isinstance(params[0], dict):
+            return None
+        to = str(params[0].get('to') or '').lower()
+        data = params[0].get('data') or ''
+        data = data.hex() if isinstance(data, bytes) else str(data)
+        selector = data[:10] if data.startswith('0x') else '0x' + data[:8]
+        contract = self.contract_names.get(to, to)
+        function = self.function_names.get(selector, selector)
+        return f'{contract}.{function}'
+
+    def record_call(self, method, elapsed, params=None, retries=0, error=False):
+        elapsed_ms = elapsed * 1000
+        function = self.function_key(method, params)
+        with self._lock:
+            stats = self.methods[method]
+            stats.calls.add(elapsed_ms)
+            stats.retries += retries
+            stats.errors += int(error)
+            if function:
+                self.functions[function].add(elapsed_ms)
+
+    def record_request(self, method, elapsed, bytes_sent, bytes_received):
+        with self._lock:
+            stats = self.methods[method]
+            stats.requests.add(elapsed * 1000)
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+
+    def record_raw(self, method, elapsed, params, bytes_sent, bytes_received, error=False):
+        """ For requests sent without Web3: one call and one request """
+        self.record_request(method, elapsed, bytes_sent, bytes_received)
+        self.record_call(method, elapsed, params, error=error)
+
+    def call_middleware(self, make_request, web3):
+        def middleware(method, params):
+            outer_attempts = getattr(self._local, 'attempts', None)
+            self._local.attempts = attempts = defaultdict(int)
+            start = time.perf_counter()
+            error = True
+            try:
+                response = make_request(method, params)
+                error = 'error' in response
+                return response
+            finally:
+                self._local.attempts = outer_attempts
+                self.record_call(method, time.perf_counter() - start, params,
+                                 retries=max(0, attempts[method] - 1), error=error)
+        return middleware
+
+    def request_middleware(self, make_request, web3):
+        def middleware(method, params):
+            attempts = getattr(self._local, 'attempts', None)
+            if attempts is not None:
+                attempts[method] += 1
+            start = time.perf_counter()
+            response = None
+            try:
+                response = make_request(method, params)
+                return response
+            finally:
+                self.record_request(
+                    method, time.perf_counter() - start,
+                    json_size({'jsonrpc': '2.0', 'method': method,
+                               'params': params, 'id': 0}),
+                    json_size(response) if response is not None else 0
+                )
+        return middleware
+
+    def install(self, web3):
+        web3.middleware_onion.inject(self.request_middleware,
+                                     name='rpc_profile_requests', layer=0)
+        web3.middleware_onion.add(self.call_middleware, name='rpc_profile_calls')
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'wall_time': round(time.perf_counter() - self.started, 3),
+                'methods': {
+                    method: stats.to_dict()
+                    for method, stats in sorted(self.methods.items())
+                },
+                'functions': {
+                    function: {'calls': hist.count, **hist.to_dict()}
+                    for function, hist in sorted(self.functions.items())
+                }
+            }
+
+    def format_table(self):
+        lines = [
+            f'RPC profile, wall time {time.perf_counter() - self.started:.2f}s',
+            f'{"method":32} {"calls":>7} {"reqs":>7} {"retry":>5} {"err":>4} '
+            f'{"total s":>8} {"p50 ms":>7} {"p95 ms":>7} {"max ms":>8} '
+            f'{"sent":>9} {"recv":>10}'
+        ]
+        with self._lock:
+            methods = sorted(self.methods.items(),
+                             key=lambda item: -item[1].latency.total)
+            for method, stats in methods:
+                latency = stats.latency
+                lines.append(
+                    f'{method:32} {stats.calls.count:7} {stats.requests.count:7} '
+                    f'{stats.retries:5} {stats.errors:4} {latency.total / 1000:8.2f} '
+                    f'{latency.percentile(0.5):7.1f} {latency.percentile(0.95):7.1f} '
+                    f'{latency.max:8.1f} {stats.bytes_sent:9} {stats.bytes_received:10}'
+                )
+            if self.functions:
+                lines.append('')
+                lines.append(f'{"contract function":56} {"calls":>7} {"total s":>8} '
+                             f'{"avg ms":>8}')
+                functions = sorted(self.functions.items(), key=lambda item: -item[1].total)
+                for function, hist in functions:
+                    lines.append(f'{function:56} {hist.count:7} {hist.total / 1000:8.2f} '
+                                 f'{hist.total / hist.count:8.1f}')
+        return '\n'.join(lines)
+
+
+def report(output_format='table', path=None):
+    if profiler is None:
+        return
+    if output_format == 'json':
+        text = json.dumps(profiler.to_dict(), indent=4)
+    else:
+        text = profiler.format_table()
+    if path and path != '-':
+        with open(path, 'w') as report_file:
+            report_file.write(text + '\n')
+    else:
+        print(text, file=sys.stderr)
+
+
+def enable(output_format='table', path=None):
+    """ Starts collecting stats, report is printed at exit """
+    global profiler
+    if profiler is None:
+        profiler = RpcProfiler()
+        atexit.register(report, output_format, path)
+    return profiler
+
+
+def get_profiler():
+    return profiler
+
+
+def _enable_table(ctx, param, value):
+    if value:
+        enable()
+
+
+def _enable_json(ctx, param, value):
+    if value:
+        enable('json', value)
+
+
+def profile_rpc_option(func):
+    """ Adds --profile-rpc and --profile-rpc-json options to a click group """
+    func = click.option('--profile-rpc-json', default=None, type=click.Path(),
+                        expose_value=False, callback=_enable_json,
+                        help='Save RPC profile as JSON to the file (- for stderr)')(func)
+    return click.option('--profile-rpc', is_flag=True, default=False,
+                        expose_value=False, callback=_enable_table,
+                        help='Print RPC call counts and latencies at exit')(func)
@@ -0,0 +1,226 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Record/replay of JSON-RPC traffic.
+
+In record mode every request and response, with its latency, is appended to
+a gzipped JSON lines trace. In replay mode responses are served from the
+trace without an endpoint: identical requests are answered in recorded
+order and the last response is repeated once they run out.
+Web3 objects are switched by replacing their provider, raw requests
+(batch_rpc, schain_ports_test) call record/replay helpers directly.
+"""
+
+import atexit
+import functools
+import gzip
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+
+import click
+
+
+logger = logging.getLogger(__name__)
+
+RECORD = 'record'
+REPLAY = 'replay'
+# Replayed blocks are old, skale.py client checking middleware should accept them
+REPLAY_ALLOWED_TS_DIFF = 10 ** 10
+
+trace = None
+
+
+class TraceMissError(Exception):
+    pass
+
+
+def request_key(method, params, scope=''):
+    return json.dumps([scope, method, params], sort_keys=True, default=str)
+
+
+class TraceRecorder:
+    mode = RECORD
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, 'wt')
+        self.count = 0
+
+    def record(self, method, params, response, elapsed, scope=''):
+        line = json.dumps({'scope': scope, 'method': method, 'params': params,
+                           'response': response, 'elapsed': round(elapsed, 6)},
+                          default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+                logger.info(f'Recorded {self.count} RPC requests to {self.path}')
+
+
+class TraceReplayer:
+    mode = REPLAY
+
+    def __init__(self, path, timing=False):
+        self.path = path
+        self.timing = timing
+        self._lock = threading.Lock()
+        self._entries = defaultdict(deque)
+        with gzip.open(path, 'rt') as trace_file:
+            for line in trace_file:
+                entry = json.loads(line)
+                key = request_key(entry['method'], entry['params'], entry.get('scope', ''))
+                self._entries[key].append(entry)
+
+    def lookup(self, method, params, scope=''):
+        key = request_key(method, params, scope)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise TraceMissError(f'{method} {params} is not in trace {self.path}')
+            entry = entries.popleft() if len(entries) > 1 else entries[0]
+        if self.timing:
+            time.sleep(entry['elapsed'])
+        return entry['response']
+
+
+@functools.lru_cache()
+def trace_provider_class():
+    """ Created on demand to keep web3 import lazy """
+    from web3.providers.base import BaseProvider
+
+    class TraceProvider(BaseProvider):
+        """ Records requests of the wrapped provider or replays them """
+
+        def __init__(self, trace, provider=None):
+            self.trace = trace
+            self.provider = provider
+            if provider is not None and trace.mode == RECORD:
+                # keep provider level middlewares (e.g. retries) of the wrapped provider
+                self.middlewares = provider.middlewares
+
+        def make_request(self, method, params):
+            if self.trace.mode == REPLAY:
+                return self.trace.lookup(method, params)
+            start = time.perf_counter()
+            response = self.provider.make_request(method, params)
+            self.trace.record(method, params, response, time.perf_counter() - start)
+            return response
+
+        def isConnected(self):
+            return self.trace.mode == REPLAY or self.provider.isConnected()
+
+    return TraceProvider
+
+
+def get_trace():
+    return trace
+
+
+def install(web3):
+    """ Switches web3 to record or replay mode if tracing is enabled """
+    if trace is None or web3 is None:
+        return
+    web3.provider = trace_provider_class()(trace, web3.provider)
+
+
+def post(post_fn, payload, scope=''):
+    """
+    Sends JSON-RPC payload (single request or batch) with post_fn(payload)
+    returning parsed response, records or replays it when tracing is enabled
+    """
+    if trace is None:
+        return post_fn(payload)
+    if not isinstance(payload, list):
+        if trace.mode == REPLAY:
+            response = trace.lookup(payload['method'], payload['params'], scope)
+            return {**response, 'id': payload['id']} if response else response
+        start = time.perf_counter()
+        response = post_fn(payload)
+        trace.record(payload['method'], payload['params'], response,
+                     time.perf_counter() - start, scope)
+        return response
+
+    if trace.mode == REPLAY:
+        return [
+            {**trace.lookup(request['method'], request['params'], scope),
+             'id': request['id']}
+            for request in payload
+        ]
+    start = time.perf_counter()
+    responses = post_fn(payload)
+    elapsed = time.perf_counter() - start
+    if isinstance(responses, list):
+        by_id = {response.get('id'): response for response in responses}
+        for request in payload:
+            if request['id'] in by_id:
+                trace.record(request['method'], request['params'], by_id[request['id']],
+                             elapsed / len(payload), scope)
+    return responses
+
+
+def enable(mode, path, timing=False):
+    global trace
+    if mode == RECORD:
+        trace = TraceRecorder(path)
+        atexit.register(trace.close)
+    else:
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f'Trace {path} not found')
+        os.environ.setdefault('ALLOWED_TS_DIFF', str(REPLAY_ALLOWED_TS_DIFF))
+        if 'skale.config' in sys.modules:
+            sys.modules['skale.config'].ALLOWED_TS_DIFF = REPLAY_ALLOWED_TS_DIFF
+        trace = TraceReplayer(path, timing=timing)
+    return trace
+
+
+def _record(ctx, param, value):
+    if value:
+        enable(RECORD, value)
+
+
+def _set_timing(ctx, param, value):
+    ctx.meta['rpc_trace.replay_timing'] = value
+
+
+def _replay(ctx, param, value):
+    if value:
+        enable(REPLAY, value, timing=ctx.meta.get('rpc_trace.replay_timing', False))
+
+
+def rpc_trace_options(func):
+    """ Adds --record-rpc, --replay-rpc and --replay-timing options to a click group """
+    func = click.option('--replay-rpc', default=None, type=click.Path(exists=True),
+                        expose_value=False, callback=_replay,
+                        help='Serve RPC responses from a recorded trace')(func)
+    func = click.option('--record-rpc', default=None, type=click.Path(),
+                        expose_value=False, callback=_record,
+                        help='Record RPC requests and responses to a trace (.jsonl.gz)')(func)
+    return click.option('--replay-timing', is_flag=True, default=False, is_eager=True,
+                        expose_value=False, callback=_set_timing,
+                        help='Replay with recorded latencies')(func)
@@ -25,24 +25,14 @@ import os
 from enum import Enum
 
 import click
-from ima_predeployed.generator import generate_abi
-from skale import Skale, SkaleIma
-from skale.dataclasses.skaled_ports import SkaledPorts
-# from skale.schain_config.generator import get_nodes_for_schain
-from skale.utils.helper import init_default_logger
-from skale.utils.contracts_provision.main import add_test_schain_type
 
-from skale.utils.constants import LONG_LINE
-from skale.utils.helper import ip_from_bytes
-from skale.utils.random_names.generator import generate_random_schain_name
-from skale.utils.web3_utils import to_checksum_address
-
-from skale.schain_config.generator import get_schain_nodes_with_schains
-from skale.schain_config.ports_allocation import get_schain_base_port_on_node
-
-
-from utils import create_account, init_wallet
+from utils import (LONG_LINE, LazyClients, create_account, init_default_logger,
+                   ip_from_bytes)
 from config import ENDPOINT, ABI_FILEPATH, IMA_ABI_FILEPATH
+from py_profile import profile_option
+from rpc_profile import profile_rpc_option
+from rpc_trace import rpc_trace_options
+from schain_watch import DEFAULT_POLL_INTERVAL, watch_schain
 
 
 init_default_logger()
@@ -61,13 +51,14 @@ class SchainType(Enum):
 
 
 @click.group()
+@profile_option
+@profile_rpc_option
+@rpc_trace_options
 @click.option('--endpoint', default=ENDPOINT, help='skale manager endpoint')
 @click.option('--abi-filepath', default=ABI_FILEPATH, help='abi file')
 @click.pass_context
 def main(ctx, endpoint, abi_filepath):
-    ctx.ensure_object(dict)
-    wallet = init_wallet(endpoint)
-    ctx.obj['skale'] = Skale(endpoint, abi_filepath, wallet)
+    ctx.obj = LazyClients(endpoint, abi_filepath, IMA_ABI_FILEPATH)
 
 
 def save_info(schain_index, schain_info=None, wallet=None,
@@ -106,29 +97,26 @@ def show_all_schains_names(skale):
     print('\n'.join(schain_names))
 
 
-def get_node_schain_ports_info(base_port):
-    return {
-        rec.name: base_port + rec.value
-        for rec in SkaledPorts
-    }
+def get_schain_info(skale, schain_name):
+    from skale.schain_config.generator import get_schain_nodes_with_schains
+    from skale.schain_config.ports_allocation import get_schain_base_port_on_node
 
+    from port_engine import port_rows
 
-def get_schain_info(skale, schain_name):
     schain_struct = skale.schains.get_by_name(schain_name)
     schain_nodes_with_schains = get_schain_nodes_with_schains(
         skale,
         schain_name
     )
+    base_ports = [
+        get_schain_base_port_on_node(node_info['schains'], schain_name, node_info['port'])
+        for node_info in schain_nodes_with_schains
+    ]
 
-    for i, node_info in enumerate(schain_nodes_with_schains, 1):
-        base_port = get_schain_base_port_on_node(
-            node_info['schains'],
-            schain_name, node_info['port']
-        )
-
+    for node_info, base_port, ports in zip(schain_nodes_with_schains, base_ports,
+                                           port_rows(base_ports)):
         node_info['ip'] = ip_from_bytes(node_info['ip'])
         node_info['publicIP'] = ip_from_bytes(node_info['publicIP'])
-        ports = get_node_schain_ports_info(base_port)
         node_info['basePort'] = base_port
         node_info.pop('port')
         node_info.pop('schains')
@@ -149,6 +137,9 @@ def create_schain(
     by_foundation=False,
     skale_ima=None
 ):
+    from ima_predeployed.generator import generate_abi
+    from skale.utils.random_names.generator import generate_random_schain_name
+
     lifetime_seconds = 12 * 3600  # 12 hours
     nodes_type_idx = int(SchainType[nodes_type_name].value)
     nodes_type_idx = 1
@@ -262,7 +253,7 @@ def create_by_foundation(ctx, amount, save_to, type):
     from foundation account specified by ETH_PRIVATE_KEY
     """
     skale = ctx.obj['skale']
-    skale_ima = SkaleIma(ENDPOINT, IMA_ABI_FILEPATH, skale.wallet)
+    skale_ima = ctx.obj['skale_ima']
 
     for i in range(amount):
         schain_info = create_schain(skale, skale.wallet, type,
@@ -274,12 +265,13 @@ def create_by_foundation(ctx, amount, save_to, type):
 
 @main.command()
 @click.argument('schain_name')
+@click.option('--gas-price', type=int, default=None,
+              help='Gas price in wei (current network gas price by default)')
 @click.pass_context
-def remove(ctx, schain_name):
+def remove(ctx, schain_name, gas_price):
     """ Command that removes schain by name """
     skale = ctx.obj['skale']
-    skale.manager.delete_schain(schain_name, wait_for=True,
-                                gas_price=4500000000)
+    skale.manager.delete_schain(schain_name, wait_for=True, gas_price=gas_price)
     print(f'sChain {schain_name} removed!')
 
 
@@ -308,11 +300,26 @@ def show(ctx):
 @main.command()
 @click.pass_context
 @click.argument('schain_name')
-def info(ctx, schain_name):
+@click.option('--watch', is_flag=True,
+              help='Keep following new blocks and print changes of nodes, ports and IPs')
+@click.option('--interval', default=DEFAULT_POLL_INTERVAL,
+              help='Seconds between block checks in watch mode')
+def info(ctx, schain_name, watch, interval):
     """ Command that show all schains ids """
     skale = ctx.obj['skale']
     info = get_schain_info(skale, schain_name)
     print(json.dumps(info, indent=2))
+    if watch:
+        def refetch_info():
+            # reads stay pinned to one block for RPC_CACHE_PIN_TTL seconds
+            if ctx.obj.rpc_cache:
+                ctx.obj.rpc_cache.unpin()
+            return get_schain_info(skale, schain_name)
+
+        try:
+            watch_schain(skale, ctx.obj['endpoint'], schain_name, refetch_info, info, interval)
+        except KeyboardInterrupt:
+            pass
 
 
 @main.command()
@@ -320,6 +327,8 @@ def info(ctx, schain_name):
 @click.argument('address')
 def grant_role(ctx, address):
     """ Command for granting creator role to address """
+    from skale.utils.web3_utils import to_checksum_address
+
     skale = ctx.obj['skale']
     address = to_checksum_address(address)
     skale.schains.grant_role(skale.schains.schain_creator_role(),
@@ -338,9 +347,43 @@ def is_last_dkg_successful(ctx, schain_name):
     print(res)
 
 
+@main.command()
+@click.pass_context
+@click.argument('schain_names', nargs=-1)
+@click.option('--json-lines', is_flag=True, default=False,
+              help='Print one JSON object per sChain')
+@click.option('--failed-only', is_flag=True, default=False,
+              help='Show only sChains with failed DKG')
+def dkg_status_all(ctx, schain_names, json_lines, failed_only):
+    """
+    Checks the last DKG of all (or given) sChains,
+    failed sChains are printed first, as soon as they are read
+    """
+    from dkg_status import format_status, is_failed, iter_dkg_status
+
+    def show(record):
+        print(json.dumps(record) if json_lines else format_status(record), flush=True)
+
+    total, failed, rotating, succeeded = 0, 0, 0, []
+    for record in iter_dkg_status(ctx.obj['skale'], ctx.obj['endpoint'], schain_names):
+        total += 1
+        rotating += bool(record.get('rotation_in_progress'))
+        if is_failed(record):
+            failed += 1
+            show(record)
+        elif not failed_only:
+            succeeded.append(record)
+    for record in sorted(succeeded, key=lambda record: record['name']):
+        show(record)
+    if not json_lines:
+        print(f'{total} sChains checked: {failed} failed, {rotating} rotating')
+
+
 @main.command()
 @click.pass_context
 def add_test_type(ctx):
+    from skale.utils.contracts_provision.main import add_test_schain_type
+
     skale = ctx.obj['skale']
     res = add_test_schain_type(skale)
     print(res)
@@ -1,13 +1,26 @@
+import json
+import os
 import requests
 import sys
 import csv
 import time
 import socket
 from operator import itemgetter
-from concurrent.futures import as_completed, ThreadPoolExecutor
+
+import py_profile
+import rpc_hedge
+import rpc_profile
+import rpc_trace
+from concurrency import AimdLimiter
 
 
 POST_REQUEST_TIMEOUT = 30
+PROFILE_RPC = os.environ.get('PROFILE_RPC')
+PROFILE = os.environ.get('PROFILE')
+RECORD_RPC = os.environ.get('RECORD_RPC')
+REPLAY_RPC = os.environ.get('REPLAY_RPC')
+MAX_CONCURRENCY = int(os.environ.get('MAX_CONCURRENCY', 64))
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', 0))
 
 SCHAIN_INFO = {}
 
@@ -22,23 +35,44 @@ def is_port_open(ip, port):
       return False
 
 
-def post_request(url, json, cookies=None):
+def post_request(url, json, cookies=None, failures=None):
     try:
         return requests.post(url, json=json, cookies=cookies,
                              timeout=POST_REQUEST_TIMEOUT)
     except requests.exceptions.RequestException as err:
         print(f'Post request failed with: {err}')
+        if failures is not None:
+            failures.append(err)
         return None
 
 
-def make_rpc_call(http_endpoint, method, params=[]) -> bool:
-    res = post_request(
-        http_endpoint,
-        json={"jsonrpc": "2.0", "method": method, "params": params, "id": 1}
-    )
-    if res and res.json():
-        return res.json()
-        
+def is_overload_failure(failure):
+    """ Read timeouts and HTTP 429/5xx mean the node is busy, refused connections that it's down """
+    if isinstance(failure, requests.exceptions.ReadTimeout):
+        return True
+    status = getattr(failure, 'status_code', None)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def make_rpc_call(http_endpoint, method, params=[], failures=None) -> bool:
+    def send(payload):
+        start = time.perf_counter()
+        res = post_request(http_endpoint, json=payload, failures=failures)
+        if res is not None and not res.ok and failures is not None:
+            failures.append(res)
+        profiler = rpc_profile.get_profiler()
+        if profiler:
+            profiler.record_raw(method, time.perf_counter() - start, params,
+                                len(json.dumps(payload)),
+                                len(res.content) if res is not None else 0,
+                                error=res is None or not res.ok)
+        if res and res.json():
+            return res.json()
+
+    payload = {"jsonrpc": "2.0", "method": method, "params": params, "id": 1}
+    return rpc_trace.post(lambda payload: rpc_hedge.call(lambda _: send(payload), key=method),
+                          payload, scope=http_endpoint)
+
 
 def save_csv(schain_name, rows):
     report_filename = f'schain_{schain_name}_data.csv'
@@ -61,7 +95,9 @@ def check_all_ports(ip, ports):
 def process_node(schain_node):
     print(f'Processing node [{schain_node["id"]}] {schain_node["name"]}...')
     start_time = time.time()
-    response = make_rpc_call(schain_node['http_endpoint'], 'eth_getBlockByNumber', ['latest', False])
+    failures = []
+    response = make_rpc_call(schain_node['http_endpoint'], 'eth_getBlockByNumber',
+                             ['latest', False], failures=failures)
     end_time = time.time()
     req_time = end_time - start_time
     if response:
@@ -70,7 +106,8 @@ def process_node(schain_node):
     else:
         block_number, block_timestamp, req_time = '-', '-', '-'
     ports_res = check_all_ports(schain_node['ip'], schain_node['ports'])
-    return [
+    overloaded = not response and any(is_overload_failure(failure) for failure in failures)
+    return overloaded, [
         schain_node["id"],
         schain_node["name"],
         schain_node['http_endpoint'],
@@ -81,26 +118,30 @@ def process_node(schain_node):
 
 
 if __name__ == "__main__":
+    if PROFILE:
+        py_profile.start(cpu=PROFILE in ('cpu', 'all'), memory=PROFILE in ('memory', 'all'))
+    if PROFILE_RPC:
+        rpc_profile.enable(PROFILE_RPC)
+    if RECORD_RPC:
+        rpc_trace.enable(rpc_trace.RECORD, RECORD_RPC)
+    elif REPLAY_RPC:
+        rpc_trace.enable(rpc_trace.REPLAY, REPLAY_RPC)
+    if HEDGE_PERCENTILE:
+        rpc_hedge.enable(HEDGE_PERCENTILE)
     schain_nodes_info = SCHAIN_INFO['schain_nodes']
 
     if len(sys.argv) > 1:
         current_node_id = sys.argv[1]
         schain_nodes_info = [node for node in schain_nodes_info if str(node['id']) != str(current_node_id)]
 
-    rows = []
     header = ['node_id', 'node_name', 'http_endpoint', 'block_number', 'block_timestamp', 'req_time'] + list(schain_nodes_info[0]['ports'].keys())
 
-    with ThreadPoolExecutor(max_workers=max(1, len(schain_nodes_info))) as executor:
-        futures = [
-            executor.submit(
-                process_node,
-                schain_node
-            )
-            for schain_node in schain_nodes_info
-        ]
-        for future in as_completed(futures):
-            row = future.result()
-            rows.append(row)
-    rows = sorted(rows, key=itemgetter(0))
+    # every request goes to a different node, so latency (port probes of dead nodes
+    # included) says nothing about load, only busy answers do
+    limiter = AimdLimiter(max_limit=max(1, min(MAX_CONCURRENCY, len(schain_nodes_info))),
+                          latency_tolerance=None, name='nodes')
+    results = limiter.map(process_node, schain_nodes_info, is_overload=itemgetter(0))
+    print(limiter.format_stats())
+    rows = sorted((row for _, row in results), key=itemgetter(0))
     rows.insert(0, header)
     save_csv(SCHAIN_INFO['schain_struct']['name'], rows)
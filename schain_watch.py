@@ -0,0 +1,119 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Follows sChain info block by block.
+
+For every new block a single batch request reads the sChain node group and,
+for the known members, their sChain lists and node structs (ports depend on
+the sChain list, IPs on the struct). Full info is fetched again only when this
+fingerprint changes, and field-level differences are printed.
+"""
+
+import datetime
+import logging
+import time
+
+from batch_rpc import batch_contract_calls, get_block_number
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 3
+
+
+def fetch_fingerprint(skale, endpoint, schain_id, members, block_number):
+    schains_internal = skale.schains_internal.contract
+    nodes = skale.nodes.contract
+    calls = [(schains_internal, 'getNodesInGroup', [schain_id])]
+    for node_id in members:
+        calls.extend([
+            (schains_internal, 'getSchainIdsForNode', [node_id]),
+            (nodes, 'nodes', [node_id])
+        ])
+    group, *details = batch_contract_calls(endpoint, skale.web3, calls,
+                                           block_number=block_number)
+    return list(group), [list(map(list, details[i:i + 2])) for i in range(0, len(details), 2)]
+
+
+def flatten(value, prefix=''):
+    """ {'a': {'b': 1}, 'c': [2]} -> {'a.b': 1, 'c[0]': 2} """
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = ((f'[{i}]', item) for i, item in enumerate(value))
+    else:
+        return {prefix: value}
+    flat = {}
+    for key, item in items:
+        path = f'{prefix}{key}' if str(key).startswith('[') or not prefix else f'{prefix}.{key}'
+        flat.update(flatten(item, path))
+    return flat
+
+
+def diff_values(old, new, prefix):
+    before, after = flatten(old, prefix), flatten(new, prefix)
+    return [f'{path}: {before.get(path)} -> {after.get(path)}'
+            for path in sorted(set(before) | set(after))
+            if before.get(path) != after.get(path)]
+
+
+def diff_info(old, new):
+    """ Returns lines describing changes between two get_schain_info results """
+    old_nodes = {node['name']: node for node in old['schain_nodes']}
+    new_nodes = {node['name']: node for node in new['schain_nodes']}
+    lines = [f'node {name} left the group' for name in old_nodes if name not in new_nodes]
+    lines += [f'node {name} joined the group' for name in new_nodes if name not in old_nodes]
+    lines += diff_values(old['schain_struct'], new['schain_struct'], 'schain')
+    for name in sorted(old_nodes.keys() & new_nodes.keys()):
+        lines += diff_values(old_nodes[name], new_nodes[name], name)
+    return lines
+
+
+def watch_schain(skale, endpoint, schain_name, get_info, info,
+                 interval=DEFAULT_POLL_INTERVAL):
+    """ Prints timestamped changes of get_info() starting from info until interrupted """
+    schain_id = skale.schains.name_to_id(schain_name)
+    block_number = get_block_number(endpoint)
+    group, _ = fetch_fingerprint(skale, endpoint, schain_id, [], block_number)
+    fingerprint = fetch_fingerprint(skale, endpoint, schain_id, group, block_number)
+    print(f'Watching {schain_name} from block {block_number}')
+    while True:
+        time.sleep(interval)
+        try:
+            latest = get_block_number(endpoint)
+            if latest == block_number:
+                continue
+            block_number = latest
+            current = fetch_fingerprint(skale, endpoint, schain_id, fingerprint[0],
+                                        block_number)
+            if current[0] != fingerprint[0]:
+                # read details of the new members
+                current = fetch_fingerprint(skale, endpoint, schain_id, current[0],
+                                            block_number)
+            if current == fingerprint:
+                continue
+            fingerprint = current
+            new_info = get_info()
+        except Exception as err:
+            logger.error(f'Failed to check {schain_name} at block {block_number}: {err}')
+            continue
+        timestamp = datetime.datetime.now().isoformat(sep=' ', timespec='seconds')
+        for line in diff_info(info, new_info) or ['no visible changes']:
+            print(f'[{timestamp}] block {block_number}: {line}')
+        info = new_info
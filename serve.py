@@ -0,0 +1,129 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+""" HTTP service answering topology queries from memory """
+
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import click
+
+import rpc_hedge
+import rpc_pool
+from abi_cache import load_abi
+from config import (ENDPOINT, ABI_FILEPATH, HEDGE_BUDGET, HEDGE_PERCENTILE,
+                    READ_ENDPOINTS, RPC_LB_STRATEGY)
+from py_profile import profile_option
+from rpc_profile import profile_rpc_option
+from rpc_trace import rpc_trace_options
+from topology import DEFAULT_FULL_REFRESH_INTERVAL, Topology
+from utils import init_default_logger
+
+
+init_default_logger()
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8080
+DEFAULT_POLL_INTERVAL = 5
+
+
+def make_handler(topology):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body=b'', etag=None):
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Cache-Control', 'no-cache')
+            if etag:
+                self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            body, etag = topology.render(self.path.split('?', 1)[0].rstrip('/') or '/')
+            if body is None:
+                self._send(404, json.dumps({'error': f'{self.path} not found'}).encode())
+            elif etag in self.headers.get('If-None-Match', ''):
+                self._send(304, etag=etag)
+            else:
+                self._send(200, body, etag)
+
+        def log_message(self, fmt, *args):
+            logger.debug(fmt % args)
+
+    return Handler
+
+
+def follow_blocks(topology, poll_interval, stop):
+    while not stop.wait(poll_interval):
+        try:
+            topology.refresh()
+        except Exception as err:
+            logger.error(f'Topology refresh failed: {err}')
+
+
+@click.command()
+@profile_option
+@profile_rpc_option
+@rpc_trace_options
+@click.option('--endpoint', default=ENDPOINT, help='Skale manager endpoint')
+@click.option('--abi-filepath', default=ABI_FILEPATH, type=click.Path(),
+              help='abi file')
+@click.option('--host', default='127.0.0.1', help='Address to listen on')
+@click.option('--port', default=DEFAULT_PORT, help='Port to listen on')
+@click.option('--poll-interval', default=DEFAULT_POLL_INTERVAL,
+              help='Seconds between checks for a new block')
+@click.option('--full-refresh-interval', default=DEFAULT_FULL_REFRESH_INTERVAL,
+              help='Seconds between full re-reads of sChain structs and node domains')
+def main(endpoint, abi_filepath, host, port, poll_interval, full_refresh_interval):
+    """
+    Serves /schains, /schains/NAME, /nodes, /nodes/ID/schains, /endpoints
+    and /status as JSON, refreshed on every new block
+    """
+    from web3 import Web3
+
+    if READ_ENDPOINTS:
+        rpc_pool.enable(endpoint, READ_ENDPOINTS, RPC_LB_STRATEGY)
+    if HEDGE_PERCENTILE:
+        rpc_hedge.enable(HEDGE_PERCENTILE, HEDGE_BUDGET)
+    topology = Topology(endpoint, Web3(), load_abi(abi_filepath),
+                        full_refresh_interval=full_refresh_interval)
+    start = time.perf_counter()
+    topology.refresh()
+    logger.info(f'Topology loaded in {time.perf_counter() - start:.2f}s')
+
+    stop = threading.Event()
+    refresher = threading.Thread(target=follow_blocks, args=(topology, poll_interval, stop),
+                                 daemon=True)
+    refresher.start()
+    server = ThreadingHTTPServer((host, port), make_handler(topology))
+    print(f'Serving topology on http://{host}:{server.server_port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
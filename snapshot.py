@@ -0,0 +1,128 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+""" Commands to save, compare and analyse topology snapshots """
+
+import json
+import logging
+
+import click
+
+from config import ENDPOINT, ABI_FILEPATH
+from py_profile import profile_option
+from rpc_profile import profile_rpc_option
+from rpc_trace import rpc_trace_options
+from topology_snapshot import (diff_snapshots, format_diff, load_snapshot, save_snapshot,
+                               snapshot_from_endpoints)
+from utils import init_default_logger
+
+
+init_default_logger()
+logger = logging.getLogger(__name__)
+
+
+@click.group()
+@profile_option
+@profile_rpc_option
+@rpc_trace_options
+@click.option('--endpoint', default=ENDPOINT, help='Skale manager endpoint')
+@click.option('--abi-filepath', default=ABI_FILEPATH, type=click.Path(),
+              help='abi file')
+@click.pass_context
+def main(ctx, endpoint, abi_filepath):
+    ctx.obj = {'endpoint': endpoint, 'abi_filepath': abi_filepath}
+
+
+def load_topology(ctx):
+    from web3 import Web3
+
+    from abi_cache import load_abi
+    from topology import Topology
+
+    topology = Topology(ctx.obj['endpoint'], Web3(), load_abi(ctx.obj['abi_filepath']))
+    topology.refresh()
+    return topology
+
+
+@main.command()
+@click.argument('path', type=click.Path())
+@click.option('--from-endpoints', default=None, type=click.Path(exists=True),
+              help='Convert endpoints.py results instead of reading the chain')
+@click.pass_context
+def save(ctx, path, from_endpoints):
+    """ Saves topology snapshot to PATH (gzipped if it ends with .gz) """
+    if from_endpoints:
+        with open(from_endpoints) as infile:
+            snapshot = snapshot_from_endpoints(json.load(infile))
+    else:
+        from topology_snapshot import snapshot_from_topology
+
+        snapshot = snapshot_from_topology(load_topology(ctx))
+    save_snapshot(path, snapshot)
+    print(f'Saved {len(snapshot["schains"])} sChains and {len(snapshot["nodes"])} nodes '
+          f'to {path}, hash {snapshot["hash"]}')
+
+
+@main.command()
+@click.argument('old_path', type=click.Path(exists=True))
+@click.argument('new_path', type=click.Path(exists=True))
+@click.option('--json', 'as_json', is_flag=True, default=False,
+              help='Print diff as JSON')
+def diff(old_path, new_path, as_json):
+    """ Shows added and removed sChains, rotations, IP and port changes """
+    changes = diff_snapshots(load_snapshot(old_path), load_snapshot(new_path))
+    if as_json:
+        print(json.dumps(changes))
+    else:
+        print(format_diff(changes))
+
+
+@main.command()
+@click.argument('path', type=click.Path())
+@click.option('--format', 'fmt', default='npz', type=click.Choice(['npz', 'parquet']),
+              help='npz file or directory of Parquet files (needs pyarrow)')
+@click.pass_context
+def export(ctx, path, fmt):
+    """ Exports nodes, sChains and membership as columns """
+    from topology_columns import columns_from_topology, save_columns
+
+    columns = columns_from_topology(load_topology(ctx))
+    path = save_columns(path, columns, fmt)
+    print(f'Exported {len(columns["node_id"])} nodes, {len(columns["schain_id"])} sChains '
+          f'and {len(columns["member_node_id"])} memberships to {path}')
+
+
+@main.command()
+@click.argument('path', type=click.Path(exists=True))
+@click.option('--active-only', is_flag=True, default=False, help='Only active nodes')
+@click.option('--top', default=10, help='Number of busiest nodes and validators to show')
+@click.option('--json', 'as_json', is_flag=True, default=False,
+              help='Print results as JSON')
+def analyze(path, active_only, top, as_json):
+    """ Shows sChain load per node and validator and imbalance of exported columns """
+    from topology_columns import analyze as analyze_columns, format_analysis, load_columns
+
+    result = analyze_columns(load_columns(path), active_only=active_only, top=top)
+    if as_json:
+        print(json.dumps(result))
+    else:
+        print(format_analysis(result))
+
+
+if __name__ == '__main__':
+    main()
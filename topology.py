@@ -0,0 +1,335 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+In-memory topology of nodes, sChains and their endpoints.
+
+Topology is built from batched reads pinned to one block and refreshed
+incrementally: for every new block one eth_getLogs call checks whether
+manager contracts emitted events. Only then sChain ids, node groups and
+node structs are read, and details (sChain structs, domains, sChain lists
+of nodes) are fetched for records that changed. Changes without events
+(e.g. domain names) are picked up by a full re-read of all details every
+full_refresh_interval seconds.
+"""
+
+import hashlib
+import json
+import logging
+import socket
+import threading
+import time
+
+from batch_rpc import (BatchRPCError, batch_contract_calls, batch_request, block_tag,
+                       get_block_number)
+from port_engine import audit, endpoint_port_rows, schain_base_ports
+
+
+logger = logging.getLogger(__name__)
+
+NODE_FIELDS = [
+    'name', 'ip', 'publicIP', 'port', 'start_block', 'last_reward_date',
+    'finish_time', 'status', 'validator_id'
+]
+# contracts whose events mean that nodes, sChains or groups could change
+EVENT_CONTRACTS = ('nodes', 'schains', 'schains_internal', 'node_rotation',
+                   'skale_manager', 'skale_d_k_g')
+DEFAULT_FULL_REFRESH_INTERVAL = 300
+
+
+def ip_from_bytes(ip_bytes):
+    return socket.inet_ntoa(ip_bytes)
+
+
+def get_schain_index_in_node(schain_id, schains_ids_on_node):
+    for index, schain_id_on_node in enumerate(schains_ids_on_node):
+        if schain_id == schain_id_on_node:
+            return index
+    raise Exception(f'sChain {schain_id} is not found in the list: {schains_ids_on_node}')
+
+
+def compose_endpoints(node_dict, endpoint_type):
+    host = node_dict[endpoint_type]
+    node_dict[f'http_endpoint_{endpoint_type}'] = f'http://{host}:{node_dict["httpRpcPort"]}'
+    node_dict[f'https_endpoint_{endpoint_type}'] = f'https://{host}:{node_dict["httpsRpcPort"]}'
+    node_dict[f'ws_endpoint_{endpoint_type}'] = f'ws://{host}:{node_dict["wsRpcPort"]}'
+    node_dict[f'wss_endpoint_{endpoint_type}'] = f'wss://{host}:{node_dict["wssRpcPort"]}'
+    node_dict[f'info_http_endpoint_{endpoint_type}'] = \
+        f'http://{host}:{node_dict["infoHttpRpcPort"]}'
+
+
+def add_schain_ports(node_dicts, schain_id, schains_ids_on_nodes):
+    """ Adds sChain base port, ports and endpoints to node dicts of the sChain group """
+    indexes = [get_schain_index_in_node(schain_id, schain_ids)
+               for schain_ids in schains_ids_on_nodes]
+    base_ports = schain_base_ports([node_dict['base_port'] for node_dict in node_dicts], indexes)
+    for node_dict, base_port, ports in zip(node_dicts, base_ports.tolist(),
+                                           endpoint_port_rows(base_ports)):
+        node_dict['schain_base_port'] = base_port
+        node_dict.update(ports)
+        compose_endpoints(node_dict, endpoint_type='ip')
+        compose_endpoints(node_dict, endpoint_type='domain')
+    return node_dicts
+
+
+def schain_nodes_endpoints(nodes, schain_id):
+    """ Ports and endpoints of the sChain on its nodes, same format as endpoints.py """
+    node_dicts = [
+        {
+            'id': node['id'],
+            'name': node['name'],
+            'ip': node['ip'],
+            'base_port': node['port'],
+            'domain': node['domain']
+        }
+        for node in nodes
+    ]
+    return add_schain_ports(node_dicts, schain_id, [node['schain_ids'] for node in nodes])
+
+
+def to_hex(value):
+    return '0x' + bytes(value).hex()
+
+
+class Topology:
+    def __init__(self, endpoint, web3, abi, full_refresh_interval=DEFAULT_FULL_REFRESH_INTERVAL):
+        self.endpoint = endpoint
+        self.web3 = web3
+        self.full_refresh_interval = full_refresh_interval
+        self.event_addresses = [abi[f'{name}_address'] for name in EVENT_CONTRACTS
+                                if f'{name}_address' in abi]
+        self.schains_internal = web3.eth.contract(address=abi['schains_internal_address'],
+                                                  abi=abi['schains_internal_abi'])
+        self.nodes_contract = web3.eth.contract(address=abi['nodes_address'],
+                                                abi=abi['nodes_abi'])
+        self.block_number = None
+        self.version = 0
+        # sChain id (hex) -> {'id', 'raw_id', 'name', 'struct', 'nodes'}
+        self.schains = {}
+        # node id -> node record with 'domain' and 'schain_ids'
+        self.nodes = {}
+        self._lock = threading.RLock()
+        self._views = {}
+        self._full_refresh_at = None
+
+    def _calls(self, calls, block_number):
+        return batch_contract_calls(self.endpoint, self.web3, calls, block_number=block_number)
+
+    def _has_events(self, from_block, to_block):
+        try:
+            logs, = batch_request(self.endpoint, [('eth_getLogs', [{
+                'address': self.event_addresses,
+                'fromBlock': block_tag(from_block),
+                'toBlock': block_tag(to_block)
+            }])], workers=1)
+        except (BatchRPCError, OSError) as err:
+            logger.warning(f'Reading manager events failed ({err}), re-reading topology')
+            return True
+        return bool(logs)
+
+    def refresh(self, full=False):
+        """
+        Applies changes up to the latest block, returns True if anything changed.
+        With full (or once per full_refresh_interval) all details are re-read.
+        """
+        block_number = get_block_number(self.endpoint)
+        if block_number == self.block_number and not full:
+            return False
+        full = full or self.block_number is None or \
+            time.monotonic() - self._full_refresh_at >= self.full_refresh_interval
+        if not full and not self._has_events(self.block_number + 1, block_number):
+            with self._lock:
+                self.block_number = block_number
+            return False
+        schain_ids, number_of_nodes = self._calls([
+            (self.schains_internal, 'getSchains', []),
+            (self.nodes_contract, 'getNumberOfNodes', [])
+        ], block_number)
+        node_ids = list(range(number_of_nodes))
+        results = self._calls(
+            [(self.schains_internal, 'getNodesInGroup', [raw_id]) for raw_id in schain_ids] +
+            [(self.nodes_contract, 'nodes', [node_id]) for node_id in node_ids],
+            block_number
+        )
+        groups = dict(zip(map(to_hex, schain_ids), results[:len(schain_ids)]))
+        structs = dict(zip(node_ids, results[len(schain_ids):]))
+        raw_ids = dict(zip(map(to_hex, schain_ids), schain_ids))
+
+        with self._lock:
+            new_schains = [sid for sid in groups if sid not in self.schains]
+            removed_schains = [sid for sid in self.schains if sid not in groups]
+            changed_nodes = {
+                node_id for node_id, raw in structs.items()
+                if node_id not in self.nodes or self.nodes[node_id]['raw'] != list(raw)
+            }
+            # sChain lists (and so ports) change on nodes that join or leave groups
+            for sid, members in groups.items():
+                old_members = self.schains.get(sid, {}).get('nodes', [])
+                if list(members) != old_members:
+                    changed_nodes.update(members)
+                    changed_nodes.update(old_members)
+            for sid in removed_schains:
+                changed_nodes.update(self.schains[sid]['nodes'])
+            changed_nodes &= set(node_ids)
+            changed = bool(new_schains or removed_schains or changed_nodes)
+
+        # a full refresh re-reads details that can change without events
+        read_schains = list(groups) if full else new_schains
+        read_nodes = node_ids if full else sorted(changed_nodes)
+        details = self._calls(
+            [(self.schains_internal, 'schains', [raw_ids[sid]]) for sid in read_schains] +
+            [call for node_id in read_nodes for call in (
+                (self.nodes_contract, 'getNodeDomainName', [node_id]),
+                (self.schains_internal, 'getSchainIdsForNode', [node_id])
+            )],
+            block_number
+        ) if read_schains or read_nodes else []
+        schain_structs = details[:len(read_schains)]
+        node_details = details[len(read_schains):]
+
+        with self._lock:
+            for sid in removed_schains:
+                del self.schains[sid]
+            for sid, struct in zip(read_schains, schain_structs):
+                old = self.schains.get(sid)
+                if old is not None and old['struct'] == list(struct):
+                    continue
+                self.schains[sid] = {'id': sid, 'raw_id': raw_ids[sid],
+                                     'name': struct[0], 'struct': list(struct)}
+                changed = True
+            for sid, members in groups.items():
+                self.schains[sid]['nodes'] = list(members)
+            for node_id in [node_id for node_id in self.nodes if node_id not in structs]:
+                del self.nodes[node_id]
+            for i, node_id in enumerate(read_nodes):
+                raw = structs[node_id]
+                domain, node_schain_ids = node_details[2 * i:2 * i + 2]
+                node = {'id': node_id, 'raw': list(raw)}
+                node.update(zip(NODE_FIELDS, raw))
+                node['ip'] = ip_from_bytes(node['ip'])
+                node['publicIP'] = ip_from_bytes(node['publicIP'])
+                node['domain'] = domain
+                node['schain_ids'] = list(node_schain_ids)
+                if self.nodes.get(node_id) != node:
+                    self.nodes[node_id] = node
+                    changed = True
+            if changed:
+                self.version += 1
+                self._views = {}
+            self.block_number = block_number
+            if full:
+                self._full_refresh_at = time.monotonic()
+        logger.info(f'Topology at block {block_number}{" (full)" if full else ""}: '
+                    f'{len(self.schains)} sChains, {len(self.nodes)} nodes, '
+                    f'{len(new_schains)} new, {len(removed_schains)} removed, '
+                    f'{len(changed_nodes)} nodes updated')
+        return changed
+
+    def records(self):
+        """ Consistent copy of the topology: (block number, {node id: node}, sChains) """
+        with self._lock:
+            return (
+                self.block_number,
+                {node_id: dict(node) for node_id, node in self.nodes.items()},
+                [dict(schain) for schain in self.schains.values()]
+            )
+
+    def find_schain(self, name):
+        for schain in self.schains.values():
+            if schain['name'] == name:
+                return schain
+        return None
+
+    def schain_endpoints(self, schain):
+        return {
+            'schain': schain['struct'],
+            'nodes': schain_nodes_endpoints(
+                [self.nodes[node_id] for node_id in schain['nodes']], schain['raw_id'])
+        }
+
+    def schain_summary(self, schain):
+        return {'id': schain['id'], 'name': schain['name'], 'nodes': schain['nodes']}
+
+    def node_summary(self, node):
+        return {key: value for key, value in node.items() if key not in ('raw', 'schain_ids')}
+
+    def node_schains(self, node_id):
+        node = self.nodes[node_id]
+        by_raw_id = {schain['raw_id']: schain for schain in self.schains.values()}
+        base_ports = schain_base_ports([node['port']] * len(node['schain_ids']),
+                                       range(len(node['schain_ids'])))
+        return [
+            {
+                'id': to_hex(raw_id),
+                'name': by_raw_id[raw_id]['name'] if raw_id in by_raw_id else None,
+                'schain_base_port': base_port
+            }
+            for raw_id, base_port in zip(node['schain_ids'], base_ports.tolist())
+        ]
+
+    def port_audit(self):
+        return audit(self.nodes.values())
+
+    def view(self, path):
+        """ Returns JSON serializable data for the service path or None """
+        parts = [part for part in path.strip('/').split('/') if part]
+        with self._lock:
+            if parts == ['schains']:
+                return [self.schain_summary(schain) for schain in self.schains.values()]
+            if len(parts) == 2 and parts[0] == 'schains':
+                schain = self.find_schain(parts[1])
+                return self.schain_endpoints(schain) if schain else None
+            if parts == ['nodes']:
+                return [self.node_summary(node) for node in self.nodes.values()]
+            if len(parts) == 3 and parts[0] == 'nodes' and parts[2] == 'schains' and \
+                    parts[1].isdigit() and int(parts[1]) in self.nodes:
+                return self.node_schains(int(parts[1]))
+            if parts == ['ports']:
+                return self.port_audit()
+            if parts == ['endpoints']:
+                return [self.schain_endpoints(schain) for schain in self.schains.values()]
+            if parts == ['status']:
+                return {'block_number': self.block_number, 'version': self.version,
+                        'schains': len(self.schains), 'nodes': len(self.nodes)}
+        return None
+
+    def view_at_block(self, path):
+        """ (block number, view(path)) read together """
+        with self._lock:
+            return self.block_number, self.view(path)
+
+    def render(self, path):
+        """
+        Returns (body, etag) for path or (None, None) for unknown paths.
+        Bodies are cached until the next topology change, ETag is the content hash.
+        """
+        with self._lock:
+            version = self.version
+            cached = self._views.get(path)
+        if cached is not None:
+            return cached
+        data = self.view(path)
+        if data is None:
+            return None, None
+        body = json.dumps(data, default=to_hex).encode()
+        rendered = body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        with self._lock:
+            # status changes with every block, it's cheap to render
+            if self.version == version and path != '/status':
+                self._views[path] = rendered
+        return rendered
@@ -0,0 +1,202 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Columnar topology export for analytics.
+
+Three tables are exported: nodes, sChains and node <-> sChain membership
+(one row per sChain on a node). They are saved as one compressed .npz file
+or, if pyarrow is installed, as a directory of Parquet files. Load statistics
+are computed with NumPy over the columns.
+"""
+
+import logging
+import os
+
+import numpy as np
+
+from port_engine import schain_base_ports
+from topology import get_schain_index_in_node
+
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_NODE_STATUS = 0
+TABLES = {
+    'nodes': ['node_id', 'node_name', 'node_ip', 'node_port', 'node_status',
+              'node_validator_id'],
+    'schains': ['schain_id', 'schain_name', 'schain_owner'],
+    'membership': ['member_node_id', 'member_schain', 'member_base_port']
+}
+
+
+def columns_from_topology(topology):
+    """ Returns {column name: array}, member_schain is a row in the sChain table """
+    _, nodes_by_id, schains = topology.records()
+    nodes = [nodes_by_id[node_id] for node_id in sorted(nodes_by_id)]
+    member_schain, member_node_id, schain_indexes, node_base_ports = [], [], [], []
+    for row, schain in enumerate(schains):
+        for node_id in schain['nodes']:
+            node = nodes_by_id[node_id]
+            member_schain.append(row)
+            member_node_id.append(node_id)
+            schain_indexes.append(get_schain_index_in_node(schain['raw_id'],
+                                                           node['schain_ids']))
+            node_base_ports.append(node['port'])
+    return {
+        'node_id': np.array([node['id'] for node in nodes], dtype=np.int64),
+        'node_name': np.array([node['name'] for node in nodes], dtype=str),
+        'node_ip': np.array([node['ip'] for node in nodes], dtype=str),
+        'node_port': np.array([node['port'] for node in nodes], dtype=np.int64),
+        'node_status': np.array([node['status'] for node in nodes], dtype=np.int64),
+        'node_validator_id': np.array([node['validator_id'] for node in nodes],
+                                      dtype=np.int64),
+        'schain_id': np.array([schain['id'] for schain in schains], dtype=str),
+        'schain_name': np.array([schain['name'] for schain in schains], dtype=str),
+        'schain_owner': np.array([schain['struct'][1] if len(schain['struct']) > 1 else ''
+                                  for schain in schains], dtype=str),
+        'member_node_id': np.array(member_node_id, dtype=np.int64),
+        'member_schain': np.array(member_schain, dtype=np.int64),
+        'member_base_port': schain_base_ports(node_base_ports, schain_indexes)
+    }
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def save_columns(path, columns, fmt='npz'):
+    """ Saves columns, returns path that was written """
+    if fmt == 'parquet' and not parquet_available():
+        logger.warning('pyarrow is not installed, saving columns as .npz')
+        fmt = 'npz'
+    if fmt == 'npz':
+        if not path.endswith('.npz'):
+            path = f'{path}.npz'
+        np.savez_compressed(path, **columns)
+        return path
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(path, exist_ok=True)
+    for table, names in TABLES.items():
+        pq.write_table(pa.table({name: columns[name] for name in names}),
+                       os.path.join(path, f'{table}.parquet'))
+    return path
+
+
+def load_columns(path):
+    if os.path.isdir(path):
+        import pyarrow.parquet as pq
+
+        columns = {}
+        for table in TABLES:
+            data = pq.read_table(os.path.join(path, f'{table}.parquet'))
+            columns.update({name: data.column(name).to_numpy() for name in data.column_names})
+        return columns
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+
+def load_stats(values):
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return {'min': None, 'max': None, 'mean': None, 'std': None,
+                'max_to_mean': None, 'gini': None}
+    mean = values.mean()
+    ordered = np.sort(values)
+    ranks = np.arange(1, len(values) + 1)
+    gini = (2 * (ranks * ordered).sum() / (len(values) * ordered.sum()) -
+            (len(values) + 1) / len(values)) if ordered.sum() else 0.0
+    return {
+        'min': float(ordered[0]),
+        'max': float(ordered[-1]),
+        'mean': round(float(mean), 3),
+        'std': round(float(values.std()), 3),
+        'max_to_mean': round(float(ordered[-1] / mean), 3) if mean else None,
+        'gini': round(float(gini), 3)
+    }
+
+
+def analyze(columns, active_only=False, top=10):
+    """ Per-node and per-validator sChain load with imbalance statistics """
+    node_ids = columns['node_id']
+    selected = columns['node_status'] == ACTIVE_NODE_STATUS if active_only \
+        else np.ones(len(node_ids), dtype=bool)
+    rows = np.searchsorted(node_ids, columns['member_node_id'])
+    per_node = np.bincount(rows, minlength=len(node_ids))[selected]
+    node_ids = node_ids[selected]
+    validator_ids = columns['node_validator_id'][selected]
+
+    validators, validator_rows = np.unique(validator_ids, return_inverse=True)
+    validator_rows = validator_rows.reshape(-1)
+    per_validator = np.bincount(validator_rows, weights=per_node, minlength=len(validators))
+    nodes_per_validator = np.bincount(validator_rows, minlength=len(validators))
+    per_validator_node = np.divide(per_validator, nodes_per_validator,
+                                   out=np.zeros(len(validators)), where=nodes_per_validator > 0)
+
+    busiest_nodes = np.argsort(-per_node, kind='stable')[:top]
+    busiest_validators = np.argsort(-per_validator, kind='stable')[:top]
+    counts, amounts = np.unique(per_node, return_counts=True)
+    return {
+        'nodes': int(len(node_ids)),
+        'schains': int(len(columns['schain_id'])),
+        'allocations': int(per_node.sum()),
+        'empty_nodes': int((per_node == 0).sum()),
+        'node_load': load_stats(per_node),
+        'nodes_by_schain_count': dict(zip(counts.tolist(), amounts.tolist())),
+        'validator_load': load_stats(per_validator),
+        'validator_load_per_node': load_stats(per_validator_node),
+        'busiest_nodes': [
+            {'id': int(node_ids[i]), 'schains': int(per_node[i])} for i in busiest_nodes
+        ],
+        'busiest_validators': [
+            {'id': int(validators[i]), 'schains': int(per_validator[i]),
+             'nodes': int(nodes_per_validator[i])}
+            for i in busiest_validators
+        ]
+    }
+
+
+def format_analysis(result):
+    def stats_line(name, stats):
+        if stats['mean'] is None:
+            return f'{name}: no data'
+        return (f'{name}: min {stats["min"]:g}, max {stats["max"]:g}, mean {stats["mean"]}, '
+                f'std {stats["std"]}, max/mean {stats["max_to_mean"]}, gini {stats["gini"]}')
+
+    lines = [
+        f'{result["nodes"]} nodes, {result["schains"]} sChains, '
+        f'{result["allocations"]} allocations, {result["empty_nodes"]} nodes without sChains',
+        stats_line('sChains per node', result['node_load']),
+        stats_line('sChains per validator', result['validator_load']),
+        stats_line('sChains per validator node', result['validator_load_per_node']),
+        'Nodes by sChain count: ' + ', '.join(
+            f'{count}: {amount}' for count, amount in result['nodes_by_schain_count'].items()),
+        'Busiest nodes: ' + ', '.join(
+            f'{node["id"]} ({node["schains"]})' for node in result['busiest_nodes']),
+        'Busiest validators: ' + ', '.join(
+            f'{validator["id"]} ({validator["schains"]} on {validator["nodes"]} nodes)'
+            for validator in result['busiest_validators'])
+    ]
+    return '\n'.join(lines)
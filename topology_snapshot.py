@@ -0,0 +1,186 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Topology snapshots with content hashes.
+
+A snapshot keeps one record per sChain (struct and node group) and per node
+(name, IP, domain, base port and sChain base ports), each with a hash of its
+canonical JSON, plus a hash of the whole snapshot. Endpoints are derived from
+these fields, so they aren't stored. Diffs compare hashes first and look into
+records only when hashes differ.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+
+
+SNAPSHOT_VERSION = 1
+SCHAIN_FIELDS = [
+    'name', 'owner', 'index_in_owner_list', 'part_of_node', 'lifetime', 'start_date',
+    'start_block', 'deposit', 'index', 'generation', 'originator'
+]
+
+
+def to_json_value(value):
+    if isinstance(value, (bytes, bytearray)):
+        return '0x' + bytes(value).hex()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def content_hash(record):
+    data = json.dumps(record, sort_keys=True, separators=(',', ':'), default=to_json_value)
+    return hashlib.sha256(data.encode()).hexdigest()[:32]
+
+
+def schain_fields(struct):
+    names = SCHAIN_FIELDS + [f'field_{i}' for i in range(len(SCHAIN_FIELDS), len(struct))]
+    return dict(zip(names, struct))
+
+
+def snapshot_from_endpoints(endpoints, block_number=None):
+    """ Builds snapshot from endpoints.py results (or /endpoints of serve) """
+    schains, nodes = {}, {}
+    for item in endpoints:
+        fields = schain_fields(item['schain'])
+        schains[fields['name']] = {
+            'fields': fields,
+            'nodes': [node['id'] for node in item['nodes']]
+        }
+        for node in item['nodes']:
+            record = nodes.setdefault(str(node['id']), {
+                'name': node['name'],
+                'ip': node['ip'],
+                'domain': node['domain'],
+                'base_port': node['base_port'],
+                'schains': {}
+            })
+            record['schains'][fields['name']] = node['schain_base_port']
+    # round trip makes records equal to the loaded ones (tuples, bytes)
+    schains = json.loads(json.dumps(schains, default=to_json_value))
+    for record in list(schains.values()) + list(nodes.values()):
+        record['hash'] = content_hash(record)
+    return {
+        'version': SNAPSHOT_VERSION,
+        'block_number': block_number,
+        'hash': content_hash({
+            'schains': {name: record['hash'] for name, record in schains.items()},
+            'nodes': {node_id: record['hash'] for node_id, record in nodes.items()}
+        }),
+        'schains': schains,
+        'nodes': nodes
+    }
+
+
+def snapshot_from_topology(topology):
+    block_number, endpoints = topology.view_at_block('/endpoints')
+    return snapshot_from_endpoints(endpoints, block_number)
+
+
+def save_snapshot(path, snapshot):
+    tmp_path = f'{path}.tmp'
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(tmp_path, 'wt') as outfile:
+        json.dump(snapshot, outfile, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as infile:
+        snapshot = json.load(infile)
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f'{path} is not a topology snapshot '
+                         f'(version {snapshot.get("version")}, expected {SNAPSHOT_VERSION})')
+    return snapshot
+
+
+def changed_fields(old, new):
+    return {
+        key: [old.get(key), new.get(key)]
+        for key in sorted(set(old) | set(new))
+        if old.get(key) != new.get(key)
+    }
+
+
+def diff_snapshots(old, new):
+    """ Returns changes between snapshots, empty dict if they are equal """
+    if old['hash'] == new['hash']:
+        return {}
+    diff = {
+        'blocks': [old['block_number'], new['block_number']]
+        if old['block_number'] is not None or new['block_number'] is not None else None,
+        'added_schains': sorted(set(new['schains']) - set(old['schains'])),
+        'removed_schains': sorted(set(old['schains']) - set(new['schains'])),
+        'rotations': [],
+        'schains': {},
+        'added_nodes': sorted(set(new['nodes']) - set(old['nodes']), key=int),
+        'removed_nodes': sorted(set(old['nodes']) - set(new['nodes']), key=int),
+        'nodes': {}
+    }
+    for name in sorted(set(old['schains']) & set(new['schains'])):
+        before, after = old['schains'][name], new['schains'][name]
+        if before['hash'] == after['hash']:
+            continue
+        if before['nodes'] != after['nodes']:
+            diff['rotations'].append({
+                'schain': name,
+                'left': [node_id for node_id in before['nodes'] if node_id not in after['nodes']],
+                'joined': [node_id for node_id in after['nodes'] if node_id not in before['nodes']]
+            })
+        fields = changed_fields(before['fields'], after['fields'])
+        if fields:
+            diff['schains'][name] = fields
+    for node_id in sorted(set(old['nodes']) & set(new['nodes']), key=int):
+        before, after = old['nodes'][node_id], new['nodes'][node_id]
+        if before['hash'] == after['hash']:
+            continue
+        fields = changed_fields(
+            {key: value for key, value in before.items() if key not in ('hash', 'schains')},
+            {key: value for key, value in after.items() if key not in ('hash', 'schains')}
+        )
+        ports = changed_fields(before['schains'], after['schains'])
+        if ports:
+            fields['schain_base_ports'] = ports
+        diff['nodes'][node_id] = fields
+    return {key: value for key, value in diff.items() if value}
+
+
+def format_diff(diff):
+    if not diff:
+        return 'No changes'
+    lines = [f'Blocks {diff["blocks"][0]} -> {diff["blocks"][1]}'] if 'blocks' in diff else []
+    lines += [f'sChain {name} added' for name in diff.get('added_schains', [])]
+    lines += [f'sChain {name} removed' for name in diff.get('removed_schains', [])]
+    lines += [
+        f'sChain {rotation["schain"]} rotated: nodes {rotation["left"]} -> {rotation["joined"]}'
+        for rotation in diff.get('rotations', [])
+    ]
+    for name, fields in diff.get('schains', {}).items():
+        lines += [f'sChain {name} {key}: {old} -> {new}' for key, (old, new) in fields.items()]
+    lines += [f'Node {node_id} added' for node_id in diff.get('added_nodes', [])]
+    lines += [f'Node {node_id} removed' for node_id in diff.get('removed_nodes', [])]
+    for node_id, fields in diff.get('nodes', {}).items():
+        fields = dict(fields)
+        ports = fields.pop('schain_base_ports', {})
+        lines += [f'Node {node_id} {key}: {old} -> {new}' for key, (old, new) in fields.items()]
+        lines += [f'Node {node_id} port of {name}: {old} -> {new}'
+                  for name, (old, new) in ports.items()]
+    return '\n'.join(lines)
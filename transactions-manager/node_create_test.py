@@ -1,5 +1,4 @@
 import os
-import threading
 
 import skale.utils.helper as Helper
 from skale import Skale
@@ -8,6 +7,7 @@ from skale.wallets import RPCWallet
 from skale.utils.constants import LONG_LINE
 from utils import generate_random_node_data
 
+from concurrency import AimdLimiter
 from config import ENDPOINT, ABI_FILEPATH
 
 
@@ -17,7 +17,8 @@ TM_URL = os.environ['TM_URL']
 wallet = RPCWallet(TM_URL)
 skale = Skale(ENDPOINT, ABI_FILEPATH, wallet)
 
-amount = 1000
+amount = 5000
+MAX_CONCURRENCY = int(os.environ.get('MAX_CONCURRENCY', 32))
 
 
 def create_node(skale, wallet):
@@ -26,19 +27,18 @@ def create_node(skale, wallet):
     skale.manager.create_node(ip, port, name, public_ip)
 
 
-def create_nodes():
-    skale = Skale(ENDPOINT, ABI_FILEPATH, wallet)
-    print(f'Creating {amount} nodes...')
-    for i in range(int(amount)):
-        print(LONG_LINE)
-        print(f'Creating {i+1}/{amount} node...')
+def try_create_node(i):
+    print(LONG_LINE)
+    print(f'Creating {i+1}/{amount} node...')
+    try:
         create_node(skale, wallet)
+        return True
+    except Exception as err:
+        print(f'Node creation failed: {err}')
+        return False
 
 
-monitors = []
-for _ in range(0, 5):
-    monitor = threading.Thread(target=create_nodes, daemon=True)
-    monitor.start()
-    monitors.append(monitor)
-for monitor in monitors:
-    monitor.join()
+print(f'Creating {amount} nodes...')
+limiter = AimdLimiter(initial=5, max_limit=MAX_CONCURRENCY, name='tm')
+limiter.map(try_create_node, range(amount), is_overload=lambda created: not created)
+print(limiter.format_stats())
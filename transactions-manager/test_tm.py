@@ -1,12 +1,14 @@
-import threading
 import os
 from skale import Skale
 from skale.wallets import RPCWallet
+from concurrency import AimdLimiter
 from config import ENDPOINT, ABI_FILEPATH
 from utils import generate_random_node_data
 from skale.utils.web3_utils import wait_receipt
 
 TM_URL = os.environ['TM_URL']
+NODES_AMOUNT = 500
+MAX_CONCURRENCY = int(os.environ.get('MAX_CONCURRENCY', 32))
 
 wallet = RPCWallet(TM_URL)
 skale = Skale(ENDPOINT, ABI_FILEPATH, wallet)
@@ -15,18 +17,17 @@ print('Address: ', wallet.address)
 
 
 def main():
-    monitors = []
-    for _ in range(0, 5):
-        monitor = threading.Thread(target=create_nodes, daemon=True)
-        monitor.start()
-        monitors.append(monitor)
-    for monitor in monitors:
-        monitor.join()
-
-
-def create_nodes():
-    for _ in range(0, 100):
-        create_node()
+    limiter = AimdLimiter(initial=5, max_limit=MAX_CONCURRENCY, name='tm')
+    limiter.map(try_create_node, range(NODES_AMOUNT), is_overload=lambda receipt: receipt is None)
+    print(limiter.format_stats())
+
+
+def try_create_node(_):
+    try:
+        return create_node()
+    except Exception as err:
+        print(f'Node creation failed: {err}')
+        return None
 
 
 def create_node():
@@ -0,0 +1,267 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+""" Pipelined sending of many transactions from one wallet """
+
+import json
+import logging
+import os
+import time
+from collections import Counter
+
+from batch_rpc import batch_request
+from nonce_manager import manage_nonces, replacement_gas_price
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_IN_FLIGHT = 16
+RECEIPT_POLL_INTERVAL = 3
+CONFIRMATION_TIMEOUT = 30 * 60
+# Seconds before an unmined transaction is resent with a higher gas price
+REPLACE_AFTER = None
+# Replacements stop below this multiple of the initial gas price unless a cap is given
+MAX_GAS_PRICE_FACTOR = 2
+
+SENT = 'sent'
+SUCCESS = 'success'
+FAILED = 'failed'
+ERROR = 'error'
+# the nonce was mined by a transaction that isn't in the ledger
+UNKNOWN = 'unknown'
+
+
+class RowKeys:
+    """
+    Ledger keys built from row content, identical rows are numbered by occurrence.
+    Keys don't depend on line numbers, so editing other lines of the input
+    file doesn't change them.
+    """
+
+    def __init__(self):
+        self._seen = Counter()
+
+    def key(self, *fields):
+        content = ':'.join(str(field) for field in fields)
+        self._seen[content] += 1
+        return f'{content}#{self._seen[content]}'
+
+
+def load_ledger(path):
+    """ Returns last ledger record for each key """
+    records = {}
+    if not path or not os.path.isfile(path):
+        return records
+    with open(path) as ledger_file:
+        for line in ledger_file:
+            if line.strip():
+                record = json.loads(line)
+                records[record['key']] = record
+    return records
+
+
+def append_ledger(path, record):
+    if not path:
+        return
+    with open(path, 'a') as ledger_file:
+        ledger_file.write(json.dumps(record) + '\n')
+        ledger_file.flush()
+        os.fsync(ledger_file.fileno())
+
+
+def receipt_status(receipt):
+    return SUCCESS if int(receipt['status'], 16) == 1 else FAILED
+
+
+class TxPipeline:
+    """
+    Sends transactions from skale.wallet with nonces from its nonce manager,
+    keeps at most max_in_flight unconfirmed transactions and confirms them
+    with batched receipt polling. Every state change is appended to the
+    ledger file, so an interrupted run can be resumed.
+    With replace_after, transactions that are not mined in that many seconds
+    are resent with the same nonce and a higher gas price, up to max_gas_price.
+    All hashes sent for a key are kept, the key is settled when any of them is
+    mined or when the account nonce passes the key's nonce.
+    """
+
+    def __init__(self, skale, endpoint, ledger_path=None,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, gas_price=None,
+                 poll_interval=RECEIPT_POLL_INTERVAL,
+                 timeout=CONFIRMATION_TIMEOUT, replace_after=REPLACE_AFTER,
+                 max_gas_price=None):
+        self.skale = skale
+        self.endpoint = endpoint
+        self.ledger_path = ledger_path
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.gas_price = gas_price or skale.web3.eth.gasPrice
+        self.chain_id = skale.web3.eth.chainId
+        self.replace_after = replace_after
+        self.max_gas_price = max_gas_price or self.gas_price * MAX_GAS_PRICE_FACTOR
+        self.records = load_ledger(ledger_path)
+        # tx hash -> key, all hashes sent for unsettled keys
+        self.in_flight = {}
+        # key -> nonce and key -> hashes of unsettled keys
+        self.key_nonces = {}
+        self.key_hashes = {}
+        # key -> (build_tx, tx_fields, sent time) of transactions that can be replaced
+        self.pending = {}
+        self.nonces = manage_nonces(skale.wallet, skale.web3).nonce_manager
+
+    def _record(self, key, status, **fields):
+        record = {'key': key, 'status': status, 'ts': time.time(), **fields}
+        self.records[key] = record
+        append_ledger(self.ledger_path, record)
+        return record
+
+    def _track(self, key, tx_hash, nonce):
+        self.in_flight[tx_hash] = key
+        self.key_nonces[key] = nonce
+        self.key_hashes.setdefault(key, []).append(tx_hash)
+        self._record(key, SENT, tx_hash=tx_hash, nonce=nonce,
+                     tx_hashes=list(self.key_hashes[key]))
+
+    def _settle(self, key, status, **fields):
+        for tx_hash in self.key_hashes.pop(key, []):
+            self.in_flight.pop(tx_hash, None)
+        nonce = self.key_nonces.pop(key, None)
+        self.pending.pop(key, None)
+        if self.nonces and nonce is not None:
+            self.nonces.forget(nonce)
+        self._record(key, status, **fields)
+
+    def _poll(self):
+        tx_hashes = list(self.in_flight)
+        calls = [('eth_getTransactionReceipt', [tx_hash]) for tx_hash in tx_hashes]
+        check_nonces = any(nonce is not None for nonce in self.key_nonces.values())
+        if check_nonces:
+            # read before receipts: nonces below it are mined, so their receipts are found
+            calls.insert(0, ('eth_getTransactionCount', [self.skale.wallet.address, 'latest']))
+        results = batch_request(self.endpoint, calls)
+        mined_count = int(results.pop(0), 16) if check_nonces else None
+        receipts = dict(zip(tx_hashes, results))
+        for tx_hash, receipt in receipts.items():
+            key = self.in_flight.get(tx_hash)
+            if receipt is None or key is None:
+                continue
+            self._settle(key, receipt_status(receipt), tx_hash=tx_hash,
+                         block_number=int(receipt['blockNumber'], 16),
+                         gas_used=int(receipt['gasUsed'], 16))
+        if mined_count is not None:
+            for key, nonce in list(self.key_nonces.items()):
+                if nonce is not None and nonce < mined_count:
+                    logger.warning(f'Nonce {nonce} of {key} was mined by a transaction '
+                                   f'that is not in the ledger')
+                    self._settle(key, UNKNOWN, nonce=nonce,
+                                 error=f'nonce {nonce} was used by another transaction')
+        return receipts
+
+    def _wait_for_slot(self, limit):
+        start = time.time()
+        while len(self.key_hashes) > limit:
+            if time.time() - start > self.timeout:
+                raise TimeoutError(
+                    f'{len(self.key_hashes)} transactions were not mined '
+                    f'in {self.timeout} seconds'
+                )
+            self._poll()
+            if len(self.key_hashes) > limit:
+                self._replace_stuck()
+                time.sleep(self.poll_interval)
+
+    def _replace_stuck(self):
+        if not self.replace_after or self.nonces is None:
+            return
+        now = time.time()
+        for key, (build_tx, tx_fields, sent_at) in list(self.pending.items()):
+            if sent_at is None or now - sent_at < self.replace_after:
+                continue
+            gas_price = replacement_gas_price(tx_fields['gasPrice'])
+            if gas_price > self.max_gas_price:
+                logger.warning(f'Not replacing {key}: gas price {gas_price} is above '
+                               f'{self.max_gas_price}')
+                self.pending[key] = (build_tx, tx_fields, None)
+                continue
+            tx_fields = {**tx_fields, 'gasPrice': gas_price}
+            try:
+                tx_hash = self.skale.wallet.sign_and_send(build_tx(tx_fields))
+            except Exception as err:
+                # the original transaction could be mined meanwhile
+                logger.warning(f'Replacing {key} failed: {err}')
+                self.pending[key] = (build_tx, tx_fields, now)
+                continue
+            logger.info(f'Replaced {key}: {tx_hash}, nonce {tx_fields["nonce"]}, '
+                        f'gas price {tx_fields["gasPrice"]}')
+            self.pending[key] = (build_tx, tx_fields, now)
+            self._track(key, tx_hash, tx_fields['nonce'])
+
+    def resume(self):
+        """ Picks up transactions that were sent by the previous run """
+        for key, record in self.records.items():
+            if record['status'] == SENT:
+                self.key_nonces[key] = record.get('nonce')
+                self.key_hashes[key] = record.get('tx_hashes') or [record['tx_hash']]
+                for tx_hash in self.key_hashes[key]:
+                    self.in_flight[tx_hash] = key
+        if self.key_hashes:
+            logger.info(f'Resuming {len(self.key_hashes)} pending transactions')
+            self._poll()
+
+    def is_done(self, key):
+        record = self.records.get(key)
+        return record is not None and record['status'] in (SENT, SUCCESS, UNKNOWN)
+
+    def send(self, key, build_tx):
+        """
+        Sends transaction produced by build_tx(tx_fields) where tx_fields
+        contains nonce (unless the transactions manager assigns it),
+        gasPrice and chainId.
+        """
+        if self.is_done(key):
+            logger.info(f'Skipping {key}, already processed')
+            return
+        self._wait_for_slot(self.max_in_flight - 1)
+        tx_fields = {'gasPrice': self.gas_price, 'chainId': self.chain_id}
+        if self.nonces:
+            tx_fields['nonce'] = self.nonces.reserve()
+        try:
+            tx_hash = self.skale.wallet.sign_and_send(build_tx(tx_fields))
+        except Exception as err:
+            logger.error(f'Sending {key} failed', exc_info=err)
+            if self.nonces:
+                self.nonces.release(tx_fields['nonce'], err)
+            self._record(key, ERROR, error=str(err))
+            return
+        nonce = tx_fields.get('nonce')
+        logger.info(f'Sent {key}: {tx_hash}, nonce {nonce}')
+        if self.nonces:
+            self.nonces.confirm(nonce, tx_hash)
+            self.pending[key] = (build_tx, tx_fields, time.time())
+        self._track(key, tx_hash, nonce)
+
+    def wait_all(self):
+        self._wait_for_slot(0)
+
+    def summary(self, keys):
+        statuses = {}
+        for key in keys:
+            status = self.records.get(key, {}).get('status', ERROR)
+            statuses[status] = statuses.get(status, 0) + 1
+        return statuses
@@ -17,19 +17,112 @@
 #   You should have received a copy of the GNU Lesser General Public License
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import logging
 import random
+import socket
 import string
-
-from skale.wallets import LedgerWallet, RPCWallet, Web3Wallet
-from skale.utils.web3_utils import init_web3
-
-from config import ETH_PRIVATE_KEY, LEDGER, TM_URL
-from skale.utils.account_tools import (check_ether_balance,
-                                       check_skale_balance, generate_account,
-                                       send_ether, send_tokens)
+import sys
+
+import abi_cache
+import rpc_hedge
+import rpc_pool
+import rpc_profile
+import rpc_trace
+from config import (ETH_PRIVATE_KEY, GAS_ESTIMATE_MEMO, GAS_PRICE_TTL, HEDGE_BUDGET,
+                    HEDGE_PERCENTILE, LEDGER, READ_ENDPOINTS, RPC_CACHE_PATH,
+                    RPC_CACHE_PIN_TTL, RPC_CACHE_SIZE, RPC_LB_STRATEGY, TM_URL)
+from gas_strategy import GasStrategy
+from nonce_manager import manage_nonces
+from rpc_cache import RpcCache
+
+LONG_LINE = '=' * 100
+
+
+def init_default_logger():
+    """ Same as skale.utils.helper.init_default_logger without importing skale """
+    formatter = logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(formatter)
+    stream_handler.setLevel(logging.INFO)
+    logging.basicConfig(level=logging.DEBUG, handlers=[stream_handler])
+
+
+class LazyClients(dict):
+    """
+    Context object that creates wallet, Skale and SkaleIma objects
+    only when a command accesses them for the first time.
+    All of them share one block-pinned RpcCache (enabled with RPC_CACHE_SIZE)
+    and, if READ_ENDPOINTS are set, one pool of endpoints for reads.
+    Gas prices and (with GAS_ESTIMATE_MEMO) gas estimates are cached by GasStrategy.
+    """
+
+    def __init__(self, endpoint, abi_filepath, ima_abi_filepath=None, **kwargs):
+        super().__init__(endpoint=endpoint, abi_filepath=abi_filepath,
+                         ima_abi_filepath=ima_abi_filepath, **kwargs)
+        self._factories = {
+            'wallet': self._init_wallet,
+            'skale': self._init_skale,
+            'skale_ima': self._init_skale_ima
+        }
+        self.rpc_cache = RpcCache(RPC_CACHE_SIZE, RPC_CACHE_PATH, endpoint=endpoint,
+                                  pin_ttl=RPC_CACHE_PIN_TTL) if RPC_CACHE_SIZE > 0 else None
+        self.gas_strategy = GasStrategy(GAS_PRICE_TTL, GAS_ESTIMATE_MEMO) \
+            if GAS_PRICE_TTL or GAS_ESTIMATE_MEMO else None
+        if READ_ENDPOINTS:
+            rpc_pool.enable(endpoint, READ_ENDPOINTS, RPC_LB_STRATEGY)
+        if HEDGE_PERCENTILE and rpc_hedge.get_hedger() is None:
+            rpc_hedge.enable(HEDGE_PERCENTILE, HEDGE_BUDGET)
+
+    def __missing__(self, key):
+        if key not in self._factories:
+            raise KeyError(key)
+        self[key] = self._factories[key]()
+        return self[key]
+
+    def _install_middlewares(self, web3):
+        if web3 is None:
+            return
+        # the pool provider is wrapped by the trace one to record logical requests
+        rpc_pool.install(web3)
+        rpc_hedge.install(web3)
+        rpc_trace.install(web3)
+        if self.rpc_cache:
+            self.rpc_cache.install(web3)
+        if self.gas_strategy:
+            self.gas_strategy.install(web3)
+        profiler = rpc_profile.get_profiler()
+        if profiler:
+            # installed after the cache to count cache hits as calls
+            profiler.install(web3)
+            profiler.add_abi(abi_cache.load_abi(self['abi_filepath']))
+
+    def _init_wallet(self):
+        # commands and pipelines sending several transactions share the wallet nonces
+        wallet = manage_nonces(init_wallet(self['endpoint']))
+        # receipts and sent transactions release the pinned block
+        self._install_middlewares(getattr(wallet, '_web3', None))
+        return wallet
+
+    def _init_skale(self):
+        from skale import Skale
+        abi_cache.install()
+        skale = Skale(self['endpoint'], self['abi_filepath'], self['wallet'])
+        self._install_middlewares(skale.web3)
+        return skale
+
+    def _init_skale_ima(self):
+        from skale import SkaleIma
+        abi_cache.install()
+        skale_ima = SkaleIma(self['endpoint'], self['ima_abi_filepath'], self['wallet'])
+        self._install_middlewares(skale_ima.web3)
+        return skale_ima
 
 
 def init_wallet(endpoint):
+    from skale.wallets import LedgerWallet, RPCWallet, Web3Wallet
+    from skale.utils.web3_utils import init_web3
+
     if TM_URL:
         return RPCWallet(TM_URL)
     web3 = init_web3(endpoint)
@@ -45,6 +138,10 @@ def init_wallet(endpoint):
     return Web3Wallet(ETH_PRIVATE_KEY, web3)
 
 
+def ip_from_bytes(ip_bytes):
+    return socket.inet_ntoa(ip_bytes)
+
+
 def generate_random_ip():
     return '.'.join('%s' % random.randint(0, 255) for i in range(4))
 
@@ -70,6 +167,11 @@ def generate_random_schain_data():
 
 
 def create_account(skale, skale_amount, eth_amount, debug=True):
+    from skale.wallets import Web3Wallet
+    from skale.utils.account_tools import (check_ether_balance,
+                                           check_skale_balance, generate_account,
+                                           send_ether, send_tokens)
+
     base_wallet = Web3Wallet(ETH_PRIVATE_KEY, skale.web3)
     wallet_dict = generate_account(skale.web3)
     wallet = Web3Wallet(wallet_dict['private_key'], skale.web3)
@@ -19,33 +19,80 @@
 """ Commands to manage SKALE validators """
 
 import json
+import sys
+import time
 
 import click
 
-from skale import Skale
-from skale.utils.helper import init_default_logger
-from skale.utils.web3_utils import to_checksum_address
-from skale.wallets import Web3Wallet
-from skale.utils.web3_utils import private_key_to_address
-from web3 import Web3
-
-from config import ENDPOINT, ABI_FILEPATH
-from utils import init_wallet
+from config import (ENDPOINT, ABI_FILEPATH, DELEGATION_INDEX_PATH, DELEGATIONS_START_BLOCK,
+                    TX_MAX_GAS_PRICE, TX_REPLACE_AFTER)
+from delegation_index import DELEGATION_STATES, get_updated_index, query
+from py_profile import profile_option
+from rpc_profile import profile_rpc_option
+from rpc_trace import rpc_trace_options
+from tx_pipeline import DEFAULT_MAX_IN_FLIGHT, SUCCESS, TxPipeline
+from utils import LazyClients, init_default_logger
+from validator_snapshot import (DEFAULT_MAX_AGE, SNAPSHOT_FIELDS, fetch_trusted_validator_ids,
+                                fetch_validator, fetch_validator_snapshot, find_validator,
+                                get_validator_snapshot, project, save_snapshot,
+                                trusted_validator_ids)
 
 MONTH_IN_SECONDS = (60 * 60 * 24 * 31) + 100
+ACCEPT_DELEGATION_GAS_LIMIT = 500000
 
 init_default_logger()
 
 
 @click.group()
+@profile_option
+@profile_rpc_option
+@rpc_trace_options
 @click.option('--endpoint', default=ENDPOINT, help='Skale manager endpoint')
 @click.option('--abi-filepath', default=ABI_FILEPATH, type=click.Path(),
               help='abi file')
+@click.option('--snapshot', default=None, type=click.Path(),
+              help='Validators snapshot file (created on first use)')
+@click.option('--snapshot-max-age', default=DEFAULT_MAX_AGE,
+              help='Fetch the snapshot again if it is older than this many blocks, '
+                   '0 to use it regardless of age')
+@click.option('--refresh', is_flag=True, default=False,
+              help='Fetch the snapshot again and overwrite the file')
 @click.pass_context
-def main(ctx, endpoint, abi_filepath):
-    ctx.ensure_object(dict)
-    wallet = init_wallet(endpoint)
-    ctx.obj['skale'] = Skale(endpoint, abi_filepath, wallet)
+def main(ctx, endpoint, abi_filepath, snapshot, snapshot_max_age, refresh):
+    ctx.obj = LazyClients(endpoint, abi_filepath, snapshot_path=snapshot,
+                          snapshot_max_age=snapshot_max_age, refresh_snapshot=refresh)
+
+
+def validators_table(ctx):
+    if 'validators_table' not in ctx.obj:
+        ctx.obj['validators_table'] = get_validator_snapshot(
+            ctx.obj['skale'],
+            ctx.obj['endpoint'],
+            ctx.obj['snapshot_path'],
+            refresh=ctx.obj['refresh_snapshot'],
+            max_age=ctx.obj['snapshot_max_age']
+        )
+    return ctx.obj['validators_table']
+
+
+def get_validator(ctx, validator_id):
+    """ From the snapshot if --snapshot is given, otherwise only this validator is read """
+    if ctx.obj['snapshot_path']:
+        return find_validator(validators_table(ctx), validator_id)
+    return fetch_validator(ctx.obj['skale'], ctx.obj['endpoint'], validator_id)
+
+
+def parse_fields(fields):
+    if not fields:
+        return None
+    fields = [field.strip() for field in fields.split(',')]
+    unknown = set(fields) - set(SNAPSHOT_FIELDS)
+    if unknown:
+        raise click.BadParameter(
+            f'Unknown fields: {", ".join(sorted(unknown))}. '
+            f'Available: {", ".join(SNAPSHOT_FIELDS)}'
+        )
+    return fields
 
 
 @main.command()
@@ -66,23 +113,58 @@ def register(ctx, name):
 
 
 @main.command()
+@click.option('--json-lines', is_flag=True, default=False,
+              help='Print one validator per line')
+@click.option('--fields', default=None,
+              help='Comma separated list of fields to show')
+@click.option('--trusted-only', is_flag=True, default=False,
+              help='Show only trusted validators')
 @click.pass_context
-def ls(ctx):
+def ls(ctx, json_lines, fields, trusted_only):
     """ Show information about validators """
-    skale = ctx.obj['skale']
-    validators = skale.validator_service.ls()
-    print(json.dumps(validators, indent=4, sort_keys=True))
+    fields = parse_fields(fields)
+    validators = [
+        project(validator, fields)
+        for validator in validators_table(ctx)['validators']
+        if validator['trusted'] or not trusted_only
+    ]
+    if json_lines:
+        for validator in validators:
+            print(json.dumps(validator, sort_keys=True))
+    else:
+        print(json.dumps(validators, indent=4, sort_keys=True))
+
+
+@main.command()
+@click.argument('save_to', type=click.Path())
+@click.pass_context
+def snapshot(ctx, save_to):
+    """ Save snapshot of all validators to file """
+    table = fetch_validator_snapshot(ctx.obj['skale'], ctx.obj['endpoint'])
+    save_snapshot(save_to, table)
+    print(f'Saved {len(table["validators"])} validators '
+          f'at block {table["block_number"]} to {save_to}')
+
+
+def delegations_index(ctx):
+    return get_updated_index(ctx.obj['skale'], ctx.obj['endpoint'],
+                             DELEGATION_INDEX_PATH, DELEGATIONS_START_BLOCK)
 
 
 @main.command()
+@click.option('--status', type=click.Choice(DELEGATION_STATES), default=None,
+              help='Show only delegations with provided status')
+@click.option('--period', type=int, default=None,
+              help='Show only delegations with provided delegation period')
 @click.pass_context
-def delegations_by_validator(ctx):
+def delegations_by_validator(ctx, status, period):
     """ Show delegations by validator """
     skale = ctx.obj['skale']
     vid = skale.validator_service.validator_id_by_address(
         skale.wallet.address)
-    res = skale.delegation_controller.get_all_delegations_by_validator(vid)
-    print(res)
+    res = query(delegations_index(ctx), validator_id=vid,
+                status=status, period=period)
+    print(json.dumps(res, indent=4))
 
 
 @main.command()
@@ -96,6 +178,68 @@ def accept_request(ctx, delegation_id):
                                                           wait_for=True)
 
 
+def build_accept_tx(skale, delegation_id, gas_limit):
+    def build_tx(tx_fields):
+        return skale.delegation_controller.contract.functions.acceptPendingDelegation(
+            delegation_id
+        ).buildTransaction({'gas': gas_limit, **tx_fields})
+    return build_tx
+
+
+@main.command()
+@click.option('--ledger', default='./accept-ledger.jsonl',
+              help='File to save tx hashes and statuses, used to resume')
+@click.option('--max-in-flight', default=DEFAULT_MAX_IN_FLIGHT,
+              help='Max amount of unconfirmed transactions')
+@click.option('--gas-limit', default=ACCEPT_DELEGATION_GAS_LIMIT,
+              help='Gas limit for each accept transaction')
+@click.option('--gas-price', type=int, default=None,
+              help='Gas price in wei (current network gas price by default)')
+@click.option('--replace-after', default=TX_REPLACE_AFTER, type=float,
+              help='Resend transactions that are not mined in this many seconds '
+                   'with a higher gas price, 0 disables')
+@click.option('--max-gas-price', default=TX_MAX_GAS_PRICE, type=int,
+              help='Highest gas price in wei for resent transactions '
+                   '(twice the initial gas price by default)')
+@click.option('--yes', is_flag=True, default=False,
+              help='Do not ask for confirmation')
+@click.pass_context
+def accept_all_pending(ctx, ledger, max_in_flight, gas_limit, gas_price, replace_after,
+                       max_gas_price, yes):
+    """ Accept all pending delegations for wallet validator """
+    skale = ctx.obj['skale']
+    start = time.time()
+    vid = skale.validator_service.validator_id_by_address(
+        skale.wallet.address)
+    pending = query(delegations_index(ctx), validator_id=vid, status='PROPOSED')
+    print(f'Validator {vid}: {len(pending)} pending delegations')
+    if not pending:
+        return
+    if not yes:
+        click.confirm('Accept all pending delegations?', abort=True)
+
+    pipeline = TxPipeline(skale, ctx.obj['endpoint'], ledger_path=ledger,
+                          max_in_flight=max_in_flight, gas_price=gas_price,
+                          replace_after=replace_after or None,
+                          max_gas_price=max_gas_price)
+    pipeline.resume()
+    keys = []
+    for delegation in pending:
+        key = f'accept:{delegation["id"]}'
+        keys.append(key)
+        pipeline.send(key, build_accept_tx(skale, delegation['id'], gas_limit))
+    pipeline.wait_all()
+
+    for delegation, key in zip(pending, keys):
+        record = pipeline.records.get(key, {})
+        print(f'Delegation {delegation["id"]}: {record.get("status")} '
+              f'{record.get("tx_hash") or record.get("error", "")}')
+    summary = pipeline.summary(keys)
+    print(f'Processed {len(keys)} delegations in {time.time() - start:.1f}s: {summary}')
+    if set(summary) - {SUCCESS}:
+        sys.exit(1)
+
+
 @main.command()
 @click.argument('validator_id')
 @click.pass_context
@@ -122,10 +266,8 @@ def trusted(ctx, validator_id):
 @click.pass_context
 def linked_addresses(ctx, validator_id):
     """ Get addresses that linked to validator with provided id """
-    skale = ctx.obj['skale']
-    vid = int(validator_id)
-    res = skale.validator_service.get_linked_addresses_by_validator_id(vid)
-    print(res)
+    validator = get_validator(ctx, int(validator_id))
+    print(validator['linked_addresses'])
 
 
 @main.command()
@@ -133,9 +275,8 @@ def linked_addresses(ctx, validator_id):
 @click.pass_context
 def validator_info(ctx, validator_id):
     """ Get validator info from id """
-    skale = ctx.obj['skale']
-    res = skale.validator_service.get(int(validator_id))
-    print(json.dumps(res, indent=4))
+    validator = get_validator(ctx, int(validator_id))
+    print(json.dumps(validator, indent=4))
 
 
 @main.command()
@@ -164,6 +305,9 @@ def get_link_node_signature(ctx, validator_id):
 @click.pass_context
 def link_account_to_validator(ctx, private_key):
     """ Link address from account provided by private key to validator """
+    from skale.utils.web3_utils import private_key_to_address, to_checksum_address
+    from skale.wallets import Web3Wallet
+
     skale = ctx.obj['skale']
     address = private_key_to_address(private_key)
     checksum_address = to_checksum_address(address)
@@ -187,6 +331,8 @@ def link_account_to_validator(ctx, private_key):
 @click.pass_context
 def sign_validator_id(ctx, validator_id):
     """ Get validator_id signed by web3 wallet """
+    from web3 import Web3
+
     skale = ctx.obj['skale']
     validator_id = int(validator_id)
     unsigned_hash = Web3.soliditySha3(['uint256'], [validator_id])
@@ -208,6 +354,8 @@ def sign_validator_id(ctx, validator_id):
 @click.pass_context
 def link_address_to_validator(ctx, address, signature):
     """ Link given address with validator node signature to validator """
+    from skale.utils.web3_utils import to_checksum_address
+
     skale = ctx.obj['skale']
     checksum_address = to_checksum_address(address)
     # signature = signature.strip()
@@ -227,6 +375,8 @@ def link_address_to_validator(ctx, address, signature):
 @click.pass_context
 def is_main_address(ctx, address):
     """ Check if address is main for validator """
+    from skale.utils.web3_utils import to_checksum_address
+
     skale = ctx.obj['skale']
     checksum_address = to_checksum_address(address)
     print(checksum_address)
@@ -238,19 +388,24 @@ def is_main_address(ctx, address):
 @click.pass_context
 def trusted_ids(ctx):
     """ Get trusted validators ids list """
-    skale = ctx.obj['skale']
-    print(skale.validator_service.get_trusted_validator_ids())
+    if ctx.obj['snapshot_path']:
+        print(trusted_validator_ids(validators_table(ctx)))
+    else:
+        print(fetch_trusted_validator_ids(ctx.obj['skale'], ctx.obj['endpoint']))
 
 
 @main.command()
 @click.argument('validator-id', type=int)
+@click.option('--status', type=click.Choice(DELEGATION_STATES), default=None,
+              help='Show only delegations with provided status')
+@click.option('--period', type=int, default=None,
+              help='Show only delegations with provided delegation period')
 @click.pass_context
-def delegations_by_validator_id(ctx, validator_id):
-    skale = ctx.obj['skale']
-    print(
-        skale.delegation_controller._get_delegation_ids_by_validator(
-            validator_id)
-    )
+def delegations_by_validator_id(ctx, validator_id, status, period):
+    """ Show delegation ids for validator specified by id """
+    delegations = query(delegations_index(ctx), validator_id=validator_id,
+                        status=status, period=period)
+    print([delegation['id'] for delegation in delegations])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,157 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE.py
+#
+#   Copyright (C) 2019 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+""" In-memory table of all validators fetched with batched reads """
+
+import json
+import logging
+import os
+
+from batch_rpc import batch_contract_calls, get_block_number
+
+
+logger = logging.getLogger(__name__)
+
+VALIDATOR_FIELDS = [
+    'name', 'validator_address', 'requested_address', 'description', 'fee_rate',
+    'registration_time', 'minimum_delegation_amount', 'accept_new_requests'
+]
+SNAPSHOT_FIELDS = ['id'] + VALIDATOR_FIELDS + ['trusted', 'linked_addresses']
+# Snapshots older than this many blocks are fetched again
+DEFAULT_MAX_AGE = 300
+
+
+def get_number_of_validators(skale, endpoint, block_number):
+    number_of_validators, = batch_contract_calls(
+        endpoint, skale.web3,
+        [(skale.validator_service.contract, 'numberOfValidators', [])],
+        block_number=block_number
+    )
+    return number_of_validators
+
+
+def fetch_validators(skale, endpoint, validator_ids, block_number):
+    """ Fetches validator structs, trust flags and linked node addresses of validator_ids """
+    contract = skale.validator_service.contract
+    calls = []
+    for validator_id in validator_ids:
+        calls.extend([
+            (contract, 'validators', [validator_id]),
+            (contract, 'isAuthorizedValidator', [validator_id]),
+            (contract, 'getNodeAddresses', [validator_id])
+        ])
+    results = batch_contract_calls(endpoint, skale.web3, calls,
+                                   block_number=block_number)
+
+    validators = []
+    for i, validator_id in enumerate(validator_ids):
+        raw, trusted, linked_addresses = results[3 * i:3 * i + 3]
+        validator = {'id': validator_id}
+        validator.update(zip(VALIDATOR_FIELDS, raw))
+        validator['trusted'] = trusted
+        validator['linked_addresses'] = list(linked_addresses)
+        validators.append(validator)
+    return validators
+
+
+def fetch_validator(skale, endpoint, validator_id):
+    """ Fetches one validator without reading the others """
+    block_number = get_block_number(endpoint)
+    if not 1 <= validator_id <= get_number_of_validators(skale, endpoint, block_number):
+        raise ValueError(f'Validator {validator_id} is not found at block {block_number}')
+    validator, = fetch_validators(skale, endpoint, [validator_id], block_number)
+    return validator
+
+
+def fetch_trusted_validator_ids(skale, endpoint):
+    block_number = get_block_number(endpoint)
+    validator_ids = range(1, get_number_of_validators(skale, endpoint, block_number) + 1)
+    trusted = batch_contract_calls(
+        endpoint, skale.web3,
+        [(skale.validator_service.contract, 'isAuthorizedValidator', [validator_id])
+         for validator_id in validator_ids],
+        block_number=block_number
+    )
+    return [validator_id for validator_id, flag in zip(validator_ids, trusted) if flag]
+
+
+def fetch_validator_snapshot(skale, endpoint, block_number=None):
+    """
+    Fetches validator structs, trust flags and linked node addresses
+    for all validators at one block
+    """
+    if block_number is None:
+        block_number = get_block_number(endpoint)
+    validator_ids = range(1, get_number_of_validators(skale, endpoint, block_number) + 1)
+    validators = fetch_validators(skale, endpoint, validator_ids, block_number)
+    logger.info(f'Fetched {len(validators)} validators at block {block_number}')
+    return {'block_number': block_number, 'validators': validators}
+
+
+def save_snapshot(path, snapshot):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as outfile:
+        json.dump(snapshot, outfile)
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path):
+    with open(path) as infile:
+        return json.load(infile)
+
+
+def get_validator_snapshot(skale, endpoint, path=None, refresh=False, max_age=DEFAULT_MAX_AGE):
+    """
+    Returns validators snapshot from path if it exists and is at most max_age
+    blocks old (any age if max_age is 0), otherwise fetches it and saves to
+    path (if provided)
+    """
+    if path and os.path.isfile(path) and not refresh:
+        snapshot = load_snapshot(path)
+        age = get_block_number(endpoint) - snapshot['block_number'] if max_age else 0
+        if age <= max_age:
+            logger.info(f'Loaded validators snapshot for block '
+                        f'{snapshot["block_number"]} from {path}')
+            return snapshot
+        logger.info(f'Validators snapshot in {path} is {age} blocks old, fetching it again')
+    snapshot = fetch_validator_snapshot(skale, endpoint)
+    if path:
+        save_snapshot(path, snapshot)
+    return snapshot
+
+
+def find_validator(snapshot, validator_id):
+    for validator in snapshot['validators']:
+        if validator['id'] == validator_id:
+            return validator
+    raise ValueError(f'Validator {validator_id} is not found '
+                     f'at block {snapshot["block_number"]}')
+
+
+def trusted_validator_ids(snapshot):
+    return [
+        validator['id']
+        for validator in snapshot['validators']
+        if validator['trusted']
+    ]
+
+
+def project(validator, fields=None):
+    if not fields:
+        return validator
+    return {field: validator[field] for field in fields}
@@ -1,34 +1,47 @@
+import csv
+import json
 import logging
+import sys
+import time
+from decimal import Decimal, InvalidOperation
 
 import click
-from skale import Skale
-from skale.utils.account_tools import check_ether_balance, send_ether
-from skale.utils.helper import init_default_logger
-from skale.utils.web3_utils import private_key_to_address
-from web3 import Web3
 
-from config import ENDPOINT, ABI_FILEPATH
-from utils import create_account, init_wallet
+from batch_rpc import (DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, batch_balances,
+                       batch_contract_calls, get_block_number)
+from config import ENDPOINT, ABI_FILEPATH, TX_MAX_GAS_PRICE, TX_REPLACE_AFTER
+from py_profile import profile_option
+from rpc_profile import profile_rpc_option
+from rpc_trace import rpc_trace_options
+from tx_pipeline import DEFAULT_MAX_IN_FLIGHT, SUCCESS, RowKeys, TxPipeline
+from utils import LazyClients, create_account, init_default_logger
 
 init_default_logger()
 logger = logging.getLogger(__name__)
 
 ETH_IN_WEI = 10 ** 18
+BALANCES_FIELDS = ['address', 'eth', 'skl', 'underfunded']
+PAYOUT_ASSETS = ('ETH', 'SKL')
+ETH_TRANSFER_GAS_LIMIT = 22000
+SKL_TRANSFER_GAS_LIMIT = 200000
 
 
 @click.group()
+@profile_option
+@profile_rpc_option
+@rpc_trace_options
 @click.option('--endpoint', default=ENDPOINT, help='skale manager endpoint')
 @click.option('--abi-filepath', default=ABI_FILEPATH, help='abi file')
 @click.pass_context
 def main(ctx, endpoint, abi_filepath):
-    ctx.ensure_object(dict)
-    wallet = init_wallet(endpoint)
-    ctx.obj['skale'] = Skale(endpoint, abi_filepath, wallet)
+    ctx.obj = LazyClients(endpoint, abi_filepath)
 
 
 @main.command()
 @click.argument('private_key')
 def address_from_key(private_key):
+    from skale.utils.web3_utils import private_key_to_address
+
     print(private_key_to_address(private_key))
 
 
@@ -44,6 +57,8 @@ def send_funds(ctx):
 
 
 def skale_token_transfer(skale, address_to, tokens_amount):
+    from web3 import Web3
+
     address_from = Web3.toChecksumAddress(skale.wallet.address)
     address_to = Web3.toChecksumAddress(address_to)
     balance_from_before = skale.token.get_balance(address_from)
@@ -65,6 +80,9 @@ def skale_token_transfer(skale, address_to, tokens_amount):
 
 
 def eth_token_transfer(web3, wallet, address_to, eth_amount):
+    from skale.utils.account_tools import check_ether_balance, send_ether
+    from web3 import Web3
+
     address_from = Web3.toChecksumAddress(wallet.address)
     address_to = Web3.toChecksumAddress(address_to)
     balance_from_before = check_ether_balance(web3, address_from)
@@ -107,6 +125,9 @@ def eth_transfer(ctx, address_to, eth_amount):
 
 
 def show_wallet_info(skale, address=None):
+    from skale.utils.account_tools import check_ether_balance
+    from web3 import Web3
+
     address = address or skale.wallet.address
     chs_address = Web3.toChecksumAddress(address)
     skale_balance = skale.token.get_balance(chs_address)
@@ -125,5 +146,252 @@ def info(ctx, address):
     show_wallet_info(skale, address)
 
 
+def read_addresses(addresses_file):
+    from web3 import Web3
+
+    for line in addresses_file:
+        address = line.strip()
+        if not address or address.startswith('#'):
+            continue
+        if not Web3.isAddress(address):
+            logger.warning(f'Skipping invalid address: {address}')
+            continue
+        yield Web3.toChecksumAddress(address)
+
+
+def address_chunks(addresses, size):
+    chunk = []
+    for address in addresses:
+        chunk.append(address)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def fetch_balances(skale, endpoint, addresses, block_number,
+                   batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS):
+    eth_balances = batch_balances(endpoint, addresses, block_number,
+                                  batch_size=batch_size, workers=workers)
+    skl_balances = batch_contract_calls(
+        endpoint,
+        skale.web3,
+        [(skale.token.contract, 'balanceOf', [address]) for address in addresses],
+        block_number=block_number,
+        batch_size=batch_size,
+        workers=workers
+    )
+    return zip(addresses, eth_balances, skl_balances)
+
+
+def parse_ether_amount(ctx, param, value):
+    """ Click callback: amount in ether as Decimal, float would lose precision in wei """
+    if value is None:
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise click.BadParameter(f'{value} is not a number')
+
+
+def to_wei_or_none(amount):
+    from web3 import Web3
+
+    return None if amount is None else Web3.toWei(amount, 'ether')
+
+
+def balance_record(address, eth_wei, skl_wei, min_eth_wei=None,
+                   min_skl_wei=None):
+    from web3 import Web3
+
+    underfunded = (min_eth_wei is not None and eth_wei < min_eth_wei) or \
+        (min_skl_wei is not None and skl_wei < min_skl_wei)
+    return {
+        'address': address,
+        'eth': str(Web3.fromWei(eth_wei, 'ether')),
+        'skl': str(Web3.fromWei(skl_wei, 'ether')),
+        'underfunded': underfunded
+    }
+
+
+@main.command()
+@click.argument('addresses_file', type=click.File('r'), default='-')
+@click.option('--output-format', type=click.Choice(['csv', 'jsonl']),
+              default='csv', help='Output format')
+@click.option('--block', type=int, default=None,
+              help='Block number to read balances at (latest by default)')
+@click.option('--min-eth', default=None, callback=parse_ether_amount,
+              help='Flag accounts with less ETH as underfunded')
+@click.option('--min-skl', default=None, callback=parse_ether_amount,
+              help='Flag accounts with less SKL as underfunded')
+@click.option('--only-underfunded', is_flag=True, default=False,
+              help='Print only underfunded accounts')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE,
+              help='Amount of calls in one JSON-RPC batch')
+@click.option('--workers', default=DEFAULT_WORKERS,
+              help='Amount of batches sent concurrently')
+@click.pass_context
+def balances(ctx, addresses_file, output_format, block, min_eth, min_skl,
+             only_underfunded, batch_size, workers):
+    """ Command for displaying ETH and SKL balances of addresses from file """
+    skale = ctx.obj['skale']
+    endpoint = ctx.obj['endpoint']
+    block = block if block is not None else get_block_number(endpoint)
+    min_eth_wei, min_skl_wei = to_wei_or_none(min_eth), to_wei_or_none(min_skl)
+    logger.info(f'Reading balances at block {block}')
+
+    writer = None
+    if output_format == 'csv':
+        writer = csv.DictWriter(sys.stdout, fieldnames=BALANCES_FIELDS)
+        writer.writeheader()
+
+    total, underfunded = 0, 0
+    chunk_size = batch_size * workers
+    for chunk in address_chunks(read_addresses(addresses_file), chunk_size):
+        for address, eth_wei, skl_wei in fetch_balances(
+            skale, endpoint, chunk, block,
+            batch_size=batch_size, workers=workers
+        ):
+            record = balance_record(address, eth_wei, skl_wei,
+                                    min_eth_wei, min_skl_wei)
+            total += 1
+            underfunded += record['underfunded']
+            if only_underfunded and not record['underfunded']:
+                continue
+            if writer:
+                writer.writerow(record)
+            else:
+                print(json.dumps(record))
+        sys.stdout.flush()
+    logger.info(f'Checked {total} addresses at block {block}, '
+                f'underfunded: {underfunded}')
+
+
+def read_payout_rows(payout_file):
+    """ Parses and validates (address, asset, amount) rows """
+    from web3 import Web3
+
+    rows, errors = [], []
+    keys = RowKeys()
+    for line_number, row in enumerate(csv.reader(payout_file), 1):
+        if not row or row[0].strip().startswith('#'):
+            continue
+        if line_number == 1 and row[0].strip().lower() == 'address':
+            continue
+        if len(row) != 3:
+            errors.append(f'line {line_number}: expected 3 columns, got {len(row)}')
+            continue
+        address, asset, amount = (field.strip() for field in row)
+        asset = asset.upper()
+        if not Web3.isAddress(address):
+            errors.append(f'line {line_number}: invalid address {address}')
+            continue
+        if asset not in PAYOUT_ASSETS:
+            errors.append(f'line {line_number}: unknown asset {asset}')
+            continue
+        try:
+            amount_wei = Web3.toWei(Decimal(amount), 'ether')
+        except (InvalidOperation, ValueError):
+            errors.append(f'line {line_number}: invalid amount {amount}')
+            continue
+        if amount_wei <= 0:
+            errors.append(f'line {line_number}: amount should be positive')
+            continue
+        rows.append({
+            'key': keys.key(address.lower(), asset, amount_wei),
+            'address': Web3.toChecksumAddress(address),
+            'asset': asset,
+            'amount_wei': amount_wei
+        })
+    return rows, errors
+
+
+def payout_totals(rows):
+    totals = {asset: 0 for asset in PAYOUT_ASSETS}
+    for row in rows:
+        totals[row['asset']] += row['amount_wei']
+    return totals
+
+
+def build_payout_tx(skale, row):
+    def build_tx(tx_fields):
+        if row['asset'] == 'ETH':
+            return {
+                'to': row['address'],
+                'value': row['amount_wei'],
+                'gas': ETH_TRANSFER_GAS_LIMIT,
+                **tx_fields
+            }
+        return skale.token.contract.functions.send(
+            row['address'], row['amount_wei'], b''
+        ).buildTransaction({'gas': SKL_TRANSFER_GAS_LIMIT, **tx_fields})
+    return build_tx
+
+
+@main.command()
+@click.argument('payout_file', type=click.File('r'))
+@click.option('--ledger', default='./payout-ledger.jsonl',
+              help='File to save tx hashes and statuses, used to resume payout')
+@click.option('--max-in-flight', default=DEFAULT_MAX_IN_FLIGHT,
+              help='Max amount of unconfirmed transactions')
+@click.option('--gas-price', type=int, default=None,
+              help='Gas price in wei (current network gas price by default)')
+@click.option('--replace-after', default=TX_REPLACE_AFTER, type=float,
+              help='Resend transactions that are not mined in this many seconds '
+                   'with a higher gas price, 0 disables')
+@click.option('--max-gas-price', default=TX_MAX_GAS_PRICE, type=int,
+              help='Highest gas price in wei for resent transactions '
+                   '(twice the initial gas price by default)')
+@click.option('--yes', is_flag=True, default=False,
+              help='Do not ask for confirmation')
+@click.pass_context
+def payout(ctx, payout_file, ledger, max_in_flight, gas_price, replace_after, max_gas_price, yes):
+    """ Command for sending ETH/SKL to addresses from (address, asset, amount) CSV """
+    from web3 import Web3
+
+    skale = ctx.obj['skale']
+    endpoint = ctx.obj['endpoint']
+    rows, errors = read_payout_rows(payout_file)
+    if errors:
+        print('\n'.join(errors))
+        print(f'Payout file is invalid: {len(errors)} errors')
+        sys.exit(1)
+
+    pipeline = TxPipeline(skale, endpoint, ledger_path=ledger,
+                          max_in_flight=max_in_flight, gas_price=gas_price,
+                          replace_after=replace_after or None,
+                          max_gas_price=max_gas_price)
+    pipeline.resume()
+    pending = [row for row in rows if not pipeline.is_done(row['key'])]
+    totals = payout_totals(pending)
+    print(f'Transfers: {len(rows)}, left to send: {len(pending)}')
+    print(f'Total: {Web3.fromWei(totals["ETH"], "ether")} ETH, '
+          f'{Web3.fromWei(totals["SKL"], "ether")} SKL')
+
+    address = skale.wallet.address
+    eth_balance = skale.web3.eth.getBalance(address)
+    skl_balance = skale.token.get_balance(address)
+    gas_cost = len(pending) * SKL_TRANSFER_GAS_LIMIT * pipeline.gas_price
+    if totals['ETH'] + gas_cost > eth_balance or totals['SKL'] > skl_balance:
+        print(f'Insufficient funds on {address}: '
+              f'{Web3.fromWei(eth_balance, "ether")} ETH, '
+              f'{Web3.fromWei(skl_balance, "ether")} SKL')
+        sys.exit(1)
+    if pending and not yes:
+        click.confirm('Send transactions?', abort=True)
+
+    start = time.time()
+    for row in pending:
+        pipeline.send(row['key'], build_payout_tx(skale, row))
+    pipeline.wait_all()
+
+    summary = pipeline.summary([row['key'] for row in rows])
+    print(f'Payout finished in {time.time() - start:.1f}s: {summary}')
+    print(f'Ledger saved to {ledger}')
+    if set(summary) - {SUCCESS}:
+        sys.exit(1)
+
+
 if __name__ == "__main__":
     main()